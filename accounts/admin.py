@@ -1,6 +1,37 @@
 from django.contrib import admin
-from .models import CustomUser,Profile
+from django.utils import timezone
+from .models import CustomUser,Profile,OutboundEmail,TokenSession
 
 # Register your models here.
 admin.site.register(CustomUser)
-admin.site.register(Profile)
\ No newline at end of file
+admin.site.register(Profile)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected messages now')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_QUEUED, attempts=0, next_attempt_at=timezone.now(),
+            locked_by='', locked_until=None,
+        )
+        self.message_user(request, f'{updated} messages queued for retry.')
+
+
+@admin.register(TokenSession)
+class TokenSessionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'generation', 'created_at', 'refreshed_at', 'expires_at', 'revoked_at')
+    search_fields = ('user__email',)
+    list_select_related = ('user',)
+    actions = ['revoke']
+
+    @admin.action(description='Revoke selected sessions')
+    def revoke(self, request, queryset):
+        now = timezone.now()
+        updated = queryset.filter(revoked_at=None).update(revoked_at=now, expires_at=now)
+        self.message_user(request, f'{updated} sessions revoked.')
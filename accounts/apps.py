@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from ecommerce import images
+        from . import blacklist  # noqa: F401 (connects the revocation receiver)
+        images.register(self.get_model('Profile'), 'profile_image')
@@ -1,5 +1,73 @@
+import uuid
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# Claims copied into access tokens so requests can be authorized without
+# loading the user row.
+USER_CLAIMS = ('role', 'is_active', 'is_email_verified')
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+def has_user_claims(token):
+    return all(claim in token for claim in USER_CLAIMS)
+
+
+class TokenClaimsUser(SimpleLazyObject):
+    """
+    A user backed by access token claims.
+
+    ``pk``, ``role`` and the status flags are answered from the token. Any
+    other attribute loads the full ``CustomUser`` row on first access.
+    """
+    def __init__(self, token, loader):
+        super().__init__(loader)
+        self.__dict__['_claims'] = {
+            'pk': uuid.UUID(str(token[api_settings.USER_ID_CLAIM])),
+            **{claim: token[claim] for claim in USER_CLAIMS},
+        }
+
+    @property
+    def pk(self):
+        return self._claims['pk']
+
+    @property
+    def id(self):
+        return self._claims['pk']
+
+    @property
+    def role(self):
+        return self._claims['role']
+
+    @property
+    def is_active(self):
+        return self._claims['is_active']
+
+    @property
+    def is_email_verified(self):
+        return self._claims['is_email_verified']
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def __bool__(self):
+        # Permission classes test ``request.user and ...``; LazyObject would
+        # otherwise load the row just to answer that.
+        return True
+
 
 class CookieJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
@@ -9,7 +77,18 @@ class CookieJWTAuthentication(JWTAuthentication):
 
         try:
             validated_token = self.get_validated_token(token)
-            user = self.get_user(validated_token)
+            if getattr(settings, 'JWT_STATELESS_AUTH', False) and has_user_claims(validated_token):
+                user = self.get_token_user(validated_token)
+            else:
+                user = self.get_user(validated_token)
             return (user, validated_token)
         except AuthenticationFailed as e:
-            raise AuthenticationFailed(f"Authentication failed: {str(e)}")
\ No newline at end of file
+            raise AuthenticationFailed(f"Authentication failed: {str(e)}")
+
+    def get_token_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        if api_settings.CHECK_USER_IS_ACTIVE and not validated_token['is_active']:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return TokenClaimsUser(validated_token, lambda: self.get_user(validated_token))
+
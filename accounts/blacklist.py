@@ -0,0 +1,199 @@
+"""
+Refresh token blacklist checks without a query per refresh.
+
+simplejwt looks every refresh token up in ``BlacklistedToken``. Almost all of
+those lookups find nothing. ``TokenBlacklist`` answers them from memory:
+
+* a bloom filter of every unexpired blacklisted jti, rebuilt from the
+  database every ``REBUILD_SECONDS``, which drops expired entries. A jti it
+  does not contain is certainly not blacklisted;
+* an LRU of recent revocations, so the tokens most likely to be replayed
+  (just logged out) are rejected without a query;
+* a version counter in the shared cache, bumped on every revocation. When it
+  moves, the process loads the new ``BlacklistedToken`` rows (by primary
+  key, so an index range scan) into both.
+
+Only a bloom filter hit on a jti that is not in the LRU, which is an older
+revocation or a false positive (``FALSE_POSITIVE_RATE``), is confirmed with
+a query. That relies on the version counter reaching every worker. With a
+per-process cache backend (the locmem default) another worker's revocation
+would only arrive at the next rebuild, so ``CONFIRM_MISSES`` (on by default
+with such a backend) confirms every check the LRU cannot answer with a
+query, as simplejwt does. Use a shared backend such as Redis to skip them.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+DEFAULTS = {
+    'REBUILD_SECONDS': 300,
+    'FALSE_POSITIVE_RATE': 0.001,
+    'RECENT_MAX_ENTRIES': 10_000,
+    'CACHE_ALIAS': 'default',
+    'CONFIRM_MISSES': True,
+    'VERSION_KEY': 'token-blacklist:version',
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_BLACKLIST', {})}
+
+
+class BloomFilter:
+    """A fixed-size bloom filter over strings, using double hashing."""
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.capacity = capacity
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class TokenBlacklist:
+    def __init__(self, options):
+        self.options = {**DEFAULTS, **options}
+        self.cache = caches[self.options['CACHE_ALIAS']]
+        self._lock = threading.Lock()
+        self.recent = OrderedDict()
+        self.bloom = None
+        self.built_at = 0.0
+        self.last_id = 0
+        self.version = None
+        self.stats = {'checks': 0, 'queries': 0, 'rebuilds': 0}
+
+    def remember(self, jti):
+        self.recent[jti] = None
+        self.recent.move_to_end(jti)
+        while len(self.recent) > self.options['RECENT_MAX_ENTRIES']:
+            self.recent.popitem(last=False)
+
+    def shared_version(self):
+        key = self.options['VERSION_KEY']
+        version = self.cache.get(key)
+        if version is None:
+            # Never set, or evicted: start again. A process that saw the old
+            # value sees a change and loads new rows once.
+            self.cache.add(key, 0, timeout=None)
+            version = self.cache.get(key)
+        return version
+
+    def rebuild(self):
+        version = self.shared_version()
+        # Read before the rows: anything added in between is loaded again later, never missed.
+        last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        jtis = list(rows.values_list('token__jti', flat=True).iterator(chunk_size=5000))
+        # Room for as many revocations again before the next rebuild.
+        bloom = BloomFilter(max(2 * len(jtis), 1024), self.options['FALSE_POSITIVE_RATE'])
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom, self.last_id, self.version = bloom, last_id, version
+        self.built_at = time.monotonic()
+        self.stats['rebuilds'] += 1
+
+    def load_new(self, version):
+        rows = (
+            BlacklistedToken.objects.filter(id__gt=self.last_id).order_by('id')
+            .values_list('id', 'token__jti')
+        )
+        for pk, jti in rows:
+            self.bloom.add(jti)
+            self.remember(jti)
+            self.last_id = pk
+        self.version = version
+
+    def sync(self):
+        """Rebuild when due, or pick up revocations made since the last sync."""
+        if self.bloom is None or time.monotonic() - self.built_at > self.options['REBUILD_SECONDS'] \
+                or self.bloom.count > self.bloom.capacity:
+            self.rebuild()
+            return
+        version = self.shared_version()
+        if version != self.version:
+            self.load_new(version)
+
+    def is_blacklisted(self, jti):
+        with self._lock:
+            self.stats['checks'] += 1
+            self.sync()
+            if jti in self.recent:
+                return True
+            if jti not in self.bloom and not self.options['CONFIRM_MISSES']:
+                return False
+            self.stats['queries'] += 1
+        blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        if blacklisted:
+            with self._lock:
+                self.remember(jti)
+        return blacklisted
+
+    def revoked(self, jti):
+        """Record a revocation made in this process and tell the others."""
+        with self._lock:
+            self.remember(jti)
+            if self.bloom is not None:
+                self.bloom.add(jti)
+        key = self.options['VERSION_KEY']
+        self.cache.add(key, 0, timeout=None)
+        try:
+            version = self.cache.incr(key)
+        except ValueError:
+            version = None
+            self.cache.set(key, 1, timeout=None)
+        with self._lock:
+            if version is not None and version - 1 == self.version:
+                # Nothing else was revoked in between, so there is nothing to load.
+                self.version = version
+
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+
+def get_blacklist():
+    global _blacklist
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                _blacklist = TokenBlacklist(getattr(settings, 'TOKEN_BLACKLIST', {}))
+    return _blacklist
+
+
+@receiver(setting_changed)
+def reset_blacklist(setting, **kwargs):
+    global _blacklist
+    if setting in ('TOKEN_BLACKLIST', 'CACHES'):
+        _blacklist = None
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, created, using, **kwargs):
+    if created:
+        jti = instance.token.jti
+        transaction.on_commit(lambda: get_blacklist().revoked(jti), using=using)
@@ -0,0 +1,59 @@
+"""
+Password hashers whose cost comes from ``settings.PASSWORD_HASHING``.
+
+They keep Django's algorithm names and hash formats, so they verify hashes
+made by the stock hashers and the other way round. The preferred hasher
+(first in ``PASSWORD_HASHERS``) compares a stored hash's parameters with the
+configured ones. When they differ, or the hash uses another algorithm, a
+successful login re-hashes the password with the current settings and saves
+it (``AbstractBaseUser.check_password``). Changing the algorithm or a cost
+therefore upgrades each account the next time its owner signs in.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+DEFAULTS = {
+    'PBKDF2_ITERATIONS': hashers.PBKDF2PasswordHasher.iterations,
+    'SCRYPT_WORK_FACTOR': 2**14,
+    'SCRYPT_BLOCK_SIZE': 8,
+    'SCRYPT_PARALLELISM': 1,
+    'ARGON2_TIME_COST': 2,
+    # KiB
+    'ARGON2_MEMORY_COST': 19456,
+    'ARGON2_PARALLELISM': 1,
+}
+
+# PASSWORD_HASHER (the setting) -> hasher
+HASHERS = {
+    'argon2': 'accounts.hashers.Argon2PasswordHasher',
+    'scrypt': 'accounts.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'accounts.hashers.PBKDF2PasswordHasher',
+}
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+def setting(name):
+    return property(lambda self: get_options()[name])
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = setting('PBKDF2_ITERATIONS')
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = setting('SCRYPT_WORK_FACTOR')
+    block_size = setting('SCRYPT_BLOCK_SIZE')
+    parallelism = setting('SCRYPT_PARALLELISM')
+
+    # A cap, not an allocation. OpenSSL's default (32 MiB) rejects work
+    # factors above 2**14, including those of hashes made with older settings.
+    maxmem = 1024**3
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = setting('ARGON2_TIME_COST')
+    memory_cost = setting('ARGON2_MEMORY_COST')
+    parallelism = setting('ARGON2_PARALLELISM')
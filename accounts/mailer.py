@@ -0,0 +1,186 @@
+"""
+Durable outbox for transactional email.
+
+Views call ``enqueue_email``, which only inserts an ``OutboundEmail`` row, so
+a request never waits on the SMTP relay. ``send_queued_mail`` workers claim
+due rows in batches, send them over one connection per worker that stays
+open between batches, and record the outcome of every message. A failed
+message is retried with exponential backoff until ``MAX_ATTEMPTS`` is
+reached. A worker that dies mid-batch leaves its rows leased; they become
+claimable again once ``LEASE_SECONDS`` has passed.
+
+Everything goes through ``django.core.mail.get_connection``, so the locmem
+and console backends work unchanged.
+"""
+import logging
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BASE_SECONDS': 30,
+    'RETRY_MAX_SECONDS': 3600,
+    'LEASE_SECONDS': 300,
+}
+
+
+def get_queue_options():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_QUEUE', {})}
+
+
+def enqueue_email(subject, body, to, html_body='', from_email=None):
+    """Queue a message for the outbox workers and return its row."""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+
+def retry_delay(attempts, options):
+    """Seconds to wait before retrying a message that has failed ``attempts`` times."""
+    return min(options['RETRY_BASE_SECONDS'] * 2 ** (attempts - 1), options['RETRY_MAX_SECONDS'])
+
+
+def due(now):
+    return (
+        Q(status=OutboundEmail.STATUS_QUEUED, next_attempt_at__lte=now)
+        | Q(status=OutboundEmail.STATUS_SENDING, locked_until__lt=now)
+    )
+
+
+class OutboxWorker:
+    """Claims and sends batches of queued messages over a single connection."""
+
+    def __init__(self, batch_size=None, connection=None):
+        self.options = get_queue_options()
+        self.batch_size = batch_size or self.options['BATCH_SIZE']
+        self.worker_id = f'{socket.gethostname()}:{uuid.uuid4().hex[:12]}'
+        self.connection = connection
+
+    def claim(self):
+        now = timezone.now()
+        ids = list(
+            OutboundEmail.objects.filter(due(now))
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:self.batch_size]
+        )
+        if not ids:
+            return []
+        # Re-check the due condition in the UPDATE itself: rows another worker
+        # claimed since the SELECT no longer match and are left alone.
+        OutboundEmail.objects.filter(due(now), pk__in=ids).update(
+            status=OutboundEmail.STATUS_SENDING,
+            locked_by=self.worker_id,
+            locked_until=now + timedelta(seconds=self.options['LEASE_SECONDS']),
+        )
+        return list(OutboundEmail.objects.filter(
+            pk__in=ids, status=OutboundEmail.STATUS_SENDING, locked_by=self.worker_id,
+        ))
+
+    def open(self):
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+        # Opening explicitly keeps the connection up across send() calls and
+        # batches; the backend only closes connections it opened itself.
+        self.connection.open()
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                logger.warning('Error closing mail connection', exc_info=True)
+            self.connection = None
+
+    def build(self, message, connection):
+        email = EmailMultiAlternatives(
+            subject=message.subject,
+            body=message.body,
+            from_email=message.from_email,
+            to=message.to,
+            connection=connection,
+        )
+        if message.html_body:
+            email.attach_alternative(message.html_body, 'text/html')
+        return email
+
+    def send_batch(self):
+        """Send one claimed batch; returns ``(sent, failed)`` counts."""
+        messages = self.claim()
+        if not messages:
+            return 0, 0
+
+        sent, failed = [], []
+        for message in messages:
+            try:
+                self.build(message, self.open()).send()
+            except Exception as exc:
+                logger.warning('Sending outbound email %s failed: %s', message.pk, exc)
+                failed.append((message, exc))
+                # Start the next message on a fresh connection.
+                self.close()
+            else:
+                sent.append(message.pk)
+
+        if sent:
+            OutboundEmail.objects.filter(pk__in=sent, locked_by=self.worker_id).update(
+                status=OutboundEmail.STATUS_SENT,
+                attempts=F('attempts') + 1,
+                sent_at=timezone.now(),
+                last_error='',
+                locked_by='',
+                locked_until=None,
+            )
+        for message, exc in failed:
+            self.record_failure(message, exc)
+        return len(sent), len(failed)
+
+    def record_failure(self, message, exc):
+        attempts = message.attempts + 1
+        if attempts >= self.options['MAX_ATTEMPTS']:
+            status, next_attempt_at = OutboundEmail.STATUS_FAILED, message.next_attempt_at
+        else:
+            status = OutboundEmail.STATUS_QUEUED
+            next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(attempts, self.options))
+        OutboundEmail.objects.filter(pk=message.pk, locked_by=self.worker_id).update(
+            status=status,
+            attempts=attempts,
+            next_attempt_at=next_attempt_at,
+            last_error=f'{type(exc).__name__}: {exc}'[:2000],
+            locked_by='',
+            locked_until=None,
+        )
+
+    def drain(self):
+        """Send batches until nothing is due; returns ``(sent, failed)`` totals."""
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = self.send_batch()
+            if not sent and not failed:
+                return total_sent, total_failed
+            total_sent += sent
+            total_failed += failed
+
+
+def deliver_pending(batch_size=None, connection=None):
+    """Send everything currently due from this process."""
+    worker = OutboxWorker(batch_size=batch_size, connection=connection)
+    try:
+        return worker.drain()
+    finally:
+        worker.close()
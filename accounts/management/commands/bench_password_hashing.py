@@ -0,0 +1,90 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from accounts.hashers import HASHERS
+
+PASSWORD = 'bench-Pass-1234'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure password hashing cost per core: hash time, verifications/sec and '
+        'logins/sec through the login endpoint, for each hasher at its configured cost '
+        '(PASSWORD_HASHING).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', default=','.join(HASHERS), help='Comma-separated hashers to compare.')
+        parser.add_argument('--duration', type=float, default=3.0, help='Seconds per measurement.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['hashers'].split(',')]
+        unknown = set(names) - set(HASHERS)
+        if unknown:
+            raise CommandError(f"Unknown hashers: {', '.join(sorted(unknown))}")
+
+        results = []
+        for name in names:
+            others = [path for path in settings.PASSWORD_HASHERS if path != HASHERS[name]]
+            with override_settings(PASSWORD_HASHERS=[HASHERS[name], *others]):
+                try:
+                    encoded = make_password(PASSWORD)
+                except ValueError as exc:
+                    # e.g. argon2-cffi is not installed.
+                    self.stderr.write(f'Skipping {name}: {exc}')
+                    continue
+                summary = get_hasher().safe_summary(encoded)
+                results.append({
+                    'hasher': name,
+                    'params': {str(k): v for k, v in summary.items() if k not in ('algorithm', 'salt', 'hash')},
+                    'hash_ms': self.timed(lambda: make_password(PASSWORD), 1) * 1000,
+                    'verifications_per_second': 1 / self.timed(lambda: check_password(PASSWORD, encoded), options['duration']),
+                    'logins_per_second': self.logins_per_second(encoded, options['duration']),
+                })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, default=str))
+            return
+        self.stdout.write(f"{'hasher':<8} {'hash ms':>8} {'verify/s':>9} {'login/s':>8}  params")
+        for r in results:
+            params = ', '.join(f'{k}={v}' for k, v in r['params'].items())
+            self.stdout.write(
+                f"{r['hasher']:<8} {r['hash_ms']:>8.1f} {r['verifications_per_second']:>9.1f} "
+                f"{r['logins_per_second']:>8.1f}  {params}"
+            )
+
+    def timed(self, func, duration):
+        """Mean seconds per call over at least ``duration`` seconds (and three calls)."""
+        calls, began = 0, time.perf_counter()
+        while calls < 3 or time.perf_counter() - began < duration:
+            func()
+            calls += 1
+        return (time.perf_counter() - began) / calls
+
+    def logins_per_second(self, encoded, duration):
+        """Sign in through the login endpoint as a throwaway user, rolled back afterwards."""
+        client = Client()
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            'THROTTLING': {**getattr(settings, 'THROTTLING', {}), 'ENABLED': False},
+        }
+        with override_settings(**overrides), transaction.atomic():
+            get_user_model().objects.create(email='bench-hashing@example.com', password=encoded, is_active=True)
+            credentials = {'email': 'bench-hashing@example.com', 'password': PASSWORD}
+
+            def login():
+                response = client.post('/api/auth/login/', credentials, content_type='application/json')
+                if response.status_code != 200:
+                    raise CommandError(f'Login failed with {response.status_code}: {response.content[:200]!r}')
+
+            seconds = self.timed(login, duration)
+            transaction.set_rollback(True)
+        return 1 / seconds
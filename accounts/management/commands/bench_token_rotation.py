@@ -0,0 +1,99 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from accounts import tokens as session_tokens
+from accounts.models import TokenSession
+from ecommerce import metrics
+
+
+def rows():
+    return OutstandingToken.objects.count() + BlacklistedToken.objects.count() + TokenSession.objects.count()
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare refresh token rotation strategies: simplejwt blacklist-after-rotation (with and '
+        'without the in-memory blacklist filter) against session rotation. Reports refreshes/sec, '
+        'queries and rows written per refresh. Runs in a transaction that is rolled back.'
+    )
+    strategies = ('blacklist', 'blacklist+filter', 'session')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refreshes', type=int, default=1000, help='Refreshes per strategy.')
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='Interleaved rounds the refreshes are split into, to even out noise.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        if options['refreshes'] < options['rounds'] or options['rounds'] < 1:
+            raise CommandError('--refreshes must be at least --rounds, and --rounds at least 1.')
+        per_round = options['refreshes'] // options['rounds']
+        samples = {name: {'latencies': [], 'queries': [], 'rows': 0} for name in self.strategies}
+
+        with transaction.atomic():
+            user = get_user_model().objects.create(email='bench-rotation@example.com', is_active=True)
+            current = {
+                'blacklist': str(tokens.RefreshToken.for_user(user)),
+                'blacklist+filter': str(tokens.RefreshToken.for_user(user)),
+                'session': str(session_tokens.start_session(user)),
+            }
+            for _ in range(options['rounds']):
+                for name in self.strategies:
+                    before = rows()
+                    for _ in range(per_round):
+                        record = metrics.RequestMetrics()
+                        started = time.perf_counter()
+                        with metrics.instrument(record):
+                            current[name] = self.refresh(name, current[name])
+                        samples[name]['latencies'].append(time.perf_counter() - started)
+                        samples[name]['queries'].append(record.queries)
+                    samples[name]['rows'] += rows() - before
+            transaction.set_rollback(True)
+
+        results = []
+        for name in self.strategies:
+            latencies = samples[name]['latencies']
+            results.append({
+                'strategy': name,
+                'refreshes': len(latencies),
+                'refreshes_per_second': len(latencies) / sum(latencies),
+                'p50_ms': statistics.median(latencies) * 1000,
+                'queries_per_refresh': statistics.mean(samples[name]['queries']),
+                'rows_per_1000_refreshes': samples[name]['rows'] * 1000 / len(latencies),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'strategy':<17} {'refresh/s':>9} {'p50 ms':>7} {'queries':>7} {'rows/1k':>8}")
+        for r in results:
+            self.stdout.write(
+                f"{r['strategy']:<17} {r['refreshes_per_second']:>9.1f} {r['p50_ms']:>7.2f} "
+                f"{r['queries_per_refresh']:>7.1f} {r['rows_per_1000_refreshes']:>8.0f}"
+            )
+
+    def refresh(self, name, raw):
+        """One rotation as the refresh endpoint would do it; returns the new refresh token."""
+        token_class = tokens.RefreshToken if name == 'blacklist' else session_tokens.RefreshToken
+        refresh = token_class(raw)
+        # The user check TokenRefreshSerializer makes, in every strategy.
+        get_user_model().objects.get(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]})
+        if name == 'session':
+            refresh = session_tokens.rotate(refresh)
+        else:
+            # TokenRefreshSerializer with ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION.
+            refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+        str(refresh.access_token)
+        return str(refresh)
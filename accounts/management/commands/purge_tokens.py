@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from accounts.models import TokenSession
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired token sessions and expired outstanding and blacklisted refresh tokens '
+        'in batches, each in its own short transaction, so the purge never holds long locks '
+        'on a busy table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Outstanding tokens deleted per transaction.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the expired tokens without deleting them.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now)
+        expired_sessions = TokenSession.objects.filter(expires_at__lte=now)
+        if options['dry_run']:
+            self.stdout.write(
+                f'{expired_sessions.count()} expired or revoked sessions, {expired.count()} expired outstanding '
+                f'tokens, {BlacklistedToken.objects.filter(token__expires_at__lte=now).count()} of them blacklisted.'
+            )
+            return
+
+        batch_size = max(options['batch_size'], 1)
+        sessions = 0
+        while True:
+            # Deleted rows leave the expires_at index, so the first batch is always the next one.
+            ids = list(expired_sessions.order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            sessions += TokenSession.objects.filter(pk__in=ids).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        last_id, outstanding, blacklisted = 0, 0, 0
+        while True:
+            # Walk the primary key so each batch is an index range scan.
+            ids = list(
+                expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+            last_id = ids[-1]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {sessions} sessions, {outstanding} expired outstanding tokens and '
+            f'{blacklisted} blacklisted tokens.'
+        ))
@@ -0,0 +1,52 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from accounts.mailer import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound email with a pool of workers, each keeping one mail connection open.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker threads.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages claimed per batch.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once the queue is empty.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep between polls of an empty queue.')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        totals = {'sent': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def work():
+            worker = OutboxWorker(batch_size=options['batch_size'])
+            try:
+                while not stop.is_set():
+                    sent, failed = worker.drain()
+                    with lock:
+                        totals['sent'] += sent
+                        totals['failed'] += failed
+                    if not options['loop']:
+                        break
+                    # An idle worker should not hold an SMTP session open.
+                    worker.close()
+                    stop.wait(options['interval'])
+            finally:
+                worker.close()
+                connections.close_all()
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(max(options['workers'], 1))]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {totals['sent']} messages, {totals['failed']} failed attempts."))
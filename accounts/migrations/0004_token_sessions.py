@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:10
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_profile_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField()),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Token session',
+                'verbose_name_plural': 'Token sessions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['expires_at'], name='token_session_expiry_idx')],
+            },
+        ),
+    ]
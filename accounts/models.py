@@ -3,6 +3,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser,BaseUserManager
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 # Create your models here.
 def profile_image_upload_path(instance, filename):
@@ -68,6 +69,8 @@ class Profile(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False,unique=True)
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     profile_image = models.ImageField(upload_to=profile_image_upload_path, default='profile_images/default_avatar.png')
+    # Resized copies of profile_image, maintained by ecommerce.images.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(blank=True)
     phone_number = models.CharField(max_length=20, blank=True)
     address = models.CharField(max_length=255, blank=True)
@@ -83,4 +86,71 @@ class Profile(models.Model):
 @receiver(post_save, sender=CustomUser)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        # Callers may set profile_defaults on a new user to fill in its profile.
+        Profile.objects.create(user=instance, **getattr(instance, 'profile_defaults', {}))
+
+class OutboundEmail(models.Model):
+    """A message waiting in (or delivered from) the outbox, see ``accounts.mailer``."""
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Outbound email'
+        verbose_name_plural = 'Outbound emails'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class TokenSession(models.Model):
+    """
+    One login and the chain of refresh tokens rotated from it, see ``accounts.tokens``.
+
+    Only the token of the current ``generation`` can be refreshed, so a
+    rotation is one UPDATE of this row. Presenting an older one revokes the
+    whole session.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='token_sessions')
+    generation = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Token session'
+        verbose_name_plural = 'Token sessions'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['expires_at'], name='token_session_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"session {self.pk} of {self.user_id} (generation {self.generation})"
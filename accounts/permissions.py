@@ -33,4 +33,4 @@ class IsAdminOrSuperAdmin(permissions.BasePermission):
 class IsOwner(permissions.BasePermission):
     """Allow access only to the owner of the review."""
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
\ No newline at end of file
+        return obj.user_id == request.user.pk
\ No newline at end of file
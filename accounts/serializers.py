@@ -1,7 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import authenticate
+
+from ecommerce.images import ImageVariantsField
 from .models import Profile
 
 User = get_user_model()
@@ -18,19 +22,27 @@ class RegisterSerializer(serializers.ModelSerializer):
     def validate(self,attrs):
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError({"password":"Password fields didn't match."})
+        # Hash here, before create() opens its transaction: it is the slow part
+        # of registration and needs no database lock.
+        attrs['password'] = make_password(attrs['password'])
         return attrs
     
     def create(self,validated_data):
         validated_data.pop('password2')
-        user = User.objects.create(
+        user = User(
             email=validated_data['email'],
             first_name=validated_data.get('first_name', ''),
             last_name=validated_data.get('last_name', ''),
             role='customer',  # default role for registration
             is_active=False,  # optional: require email verification
-        )  
-        user.set_password(validated_data['password'])
-        user.save()
+            password=validated_data['password'],
+        )
+        if validated_data.get('profile_image') is not None:
+            # Inserted with the profile by accounts.models.create_user_profile.
+            user.profile_defaults = {'profile_image': validated_data['profile_image']}
+        # One user insert and one profile insert.
+        with transaction.atomic(savepoint=False):
+            user.save()
         return user
 
 class LoginUserSerializer(serializers.Serializer):
@@ -45,9 +57,10 @@ class LoginUserSerializer(serializers.Serializer):
 
 class ProfileSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='user.email', read_only=True)
+    image_variants = ImageVariantsField()
     class Meta:
         model = Profile
-        fields = ["bio", "phone_number", "address", "profile_image","email"]
+        fields = ["bio", "phone_number", "address", "profile_image", "image_variants", "email"]
 
 class ProfileUpdateSerializer(serializers.ModelSerializer):
     profile = ProfileSerializer(required=False)
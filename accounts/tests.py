@@ -1,3 +1,292 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from ecommerce.testing import QueryCountAssertionsMixin
+from .blacklist import get_options as blacklist_options
+from .mailer import deliver_pending, enqueue_email
+from .hashers import HASHERS
+from .models import CustomUser, OutboundEmail, Profile, TokenSession
+from .tokens import RefreshToken
+
+
+class RefusingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('relay unavailable')
+
+
+@override_settings(JWT_STATELESS_AUTH=True, CATALOG_CACHE={'ENABLED': False})
+class StatelessJWTAuthTests(QueryCountAssertionsMixin, APITestCase):
+    """Access tokens carry the claims the permission classes need."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email='shopper@example.com', password='s3cret-pass', is_active=True, is_email_verified=True,
+        )
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'shopper@example.com', 'password': 's3cret-pass'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_authenticated_read_skips_user_query(self):
+        anonymous = self.client_class()
+        self.assertEqual(
+            len(self.count_queries('/api/products/products/')),
+            len(self.count_queries('/api/products/products/', client=anonymous)),
+        )
+
+    def test_refresh_rejects_deactivated_user(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post('/api/auth/refresh/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalid_refresh_token(self):
+        self.client.cookies['refresh_token'] = 'not-a-token'
+        response = self.client.post('/api/auth/refresh/')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboundEmailQueueTests(TestCase):
+    """Requests only queue mail; workers deliver and retry it."""
+
+    def test_registration_queues_verification_email(self):
+        response = self.client.post('/api/auth/register/', {
+            'email': 'new@example.com', 'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        message = OutboundEmail.objects.get()
+        self.assertEqual(message.to, ['new@example.com'])
+        self.assertIn('/verify-email/', message.html_body)
+
+        self.assertEqual(deliver_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundEmail.STATUS_SENT)
+        self.assertEqual(message.attempts, 1)
+
+    def test_password_reset_queues_email(self):
+        CustomUser.objects.create_user(email='reset@example.com', password='Str0ng-pass!', is_active=True)
+        response = self.client.post('/api/auth/password_reset/', {'email': 'reset@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(OutboundEmail.objects.get().to, ['reset@example.com'])
+        self.assertEqual(mail.outbox, [])
+
+    @override_settings(
+        EMAIL_BACKEND='accounts.tests.RefusingEmailBackend',
+        EMAIL_QUEUE={'MAX_ATTEMPTS': 2, 'RETRY_BASE_SECONDS': 60},
+    )
+    def test_failed_send_is_retried_with_backoff(self):
+        message = enqueue_email('Hello', 'Body', ['someone@example.com'])
+        with self.assertLogs('accounts.mailer', 'WARNING'):
+            self.assertEqual(deliver_pending(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundEmail.STATUS_QUEUED)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertIn('relay unavailable', message.last_error)
+
+        # Not due yet, so nothing is attempted.
+        self.assertEqual(deliver_pending(), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('accounts.mailer', 'WARNING'):
+            self.assertEqual(deliver_pending(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundEmail.STATUS_FAILED)
+        self.assertEqual(message.attempts, 2)
+
+
+@override_settings(PASSWORD_HASHERS=[HASHERS['scrypt'], HASHERS['pbkdf2']])
+class PasswordHashingTests(TestCase):
+    """Registration writes each row once; logins upgrade outdated hashes."""
+
+    def login(self, email):
+        return self.client.post('/api/auth/login/', {'email': email, 'password': 'Str0ng-pass!'}, content_type='application/json')
+
+    def test_registration_inserts_user_and_profile_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/auth/register/', {
+                'email': 'new@example.com', 'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!',
+            })
+        self.assertEqual(response.status_code, 201)
+        writes = [q['sql'].split()[0] + ' ' + q['sql'].split('"')[1] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(writes, ['INSERT accounts_customuser', 'INSERT accounts_profile', 'INSERT accounts_outboundemail'])
+        user = CustomUser.objects.get()
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+    def test_login_rehashes_outdated_passwords(self):
+        user = CustomUser.objects.create(
+            email='old@example.com', is_active=True, password=make_password('Str0ng-pass!', hasher='pbkdf2_sha256'),
+        )
+        self.assertEqual(self.login('old@example.com').status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(get_hasher().safe_summary(user.password)['work factor'], 2**14)
+
+        with override_settings(PASSWORD_HASHING={'SCRYPT_WORK_FACTOR': 2**12}):
+            self.assertEqual(self.login('old@example.com').status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(get_hasher().safe_summary(user.password)['work factor'], 2**12)
+        self.assertTrue(user.check_password('Str0ng-pass!'))
+
+
+# As with a shared cache backend, where filter misses need no query.
+@override_settings(TOKEN_BLACKLIST={'REBUILD_SECONDS': 300, 'CONFIRM_MISSES': False})
+class TokenBlacklistTests(TestCase):
+    """Tokens from before sessions are checked against the blacklist in memory."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='shopper@example.com', password='s3cret-pass', is_active=True)
+        self.legacy = str(tokens.RefreshToken.for_user(self.user))
+
+    def is_rejected(self, raw):
+        try:
+            RefreshToken(raw)
+        except TokenError:
+            return True
+        return False
+
+    def test_check_does_not_query_database(self):
+        self.assertFalse(self.is_rejected(self.legacy))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(self.is_rejected(self.legacy))
+        self.assertFalse(queries.captured_queries)
+
+    def test_logout_revokes_refresh_token(self):
+        self.assertFalse(self.is_rejected(self.legacy))
+        self.client.cookies['refresh_token'] = self.legacy
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/logout/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.is_rejected(self.legacy))
+        self.assertFalse(queries.captured_queries)
+
+        # A new process learns about it from the database.
+        with override_settings(TOKEN_BLACKLIST={'REBUILD_SECONDS': 60}):
+            self.assertTrue(self.is_rejected(self.legacy))
+
+    def test_revocation_by_another_process(self):
+        self.assertFalse(self.is_rejected(self.legacy))
+        # Written elsewhere: no signal here, only the shared version bump.
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get())])
+        self.assertFalse(self.is_rejected(self.legacy))
+        cache.incr(blacklist_options()['VERSION_KEY'])
+        self.assertTrue(self.is_rejected(self.legacy))
+
+    @override_settings(TOKEN_BLACKLIST={'REBUILD_SECONDS': 300, 'CONFIRM_MISSES': True})
+    def test_per_process_cache_confirms_misses(self):
+        self.assertFalse(self.is_rejected(self.legacy))
+        # Another worker's revocation, whose version bump this process never sees.
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=OutstandingToken.objects.get())])
+        self.assertTrue(self.is_rejected(self.legacy))
+
+    def test_purge_deletes_expired_tokens_only(self):
+        now = timezone.now()
+        for i in range(5):
+            token = OutstandingToken.objects.create(
+                jti=f'expired-{i}', token='x', created_at=now - timedelta(days=8), expires_at=now - timedelta(days=1),
+            )
+            if i % 2:
+                BlacklistedToken.objects.create(token=token)
+        live = OutstandingToken.objects.exclude(jti__startswith='expired-').get()
+        BlacklistedToken.objects.create(token=live)
+        TokenSession.objects.create(user=self.user, expires_at=now - timedelta(seconds=1))
+        session = TokenSession.objects.create(user=self.user, expires_at=now + timedelta(days=1))
+
+        out = StringIO()
+        call_command('purge_tokens', batch_size=2, stdout=out)
+        self.assertIn('Deleted 1 sessions, 5 expired outstanding tokens and 2 blacklisted tokens', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live.jti])
+        self.assertEqual(BlacklistedToken.objects.get().token_id, live.pk)
+        self.assertEqual(TokenSession.objects.get(), session)
+
+
+@override_settings(TOKEN_SESSIONS={'REUSE_GRACE_SECONDS': 0})
+class TokenSessionTests(TestCase):
+    """Refresh tokens rotate within one session row; reusing one ends the session."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='shopper@example.com', password='s3cret-pass', is_active=True)
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'shopper@example.com', 'password': 's3cret-pass'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def refresh(self, raw=None):
+        if raw is not None:
+            self.client.cookies['refresh_token'] = raw
+        return self.client.post('/api/auth/refresh/')
+
+    def test_login_starts_session_without_outstanding_token(self):
+        self.assertEqual(TokenSession.objects.get().user, self.user)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+    def test_refresh_rotates_with_one_update(self):
+        first = self.client.cookies['refresh_token'].value
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh().status_code, 200)
+        # The rest is the user lookup for the access token cookie.
+        token_queries = [q['sql'] for q in queries if 'token' in q['sql'].split(' WHERE ')[0]]
+        self.assertEqual(len(token_queries), 1, token_queries)
+        self.assertTrue(token_queries[0].startswith('UPDATE "accounts_tokensession"'))
+        self.assertNotEqual(self.client.cookies['refresh_token'].value, first)
+        self.assertEqual(self.refresh().status_code, 200)
+        self.assertEqual(TokenSession.objects.get().generation, 2)
+        self.assertFalse(OutstandingToken.objects.exists())
+
+    def test_reuse_revokes_session(self):
+        stolen = self.client.cookies['refresh_token'].value
+        self.assertEqual(self.refresh().status_code, 200)
+        current = self.client.cookies['refresh_token'].value
+        self.assertEqual(self.refresh(stolen).status_code, 401)
+        self.assertEqual(self.refresh(current).status_code, 401)
+        self.assertIsNotNone(TokenSession.objects.get().revoked_at)
+
+    def test_concurrent_refresh_within_grace(self):
+        previous = self.client.cookies['refresh_token'].value
+        self.assertEqual(self.refresh().status_code, 200)
+        with override_settings(TOKEN_SESSIONS={'REUSE_GRACE_SECONDS': 60}):
+            self.assertEqual(self.refresh(previous).status_code, 200)
+        self.assertEqual(self.refresh().status_code, 200)
+        session = TokenSession.objects.get()
+        self.assertIsNone(session.revoked_at)
+        self.assertEqual(session.generation, 2)
+
+    def test_logout_ends_session(self):
+        raw = self.client.cookies['refresh_token'].value
+        self.client.post('/api/auth/logout/')
+        self.assertEqual(self.refresh(raw).status_code, 401)
+
+    def test_legacy_token_moves_into_session(self):
+        TokenSession.objects.all().delete()
+        legacy = str(tokens.RefreshToken.for_user(self.user))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.refresh(legacy).status_code, 200)
+        self.assertEqual(TokenSession.objects.get().user, self.user)
+        self.assertEqual(self.refresh().status_code, 200)
+        self.assertEqual(self.refresh(legacy).status_code, 401)
+
+    def test_bench_token_rotation(self):
+        out = StringIO()
+        call_command('bench_token_rotation', refreshes=4, rounds=2, json=True, stdout=out)
+        results = {r['strategy']: r for r in json.loads(out.getvalue())}
+        self.assertEqual(results['session']['rows_per_1000_refreshes'], 0)
+        self.assertEqual(results['blacklist']['rows_per_1000_refreshes'], 2000)
+        self.assertEqual(TokenSession.objects.count(), 1)
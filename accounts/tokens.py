@@ -0,0 +1,119 @@
+"""
+Rotating refresh tokens backed by one ``TokenSession`` row per login.
+
+A login inserts a session and issues a refresh token carrying its id
+(``sid``) and generation (``gen``). Every refresh replaces the token: one
+UPDATE moves the session to the next generation, but only if the presented
+token is the current one and the session is live. Nothing is written per
+token, so the table grows with logins, not refreshes.
+
+Presenting a token that was already rotated means it was copied. The
+session is revoked, so both the thief's and the owner's tokens stop
+working. The one exception is the previous token within
+``REUSE_GRACE_SECONDS`` of its rotation. That is two tabs refreshing at
+once, and the loser gets a token for the current generation.
+
+Tokens issued before sessions existed have no ``sid``. They are checked
+against the blacklist (``accounts.blacklist``) and moved into a new
+session the first time they are refreshed.
+"""
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .blacklist import get_blacklist
+from .models import TokenSession
+
+DEFAULTS = {
+    'REUSE_GRACE_SECONDS': 10,
+}
+SESSION_CLAIM = 'sid'
+GENERATION_CLAIM = 'gen'
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_SESSIONS', {})}
+
+
+class RefreshToken(tokens.RefreshToken):
+    """simplejwt's refresh token, with sessions instead of outstanding and blacklisted rows."""
+    no_copy_claims = (*tokens.RefreshToken.no_copy_claims, SESSION_CLAIM, GENERATION_CLAIM)
+
+    def check_blacklist(self):
+        if SESSION_CLAIM in self.payload:
+            # Checked by rotate() and revoke() against the session row.
+            return
+        if get_blacklist().is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+
+def _issue(claims, user_id):
+    session = TokenSession(user_id=user_id)
+    token = RefreshToken()
+    for claim, value in claims.items():
+        token[claim] = value
+    token[SESSION_CLAIM] = str(session.pk)
+    token[GENERATION_CLAIM] = session.generation
+    session.expires_at = datetime_from_epoch(token['exp'])
+    session.save(force_insert=True)
+    return token
+
+
+def start_session(user):
+    """A refresh token for a new login."""
+    user_id = getattr(user, api_settings.USER_ID_FIELD)
+    return _issue({api_settings.USER_ID_CLAIM: str(user_id)}, user_id)
+
+
+def _successor(refresh, generation):
+    token = RefreshToken()
+    for claim, value in refresh.payload.items():
+        if claim not in tokens.RefreshToken.no_copy_claims:
+            token[claim] = value
+    token[GENERATION_CLAIM] = generation
+    return token
+
+
+def rotate(refresh):
+    """
+    The refresh token that replaces ``refresh``, a verified ``RefreshToken``.
+
+    Raises ``TokenError`` if the session has ended or the token was reused.
+    """
+    if SESSION_CLAIM not in refresh.payload:
+        claims = {k: v for k, v in refresh.payload.items() if k not in tokens.RefreshToken.no_copy_claims}
+        token = _issue(claims, refresh[api_settings.USER_ID_CLAIM])
+        refresh.blacklist()
+        return token
+
+    generation = refresh[GENERATION_CLAIM]
+    token = _successor(refresh, generation + 1)
+    now = token.current_time
+    rotated = TokenSession.objects.filter(
+        pk=refresh[SESSION_CLAIM], generation=generation, revoked_at=None, expires_at__gt=now,
+    ).update(generation=generation + 1, refreshed_at=now, expires_at=datetime_from_epoch(token['exp']))
+    if rotated:
+        return token
+
+    session = TokenSession.objects.filter(pk=refresh[SESSION_CLAIM]).first()
+    if session is None or session.revoked_at is not None or session.expires_at <= now:
+        raise TokenError(_('Session has ended'))
+    if session.generation == generation + 1 and session.refreshed_at is not None \
+            and (now - session.refreshed_at).total_seconds() <= get_options()['REUSE_GRACE_SECONDS']:
+        return _successor(refresh, session.generation)
+    revoke(refresh)
+    raise TokenError(_('Refresh token was already used'))
+
+
+def revoke(refresh):
+    """End the session ``refresh`` belongs to (logout or reuse)."""
+    if SESSION_CLAIM not in refresh.payload:
+        refresh.blacklist()
+        return
+    now = timezone.now()
+    # Expiring it too lets purge_tokens delete it with the expired ones.
+    TokenSession.objects.filter(pk=refresh[SESSION_CLAIM], revoked_at=None).update(revoked_at=now, expires_at=now)
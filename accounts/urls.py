@@ -1,6 +1,9 @@
 from django.urls import path,include
 from .views import (
     RegistrationView, 
+    PasswordResetConfirmView,
+    PasswordResetRequestView,
+    PasswordResetValidateTokenView,
     VerifyEmailView,
     LogoutView,
     LoginView,
@@ -11,7 +14,11 @@ from .views import (
 urlpatterns = [
     path("register/", RegistrationView.as_view(), name="register"),
     path('verify-email/<str:uidb64>/<str:token>/', VerifyEmailView.as_view(), name='verify-email'),
-    path('password_reset/', include('django_rest_passwordreset.urls', namespace='password_reset')),
+    path('password_reset/', include(([
+        path('validate_token/', PasswordResetValidateTokenView.as_view(), name='reset-password-validate'),
+        path('confirm/', PasswordResetConfirmView.as_view(), name='reset-password-confirm'),
+        path('', PasswordResetRequestView.as_view(), name='reset-password-request'),
+    ], 'password_reset'))),
     path("login/", LoginView.as_view(), name="user-login"),
     path("logout/", LogoutView.as_view(), name="user-logout"),
     path("refresh/", CookieTokenRefreshView.as_view(), name="token-refresh"),
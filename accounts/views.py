@@ -6,34 +6,40 @@ from .serializers import (
     LoginUserSerializer, 
     ProfileUpdateSerializer, 
     ProfileSerializer)
-from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
+from django.db import transaction
 from django.conf import settings  # This now gets values from .env via settings
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.mail import EmailMultiAlternatives
 from django.utils.html import strip_tags
 from django_rest_passwordreset.signals import reset_password_token_created
+from django_rest_passwordreset.views import ResetPasswordConfirm, ResetPasswordRequestToken, ResetPasswordValidateToken
 from django.dispatch import receiver
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import RefreshToken, revoke, rotate, start_session
 from rest_framework.response import Response
-from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import USER_CLAIMS, add_user_claims
+from .mailer import enqueue_email
 
 # Create your views here.
 User = get_user_model()
 
 class RegistrationView(generics.CreateAPIView):
     serializer_class = RegisterSerializer
+    throttle_scope = 'register'
 
     def perform_create(self, serializer):
-        user = serializer.save()
-        self.send_verification_email(user)  # This calls the instance method
+        # The user, their profile and the queued email commit together.
+        with transaction.atomic():
+            user = serializer.save()
+            self.send_verification_email(user)  # Queued, see accounts.mailer
 
     def send_verification_email(self, user): 
         # Generate verification token
@@ -52,6 +58,7 @@ class RegistrationView(generics.CreateAPIView):
         context = {
             'user': user,
             'verification_url': verification_url,
+            'verification_link': verification_url,  # name used by the template
             'site_name': getattr(settings, 'SITE_NAME', 'Our Site'),  # Safe access
         }
         
@@ -59,21 +66,12 @@ class RegistrationView(generics.CreateAPIView):
         html_message = render_to_string('accounts/email_verification.html', context)
         subject = 'Verify your email address'
         
-        # Create and send email
-        email = EmailMessage(
+        enqueue_email(
             subject=subject,
-            body=html_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
+            body=strip_tags(html_message),
+            html_body=html_message,
             to=[user.email],
         )
-        email.content_subtype = 'html'
-        
-        try:
-            email.send()
-            return True
-        except Exception as e:
-            print(f"Error sending verification email: {e}")
-            return False
 
 class VerifyEmailView(APIView):
     permission_classes = []  # Allow unauthenticated access
@@ -118,7 +116,7 @@ class VerifyEmailView(APIView):
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, reset_password_token, *args, **kwargs):
     """
-    Handle password reset token creation and send email
+    Handle password reset token creation and queue the reset email
     """
     # Build the reset URL (frontend URL)
     reset_url = f"http://localhost:5173/password-reset/{reset_password_token.key}/"
@@ -137,28 +135,36 @@ def password_reset_token_created(sender, reset_password_token, *args, **kwargs):
     # Create plain text version (optional but recommended)
     plain_message = strip_tags(html_message)
     
-    # Create and send email
-    email = EmailMultiAlternatives(
+    enqueue_email(
         subject=f"Password Reset Request for {reset_password_token.user.email}",
         body=plain_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,  # Use from .env
+        html_body=html_message,
         to=[reset_password_token.user.email],
     )
-    email.attach_alternative(html_message, "text/html")
 
-    try:
-        email.send()
-        print(f"Password reset email sent to {reset_password_token.user.email}")
-    except Exception as e:
-        print(f"Error sending password reset email: {e}")
+# django_rest_passwordreset turns throttling off on its views; put the
+# project's throttles back. Every step guesses at a token or hashes a new password.
+class PasswordResetRequestView(ResetPasswordRequestToken):
+    throttle_classes = APIView.throttle_classes
+    throttle_scope = 'password_reset'
+
+class PasswordResetValidateTokenView(ResetPasswordValidateToken):
+    throttle_classes = APIView.throttle_classes
+    throttle_scope = 'password_reset'
+
+class PasswordResetConfirmView(ResetPasswordConfirm):
+    throttle_classes = APIView.throttle_classes
+    throttle_scope = 'password_reset'
 
 class LoginView(APIView):
+    throttle_scope = 'login'
+
     def post(self, request):
         serializer = LoginUserSerializer(data=request.data)
 
         if serializer.is_valid():
             user = serializer.validated_data
-            refresh_token_obj = RefreshToken.for_user(user)
+            refresh_token_obj = add_user_claims(start_session(user), user)
 
             access_token = str(refresh_token_obj.access_token)
             refresh_token = str(refresh_token_obj)
@@ -194,6 +200,8 @@ class LoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class CookieTokenRefreshView(APIView):
+    throttle_scope = 'refresh'
+
     def post(self, request):
         refresh_token = request.COOKIES.get("refresh_token")
 
@@ -203,7 +211,20 @@ class CookieTokenRefreshView(APIView):
 
         try:
             refresh = RefreshToken(refresh_token)
-            new_access_token = str(refresh.access_token)
+            user = None
+            if getattr(settings, 'JWT_STATELESS_AUTH', False):
+                # Access tokens are trusted without a lookup, so re-read the
+                # claims instead of copying whatever the refresh token had.
+                user = User.objects.only('id', *USER_CLAIMS).filter(
+                    pk=refresh[api_settings.USER_ID_CLAIM], is_active=True
+                ).first()
+                if user is None:
+                    raise InvalidToken("User is inactive or no longer exists")
+            refresh = rotate(refresh)
+            access = refresh.access_token
+            if user is not None:
+                add_user_claims(access, user)
+            new_access_token = str(access)
 
             response = Response(
                 {"message": "Access token refreshed successfully"},
@@ -216,8 +237,15 @@ class CookieTokenRefreshView(APIView):
                 secure=True,
                 samesite="None",
             )
+            response.set_cookie(
+                key="refresh_token",
+                value=str(refresh),
+                httponly=True,
+                secure=True,
+                samesite="None",
+            )
             return response
-        except InvalidToken:
+        except (InvalidToken, TokenError):
             return Response({"error": "Invalid token"},
                             status=status.HTTP_401_UNAUTHORIZED)
 
@@ -227,8 +255,7 @@ class LogoutView(APIView):
 
         if refresh_token:
             try:
-                refresh = RefreshToken(refresh_token)
-                refresh.blacklist()
+                revoke(RefreshToken(refresh_token))
             except Exception:
                 pass  # ignore errors if token already invalid
 
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class EcommerceConfig(AppConfig):
+    """Project-wide hooks that do not belong to a single app."""
+    name = 'ecommerce'
+
+    def ready(self):
+        from . import db  # noqa: F401 (connects the connection_created receiver)
@@ -0,0 +1,23 @@
+import re
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+
+
+def apply_pragmas(connection, pragmas):
+    """Run ``PRAGMA name = value`` for each entry on a raw DB-API connection."""
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME.match(name):
+            raise ValueError(f'Invalid SQLite pragma name: {name!r}')
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if pragmas:
+        apply_pragmas(connection.connection, pragmas)
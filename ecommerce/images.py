@@ -0,0 +1,241 @@
+"""
+Responsive renditions of uploaded images.
+
+When a registered image field changes, the new original is picked up once
+the transaction commits. Encoding runs in a pool of worker processes, so the
+request that uploaded the image never waits for it. Every width in
+``IMAGE_RENDITIONS['WIDTHS']`` that is not wider than the original is
+encoded in every format in ``FORMATS``. Each rendition is stored as
+``renditions/<content hash>-<width>.<ext>``, so its URL never changes
+meaning and can be cached forever, and an image uploaded twice is encoded
+and stored once.
+
+The instance's ``image_variants`` column records the rendition names per
+format and width, plus the ``source`` they were made from. A result for an
+original that has been replaced in the meantime is discarded.
+``manage.py generate_renditions`` backfills rows whose variants are missing
+or stale (for instance when a restart dropped queued jobs).
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_save
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WIDTHS': (160, 320, 640, 1280),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    # Encoding processes; 0 encodes inline in the saving thread (tests, scripts).
+    'WORKERS': 2,
+    'PREFIX': 'renditions',
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+# EXIF orientations that rotate the image by 90 degrees.
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# model -> name of its image field
+FIELDS = {}
+
+_pools = None
+_pools_lock = threading.Lock()
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_RENDITIONS', {})}
+
+
+def plan_widths(data, widths):
+    """The rendition widths for an original: never wider than the image itself."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+            width = height
+    planned = sorted({w for w in widths if w <= width})
+    return planned or [width]
+
+
+def encode_renditions(data, widths, formats, quality):
+    """
+    Return ``[(width, format, bytes)]`` for the image in ``data``.
+
+    Runs in the worker processes, so it only takes and returns plain values.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        renditions = []
+        # Widest first; each smaller size is resampled from the previous one.
+        for width in sorted(widths, reverse=True):
+            height = max(round(image.height * width / image.width), 1)
+            if (width, height) != image.size:
+                image = image.resize((width, height), Image.Resampling.LANCZOS)
+            for format in formats:
+                frame = image
+                if format == 'jpeg' and frame.mode == 'RGBA':
+                    frame = Image.new('RGB', frame.size, (255, 255, 255))
+                    frame.paste(image, mask=image.getchannel('A'))
+                buffer = io.BytesIO()
+                frame.save(buffer, quality=quality, **SAVE_OPTIONS[format])
+                renditions.append((width, format, buffer.getvalue()))
+        return renditions
+
+
+def rendition_name(options, digest, width, format):
+    return f"{options['PREFIX']}/{digest}-{width}.{EXTENSIONS[format]}"
+
+
+def generate(model, pk, name, using=DEFAULT_DB_ALIAS, pool=None):
+    """
+    Encode and store the renditions of ``name``, then record them on the row.
+
+    ``pool`` is a process pool to encode in; without one the work is done
+    inline. Returns whether the row was updated.
+    """
+    options = get_options()
+    storage = model._meta.get_field(FIELDS[model]).storage
+    try:
+        with storage.open(name, 'rb') as source:
+            data = source.read()
+        widths = plan_widths(data, options['WIDTHS'])
+    except FileNotFoundError:
+        logger.warning('Image %s of %s %s does not exist', name, model._meta.label, pk)
+        return False
+    except Exception:
+        logger.exception('Cannot read image %s of %s %s', name, model._meta.label, pk)
+        return False
+
+    digest = hashlib.sha256(data).hexdigest()[:24]
+    variants = {'source': name}
+    for format in options['FORMATS']:
+        variants[format] = {str(w): rendition_name(options, digest, w, format) for w in widths}
+
+    missing = [
+        (width, format) for format in options['FORMATS'] for width in widths
+        if not storage.exists(rendition_name(options, digest, width, format))
+    ]
+    if missing:
+        args = (data, sorted({w for w, _ in missing}), list(options['FORMATS']), options['QUALITY'])
+        try:
+            renditions = pool.submit(encode_renditions, *args).result() if pool else encode_renditions(*args)
+        except Exception:
+            logger.exception('Cannot encode image %s of %s %s', name, model._meta.label, pk)
+            return False
+        for width, format, content in renditions:
+            target = rendition_name(options, digest, width, format)
+            if not storage.exists(target):
+                storage.save(target, ContentFile(content))
+    return store(model, pk, name, variants, using)
+
+
+def store(model, pk, name, variants, using=DEFAULT_DB_ALIAS):
+    """Record ``variants`` unless the row's image is no longer ``name``."""
+    with transaction.atomic(using=using):
+        instance = model._default_manager.using(using).select_for_update().filter(pk=pk).first()
+        if instance is None or source_name(instance) != name:
+            return False
+        instance.image_variants = variants
+        # A regular save, so post_save receivers (e.g. cache invalidation) run.
+        instance.save(update_fields=['image_variants'])
+    return True
+
+
+def get_pools():
+    """``(coordinator threads, encoding processes)``, created on first use."""
+    global _pools
+    with _pools_lock:
+        if _pools is None:
+            workers = get_options()['WORKERS']
+            # spawn: forking a process that runs threads and holds database
+            # connections is unsafe.
+            processes = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pools = (ThreadPoolExecutor(max_workers=workers, thread_name_prefix='renditions'), processes)
+        return _pools
+
+
+def _generate_in_background(model, pk, name, using, pool):
+    try:
+        generate(model, pk, name, using, pool=pool)
+    finally:
+        connections.close_all()
+
+
+def submit(model, pk, name, using=DEFAULT_DB_ALIAS):
+    if not name:
+        store(model, pk, name, {}, using)
+    elif get_options()['WORKERS'] == 0:
+        generate(model, pk, name, using)
+    else:
+        threads, processes = get_pools()
+        threads.submit(_generate_in_background, model, pk, name, using, processes)
+
+
+def source_name(instance):
+    """
+    The stored image to render, or '' for none. The field's default (e.g.
+    the shared default avatar) counts as none, so it is not rendered again
+    for every new row.
+    """
+    field = instance._meta.get_field(FIELDS[type(instance)])
+    name = getattr(instance, field.attname).name or ''
+    return '' if field.has_default() and name == field.get_default() else name
+
+
+def needs_renditions(instance):
+    return source_name(instance) != (instance.image_variants or {}).get('source', '')
+
+
+def schedule_renditions(sender, instance, raw, using, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and FIELDS[sender] not in update_fields):
+        return
+    if needs_renditions(instance):
+        transaction.on_commit(partial(submit, sender, instance.pk, source_name(instance), using), using=using)
+
+
+def register(model, field_name):
+    """Generate renditions of ``model.<field_name>`` into ``model.image_variants``."""
+    FIELDS[model] = field_name
+    post_save.connect(schedule_renditions, sender=model, dispatch_uid=f'renditions:{model._meta.label}')
+
+
+class ImageVariantsField(serializers.Field):
+    """Read-only ``{format: {width: url}}`` built from an ``image_variants`` column."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        model = self.parent.Meta.model
+        storage = model._meta.get_field(FIELDS[model]).storage
+        request = self.context.get('request')
+        urls = {}
+        for format, names in variants.items():
+            if format == 'source':
+                continue
+            urls[format] = {
+                width: request.build_absolute_uri(storage.url(name)) if request is not None else storage.url(name)
+                for width, name in names.items()
+            }
+        return urls
@@ -0,0 +1,183 @@
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+
+from ecommerce import metrics, seeding
+from products.models import Category, Product
+
+# name -> (method, path template); the templates are filled from the seeded data.
+ENDPOINTS = {
+    'products-list': ('get', '/api/products/products/'),
+    'products-detail': ('get', '/api/products/products/{slug}/'),
+    'products-search': ('get', '/api/products/products/?search={term}'),
+    'categories': ('get', '/api/products/categories/'),
+    'reviews': ('get', '/api/products/products/{slug}/reviews/'),
+    'login': ('post', '/api/auth/login/'),
+    'refresh': ('post', '/api/auth/refresh/'),
+}
+
+
+def percentile(ordered, fraction):
+    return ordered[max(int(len(ordered) * fraction + 0.5) - 1, 0)] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure throughput, p50/p95/p99 latency and query counts of the main API endpoints '
+        'in-process against seeded data (see seed_catalog), optionally failing on regressions '
+        'against a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='Comma-separated endpoints to measure.')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per endpoint.')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Stop an endpoint early after this many seconds (login is slow by design).')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint.')
+        parser.add_argument('--password', default=seeding.PASSWORD, help='Password of the seeded users.')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Keep the catalog response cache on (it is bypassed by default so every request reads the database).')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+        parser.add_argument('--save-baseline', metavar='FILE', help='Write the results to FILE as the new baseline.')
+        parser.add_argument('--baseline', metavar='FILE', help='Compare against FILE and fail on regressions.')
+        parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                            help='Allowed p95 latency increase over the baseline, as a fraction (default 0.25).')
+        parser.add_argument('--query-tolerance', type=int, default=0,
+                            help='Allowed increase in queries per request over the baseline (default 0).')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['endpoints'].split(',')]
+        unknown = set(names) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        baseline = self.load_baseline(options['baseline']) if options['baseline'] else None
+
+        overrides = {
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+            # Every request comes from one client; rate limits would turn the run into 429s.
+            'THROTTLING': {**getattr(settings, 'THROTTLING', {}), 'ENABLED': False},
+        }
+        if not options['with_cache']:
+            overrides['CATALOG_CACHE'] = {**getattr(settings, 'CATALOG_CACHE', {}), 'ENABLED': False}
+        with override_settings(**overrides):
+            fixtures = self.fixtures(options['password'])
+            client = Client()
+            results = [self.run(client, name, fixtures, options) for name in names]
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections['default'].vendor,
+                'products': Product.objects.count(),
+                'catalog_cache': options['with_cache'],
+            },
+            'endpoints': results,
+        }
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as out:
+                json.dump(report, out, indent=2)
+                out.write('\n')
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(
+                f"{'endpoint':<16} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                f"{'queries':>7} {'errors':>6}"
+            )
+            for r in results:
+                self.stdout.write(
+                    f"{r['endpoint']:<16} {r['requests']:>8} {r['requests_per_second']:>8.1f} {r['p50_ms']:>8.2f} "
+                    f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['queries']:>7} {r['errors']:>6}"
+                )
+
+        if baseline is not None:
+            regressions = self.compare(results, baseline, options)
+            for line in regressions:
+                self.stderr.write(line)
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}.')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}.'))
+
+    def load_baseline(self, path):
+        try:
+            with open(path) as f:
+                return {r['endpoint']: r for r in json.load(f)['endpoints']}
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f'Cannot read baseline {path}: {exc}')
+
+    def fixtures(self, password):
+        """Values for the path templates and request bodies, picked from the seeded data."""
+        product = Product.objects.filter(available=True).order_by('-rating_count', 'pk').only('slug', 'name').first()
+        user = seeding.seeded_users().order_by('email').only('email').first()
+        if product is None or user is None or not Category.objects.exists():
+            raise CommandError('Nothing to measure; run `manage.py seed_catalog` first.')
+        return {
+            'slug': product.slug,
+            # A word that occurs in many products' names.
+            'term': product.name.split()[1],
+            'credentials': {'email': user.email, 'password': password},
+        }
+
+    def send(self, client, name, fixtures):
+        method, template = ENDPOINTS[name]
+        path = template.format(**fixtures)
+        if name == 'login':
+            return client.post(path, fixtures['credentials'], content_type='application/json')
+        return getattr(client, method)(path)
+
+    def run(self, client, name, fixtures, options):
+        if name == 'refresh' and 'refresh_token' not in client.cookies:
+            self.send(client, 'login', fixtures)
+        for _ in range(options['warmup']):
+            self.send(client, name, fixtures)
+
+        latencies, queries, errors = [], [], 0
+        deadline = time.perf_counter() + options['duration']
+        began = time.perf_counter()
+        while len(latencies) < options['requests'] and time.perf_counter() < deadline:
+            record = metrics.RequestMetrics()
+            started = time.perf_counter()
+            with metrics.instrument(record):
+                response = self.send(client, name, fixtures)
+            latencies.append(time.perf_counter() - started)
+            queries.append(record.queries)
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - began
+
+        latencies.sort()
+        return {
+            'endpoint': name,
+            'requests': len(latencies),
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            # Query counts are deterministic for a given data set; report the worst.
+            'queries': max(queries),
+            'errors': errors,
+        }
+
+    def compare(self, results, baseline, options):
+        regressions = []
+        for r in results:
+            base = baseline.get(r['endpoint'])
+            if base is None:
+                continue
+            name = r['endpoint']
+            if r['errors']:
+                regressions.append(f'{name}: {r["errors"]} failed requests')
+            if r['queries'] > base['queries'] + options['query_tolerance']:
+                regressions.append(f'{name}: {r["queries"]} queries per request, baseline {base["queries"]}')
+            limit = base['p95_ms'] * (1 + options['latency_tolerance'])
+            if r['p95_ms'] > limit:
+                regressions.append(f'{name}: p95 {r["p95_ms"]:.2f} ms, baseline {base["p95_ms"]:.2f} ms (limit {limit:.2f} ms)')
+        return regressions
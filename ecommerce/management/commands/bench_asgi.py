@@ -0,0 +1,147 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from products.models import Product
+
+# How each mode serves the catalog read endpoints:
+#   wsgi        the DRF viewsets through the WSGI handler, one thread per connection
+#               (a threaded WSGI server such as gunicorn --threads);
+#   asgi-sync   the same DRF viewsets through the ASGI handler, which runs each
+#               sync view in a thread via sync_to_async;
+#   asgi-async  the async views under /api/async/ on the event loop.
+# The ASGI modes share one event loop between all connections, as uvicorn does.
+MODES = {
+    'wsgi': '/api/products/',
+    'asgi-sync': '/api/products/',
+    'asgi-async': '/api/async/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec and latency of the catalog read endpoints served by WSGI threads, '
+        'sync views under ASGI and the async views, at several levels of concurrency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODES), help='Comma-separated modes to run.')
+        parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrent connection counts.')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per mode and concurrency.')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Keep the catalog response cache on (it is bypassed by default so every request reads the database).')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        modes = [name.strip() for name in options['modes'].split(',')]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        try:
+            levels = [int(n) for n in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma-separated list of integers.')
+
+        slug = Product.objects.order_by('pk').values_list('slug', flat=True).first()
+        if slug is None:
+            raise CommandError('The catalog is empty; import some products first.')
+        # The list (two orderings), detail, review and category endpoints, requested in turn.
+        paths = ['products/', 'products/?ordering=price&page_size=50', f'products/{slug}/',
+                 f'products/{slug}/reviews/', 'categories/']
+
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        if not options['with_cache']:
+            overrides['CATALOG_CACHE'] = {**getattr(settings, 'CATALOG_CACHE', {}), 'ENABLED': False}
+
+        results = []
+        with override_settings(**overrides):
+            for mode in modes:
+                urls = [MODES[mode] + path for path in paths]
+                for concurrency in levels:
+                    if mode == 'wsgi':
+                        stats = self.run_threads(urls, concurrency, options['duration'])
+                    else:
+                        stats = asyncio.run(self.run_tasks(urls, concurrency, options['duration']))
+                    results.append({'mode': mode, 'concurrency': concurrency, **stats})
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'mode':<11} {'conns':>5} {'req/s':>9} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for r in results:
+            self.stdout.write(
+                f"{r['mode']:<11} {r['concurrency']:>5} {r['requests_per_second']:>9.1f} {r['requests']:>9} "
+                f"{r['errors']:>7} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+            )
+
+    def run_threads(self, urls, concurrency, duration):
+        deadline = time.perf_counter() + duration
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        start = threading.Barrier(concurrency)
+
+        def work(offset):
+            client = Client()
+            local_latencies, local_errors = [], 0
+            start.wait()
+            try:
+                i = offset
+                while time.perf_counter() < deadline:
+                    began = time.perf_counter()
+                    response = client.get(urls[i % len(urls)])
+                    local_latencies.append(time.perf_counter() - began)
+                    local_errors += response.status_code >= 400
+                    i += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(local_latencies)
+                    errors[0] += local_errors
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(concurrency)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.summarize(latencies, errors[0], time.perf_counter() - began)
+
+    async def run_tasks(self, urls, concurrency, duration):
+        deadline = time.perf_counter() + duration
+        latencies, errors = [], [0]
+
+        async def work(offset):
+            client = AsyncClient()
+            i = offset
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                response = await client.get(urls[i % len(urls)])
+                latencies.append(time.perf_counter() - began)
+                errors[0] += response.status_code >= 400
+                i += 1
+
+        began = time.perf_counter()
+        await asyncio.gather(*(work(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - began
+        # The async ORM queries from the thread-sensitive worker; close its connections there.
+        await sync_to_async(connections.close_all)()
+        return self.summarize(latencies, errors[0], elapsed)
+
+    def summarize(self, latencies, errors, elapsed):
+        latencies.sort()
+        return {
+            'seconds': round(elapsed, 3),
+            'requests': len(latencies),
+            'requests_per_second': len(latencies) / elapsed,
+            'errors': errors,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p99_ms': latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000 if latencies else 0.0,
+        }
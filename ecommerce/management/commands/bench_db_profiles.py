@@ -0,0 +1,177 @@
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections, transaction
+from django.db.models import F
+
+from products.models import Category, Product
+
+# Each profile overrides the settings of a throwaway SQLite database.
+PROFILES = {
+    # What the project shipped with: no pragmas, a new connection per request.
+    'baseline': {'CONN_MAX_AGE': 0, 'PRAGMAS': {}, 'OPTIONS': {}},
+    'persistent': {'CONN_MAX_AGE': 600, 'PRAGMAS': {}, 'OPTIONS': {}},
+    'wal': {'CONN_MAX_AGE': 600, 'PRAGMAS': None, 'OPTIONS': {}},
+    'wal-immediate': {'CONN_MAX_AGE': 600, 'PRAGMAS': None, 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare SQLite database profiles (connection reuse, WAL pragmas, transaction mode) '
+        'under a mixed read/write load from concurrent request threads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default=','.join(PROFILES), help='Comma-separated profiles to run.')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent request threads.')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per profile.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Fraction of requests that write.')
+        parser.add_argument('--products', type=int, default=5000, help='Products seeded into the bench database.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        profiles = [name.strip() for name in options['profiles'].split(',')]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        workdir = tempfile.mkdtemp(prefix='bench-db-')
+        try:
+            template = os.path.join(workdir, 'template.sqlite3')
+            self.build_template(template, options['products'])
+            results = []
+            for name in profiles:
+                path = os.path.join(workdir, f'{name}.sqlite3')
+                shutil.copyfile(template, path)
+                alias = self.add_alias(name, path)
+                try:
+                    results.append({'profile': name, **self.run(alias, options)})
+                finally:
+                    self.remove_alias(alias)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'profile':<14} {'req/s':>9} {'reads':>8} {'writes':>7} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+        for r in results:
+            self.stdout.write(
+                f"{r['profile']:<14} {r['requests_per_second']:>9.1f} {r['reads']:>8} {r['writes']:>7} "
+                f"{r['errors']:>7} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+            )
+
+    def settings_for(self, name, path):
+        profile = PROFILES[name]
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': path,
+            'ATOMIC_REQUESTS': False,
+            'AUTOCOMMIT': True,
+            'CONN_MAX_AGE': profile['CONN_MAX_AGE'],
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': dict(profile['OPTIONS']),
+            'PRAGMAS': settings.SQLITE_PRAGMAS if profile['PRAGMAS'] is None else profile['PRAGMAS'],
+            'TIME_ZONE': None,
+            'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '',
+            'TEST': {},
+        }
+
+    def add_alias(self, name, path):
+        alias = f'bench_{name.replace("-", "_")}'
+        connections.settings[alias] = self.settings_for(name, path)
+        return alias
+
+    def remove_alias(self, alias):
+        connections[alias].close()
+        del connections.settings[alias]
+
+    def build_template(self, path, count):
+        alias = self.add_alias('baseline', path)
+        try:
+            call_command('migrate', 'products', database=alias, verbosity=0)
+            category = Category.objects.using(alias).create(name='Bench', slug='bench')
+            Product.objects.using(alias).bulk_create([
+                Product(name=f'Bench product {i}', slug=f'bench-{i}', description='Benchmark product',
+                        price=f'{i % 500}.99', category=category, stock=1000)
+                for i in range(count)
+            ], batch_size=500)
+        finally:
+            self.remove_alias(alias)
+        # The template is copied per profile; make sure it is not left in WAL mode.
+        with sqlite3.connect(path) as raw:
+            raw.execute('PRAGMA journal_mode = delete')
+
+    def run(self, alias, options):
+        products = Product.objects.using(alias)
+        max_id = products.order_by('-pk').values_list('pk', flat=True).first()
+        deadline = time.perf_counter() + options['duration']
+        counters = {'reads': 0, 'writes': 0, 'errors': 0}
+        latencies = []
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+
+        def request(rng):
+            if rng.random() < options['write_ratio']:
+                # A typical read-then-write transaction: look the row up, then change it.
+                with transaction.atomic(using=alias):
+                    pk = rng.randint(1, max_id)
+                    products.filter(pk=pk).values_list('stock', flat=True).first()
+                    products.filter(pk=pk).update(stock=F('stock') + 1)
+                return 'writes'
+            list(products.filter(available__in=[True]).order_by('-created_at', '-id')
+                 .values_list('id', 'name', 'price')[:20])
+            return 'reads'
+
+        def work(seed):
+            rng = random.Random(seed)
+            local, local_latencies = dict.fromkeys(counters, 0), []
+            start.wait()
+            try:
+                while time.perf_counter() < deadline:
+                    began = time.perf_counter()
+                    # Mirror Django's request_started/request_finished handling,
+                    # which is where CONN_MAX_AGE takes effect.
+                    close_old_connections()
+                    try:
+                        local[request(rng)] += 1
+                    except OperationalError:
+                        local['errors'] += 1
+                    finally:
+                        close_old_connections()
+                    local_latencies.append(time.perf_counter() - began)
+            finally:
+                connections[alias].close()
+                with lock:
+                    latencies.extend(local_latencies)
+                    for key, value in local.items():
+                        counters[key] += value
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(options['threads'])]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        latencies.sort()
+        done = counters['reads'] + counters['writes']
+        return {
+            'seconds': round(elapsed, 3),
+            'requests_per_second': done / elapsed,
+            **counters,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p99_ms': latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000 if latencies else 0.0,
+        }
@@ -0,0 +1,46 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ecommerce import images
+
+
+class Command(BaseCommand):
+    help = 'Generate missing or stale image renditions for every registered image field.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Encoding processes (default: IMAGE_RENDITIONS["WORKERS"]; 0 encodes inline).')
+        parser.add_argument('--force', action='store_true', help='Re-plan every row, e.g. after changing IMAGE_RENDITIONS.')
+
+    def handle(self, *args, **options):
+        workers = images.get_options()['WORKERS'] if options['workers'] is None else options['workers']
+        jobs = []
+        for model, field_name in images.FIELDS.items():
+            rows = model._default_manager.only('pk', field_name, 'image_variants').iterator(chunk_size=2000)
+            for instance in rows:
+                if options['force'] or images.needs_renditions(instance):
+                    jobs.append((model, instance.pk, images.source_name(instance)))
+        if not jobs:
+            self.stdout.write('All renditions are up to date.')
+            return
+
+        if workers == 0:
+            updated = sum(self.run_job(job, None) for job in jobs)
+        else:
+            processes = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            with processes, ThreadPoolExecutor(max_workers=workers) as threads:
+                updated = sum(threads.map(lambda job: self.run_job(job, processes), jobs))
+        self.stdout.write(f'Updated {updated} of {len(jobs)} rows.')
+
+    def run_job(self, job, pool):
+        model, pk, name = job
+        try:
+            if not name:
+                return images.store(model, pk, name, {})
+            return images.generate(model, pk, name, pool=pool)
+        finally:
+            if pool is not None:
+                connections.close_all()
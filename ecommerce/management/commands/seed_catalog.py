@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce import seeding
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Seed deterministic categories, products, customers and reviews for benchmarks and load tests.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--reviews', type=int, default=20000, help='At most one per product and user.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--password', default=seeding.PASSWORD, help='Password of every seeded user.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT.')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded rows first.')
+        parser.add_argument('--database', default='default', help='Database alias to seed.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['clear']:
+            seeding.clear_seed(using=using)
+        elif Product.objects.using(using).filter(slug__startswith=seeding.SLUG_PREFIX).exists():
+            raise CommandError('The database already holds seeded rows; pass --clear to replace them.')
+
+        began = time.perf_counter()
+        result = seeding.seed_catalog(
+            options['categories'], options['products'], options['users'], options['reviews'],
+            seed=options['seed'], password=options['password'], batch_size=options['batch_size'], using=using,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {result.categories} categories, {result.products} products, {result.users} users '
+            f'and {result.reviews} reviews in {time.perf_counter() - began:.1f}s.'
+        ))
@@ -0,0 +1,266 @@
+"""
+Per-request performance instrumentation.
+
+``RequestMetricsMiddleware`` times every request and installs a database
+``execute_wrapper`` on each connection for its duration. That gives the
+request's query count and query time. Two more stages are timed: code
+wrapped in ``timed('serialize')`` (the row serializers of the list
+endpoints), and rendering the response to bytes. The response size is
+recorded too.
+
+With ``REQUEST_METRICS['SERVER_TIMING']`` on, the figures go out in a
+``Server-Timing`` header, so browser dev tools show them. It is off by
+default: the header tells every client how the server spends its time.
+The figures always go to per-route histograms keyed by view and action, e.g.
+``ProductViewSet.list``. ``MetricsView`` exposes the histograms and the
+catalog cache counters to admins. They are kept per process, so each worker
+reports its own traffic.
+
+With ``REQUEST_METRICS['ENABLED']`` off, the middleware raises
+``MiddlewareNotUsed`` and drops out of the chain. Nothing is wrapped or
+recorded then, and ``timed`` reduces to a context variable lookup.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.permissions import IsAdminOrSuperAdmin
+from products.cache import get_catalog_cache
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': False,
+    # Upper bounds (ms) of the request time histogram buckets; a last bucket
+    # takes everything slower.
+    'BUCKETS': (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000),
+}
+STAGES = ('db', 'serialize', 'render')
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_METRICS', {})}
+
+
+class RequestMetrics:
+    """What one request spent, in seconds."""
+    __slots__ = ('started', 'route', 'queries', 'db', 'serialize', 'render', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Requests that never reach a view (e.g. no URL matched).
+        self.route = 'unresolved'
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+        self.render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # The execute_wrapper.
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - began
+            self.queries += 1
+
+    def rendered(self, response):
+        if self.render_started is not None:
+            self.render += time.perf_counter() - self.render_started
+            self.render_started = None
+
+
+@contextmanager
+def timed(stage):
+    """Add the time spent in the block to ``stage`` of the current request."""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(record, stage, getattr(record, stage) + time.perf_counter() - began)
+
+
+def instrument(record):
+    """Count the queries run on any connection of this thread into ``record`` while in the block."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(record))
+    return stack
+
+
+def route_name(view_func, method):
+    """``<view class>.<action>`` for class-based views, else the function name."""
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{cls.__name__}.{actions.get(method.lower(), method.lower())}'
+
+
+class RouteStats:
+    def __init__(self, buckets):
+        self.count = 0
+        self.errors = 0
+        self.queries = 0
+        self.bytes = 0
+        self.seconds = dict.fromkeys(('total', *STAGES), 0.0)
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def add(self, record, total, status_code, size, buckets):
+        self.count += 1
+        self.errors += status_code >= 500
+        self.queries += record.queries
+        self.bytes += size
+        self.seconds['total'] += total
+        for stage in STAGES:
+            self.seconds[stage] += getattr(record, stage)
+        self.histogram[bisect_left(buckets, total * 1000)] += 1
+
+    def percentile(self, fraction, buckets):
+        """Upper bound (ms) of the bucket holding the ``fraction`` quantile; ``None`` if beyond the last."""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip((*buckets, None), self.histogram):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self, buckets):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            **{f'{stage}_ms_avg': self.seconds[stage] * 1000 / self.count for stage in ('total', *STAGES)},
+            'queries_avg': self.queries / self.count,
+            'bytes_avg': self.bytes / self.count,
+            'p50_ms': self.percentile(0.5, buckets),
+            'p95_ms': self.percentile(0.95, buckets),
+            'p99_ms': self.percentile(0.99, buckets),
+            'histogram': {f'le_{bound}': count for bound, count in zip((*buckets, 'inf'), self.histogram)},
+        }
+
+
+class Registry:
+    """Process-wide per-route aggregates."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.since = timezone.now()
+
+    def add(self, record, total, status_code, size):
+        buckets = get_options()['BUCKETS']
+        with self._lock:
+            stats = self.routes.get(record.route)
+            if stats is None:
+                stats = self.routes[record.route] = RouteStats(buckets)
+            stats.add(record, total, status_code, size, buckets)
+
+    def snapshot(self):
+        buckets = get_options()['BUCKETS']
+        with self._lock:
+            routes = {route: stats.as_dict(buckets) for route, stats in sorted(self.routes.items())}
+        return {'since': self.since, 'routes': routes}
+
+
+registry = Registry()
+
+
+class RequestMetricsMiddleware:
+    """Measure each request, send ``Server-Timing`` and feed the route histograms."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = get_options()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.server_timing = options['SERVER_TIMING']
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        record = _current.get()
+        if record is not None:
+            record.route = route_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered.
+        record = _current.get()
+        if record is not None:
+            record.render_started = time.perf_counter()
+            response.add_post_render_callback(record.rendered)
+        return response
+
+    def finish(self, record, response):
+        total = time.perf_counter() - record.started
+        size = 0 if response.streaming else len(response.content)
+        registry.add(record, total, response.status_code, size)
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={record.db * 1000:.1f};desc="{record.queries} queries"',
+                *(f'{stage};dur={getattr(record, stage) * 1000:.1f}' for stage in ('serialize', 'render')),
+                f'total;dur={total * 1000:.1f}',
+            ])
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = RequestMetrics()
+        token = _current.set(record)
+        try:
+            with instrument(record):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(record, response)
+
+    async def __acall__(self, request):
+        record = RequestMetrics()
+        token = _current.set(record)
+        try:
+            with instrument(record):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(record, response)
+
+
+class MetricsView(APIView):
+    """
+    Per-route request histograms and catalog cache counters of this process.
+
+    DELETE starts a new measurement window.
+    """
+    permission_classes = [IsAdminOrSuperAdmin]
+
+    def get(self, request):
+        return Response({
+            'enabled': get_options()['ENABLED'],
+            **registry.snapshot(),
+            'catalog_cache': get_catalog_cache().stats(),
+        })
+
+    def delete(self, request):
+        registry.reset()
+        return Response(status=204)
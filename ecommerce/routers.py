@@ -0,0 +1,114 @@
+"""
+Primary/replica database routing.
+
+Reads go to a replica only while handling a safe-method request (see
+``ReplicaRoutingMiddleware``). Every read of that request goes to the same
+randomly chosen replica, so they share one view of the data. Writes, reads
+inside a transaction, management commands and requests from a client that
+wrote within the last ``DATABASE_REPLICA_STICKY_SECONDS`` all use
+``default``, so a client always sees its own writes despite replication lag.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def read_from(alias):
+    """Route reads in the block to ``alias`` (``None`` means the primary)."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def current_read_alias():
+    """The replica reads are routed to right now, or ``None`` for the primary."""
+    return _read_alias.get()
+
+
+def use_replica():
+    aliases = replicas()
+    return read_from(random.choice(aliases) if aliases else None)
+
+
+def use_primary():
+    return read_from(None)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction must see its own uncommitted writes.
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication.
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Enable replica reads for safe requests and pin recent writers to the primary."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def routing(self, request):
+        if request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES:
+            return use_replica()
+        return use_primary()
+
+    def pin(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not replicas():
+            return response
+        response.set_cookie(
+            PIN_COOKIE, '1',
+            max_age=getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5),
+            httponly=True,
+            secure=request.is_secure(),
+            samesite='Lax',
+        )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.routing(request):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        with self.routing(request):
+            response = await self.get_response(request)
+        return self.pin(request, response)
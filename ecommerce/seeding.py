@@ -0,0 +1,132 @@
+"""
+Deterministic demo data for benchmarks and load tests.
+
+``seed_catalog`` creates categories, products, active customers (each with
+a profile) and reviews with ``bulk_create``. Everything is derived from
+``seed``, so two runs with the same arguments produce the same catalog and
+the same query plans. Seeded rows are recognisable by the ``seed-`` slug
+prefix and the ``@seed.example`` email domain, which is how ``clear_seed``
+finds them again.
+
+``bulk_create`` sends no signals, so the work the signal receivers would
+have done is repeated once at the end. Profiles are created explicitly,
+product ratings are rebuilt from the reviews, category paths and counts
+from the categories and products, the catalog cache generations
+are bumped and the search engines are reset. The FTS5 index is kept up to
+date by its triggers.
+"""
+import random
+from dataclasses import dataclass
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from accounts.models import Profile
+from products import search
+from products.cache import invalidate_model
+from products.models import Category, Product, Review
+from products.categories import rebuild_category_tree
+from products.ratings import rebuild_ratings
+
+SLUG_PREFIX = 'seed-'
+EMAIL_DOMAIN = 'seed.example'
+PASSWORD = 'seed-Pass-1234'
+
+WORDS = (
+    'leather', 'wool', 'cotton', 'linen', 'canvas', 'suede', 'denim', 'silk', 'classic', 'vintage',
+    'slim', 'relaxed', 'waterproof', 'lightweight', 'summer', 'winter', 'travel', 'trail', 'urban', 'studio',
+)
+NOUNS = (
+    'boot', 'sneaker', 'sandal', 'jacket', 'coat', 'shirt', 'scarf', 'cap', 'backpack', 'wallet',
+    'belt', 'glove', 'sock', 'hoodie', 'blanket', 'lamp', 'mug', 'notebook', 'bottle', 'watch',
+)
+
+
+@dataclass
+class SeedResult:
+    categories: int = 0
+    products: int = 0
+    users: int = 0
+    reviews: int = 0
+
+
+def seed_email(index):
+    return f'user-{index}@{EMAIL_DOMAIN}'
+
+
+def seeded_users(using=DEFAULT_DB_ALIAS):
+    return get_user_model()._default_manager.using(using).filter(email__endswith=f'@{EMAIL_DOMAIN}')
+
+
+def clear_seed(using=DEFAULT_DB_ALIAS):
+    """Delete every seeded row (reviews go with their products and users)."""
+    with transaction.atomic(using=using):
+        Product.objects.using(using).filter(slug__startswith=SLUG_PREFIX).delete()
+        Category.objects.using(using).filter(slug__startswith=SLUG_PREFIX).delete()
+        seeded_users(using).delete()
+
+
+def seed_catalog(categories, products, users, reviews, seed=0, password=PASSWORD, batch_size=1000, using=DEFAULT_DB_ALIAS):
+    """
+    Create the given number of each row and return a ``SeedResult``.
+
+    ``reviews`` is capped at one review per product and user pair.
+    """
+    rng = random.Random(seed)
+    result = SeedResult()
+    with transaction.atomic(using=using):
+        category_objs = Category.objects.using(using).bulk_create([
+            Category(name=f'Seed {noun.title()}s {i}', slug=f'{SLUG_PREFIX}{noun}s-{i}', description=f'Seeded {noun}s.')
+            for i, noun in ((i, NOUNS[i % len(NOUNS)]) for i in range(categories))
+        ], batch_size=batch_size)
+        result.categories = len(category_objs)
+        category_ids = list(Category.objects.using(using).filter(slug__startswith=SLUG_PREFIX).values_list('pk', flat=True))
+
+        product_objs = []
+        for i in range(products):
+            adjectives = rng.sample(WORDS, 2)
+            noun = rng.choice(NOUNS)
+            product_objs.append(Product(
+                name=f'{adjectives[0].title()} {adjectives[1]} {noun} {i}',
+                slug=f'{SLUG_PREFIX}{noun}-{i}',
+                description=' '.join(rng.choices(WORDS, k=12) + [noun]),
+                price=f'{rng.randint(1, 500)}.{rng.randint(0, 99):02d}',
+                category_id=rng.choice(category_ids) if category_ids else None,
+                stock=rng.randint(0, 200),
+                available=rng.random() < 0.9,
+            ))
+        Product.objects.using(using).bulk_create(product_objs, batch_size=batch_size)
+        result.products = len(product_objs)
+
+        # One hash shared by every seeded user; hashing per user would dominate the run.
+        password_hash = make_password(password)
+        User = get_user_model()
+        user_objs = [
+            User(email=seed_email(i), password=password_hash, first_name='Seed', last_name=str(i),
+                 role='customer', is_active=True, is_email_verified=True)
+            for i in range(users)
+        ]
+        User._default_manager.using(using).bulk_create(user_objs, batch_size=batch_size)
+        Profile.objects.using(using).bulk_create([Profile(user=user) for user in user_objs], batch_size=batch_size)
+        result.users = len(user_objs)
+
+        product_ids = list(Product.objects.using(using).filter(slug__startswith=SLUG_PREFIX).values_list('pk', flat=True))
+        user_ids = [user.pk for user in user_objs]
+        pairs = len(product_ids) * len(user_ids)
+        review_objs = []
+        for n in rng.sample(range(pairs), min(reviews, pairs)):
+            product_id, user_id = product_ids[n // len(user_ids)], user_ids[n % len(user_ids)]
+            review_objs.append(Review(
+                product_id=product_id, user_id=user_id, rating=rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 2, 4, 4))[0],
+                comment=' '.join(rng.choices(WORDS, k=8)),
+            ))
+        Review.objects.using(using).bulk_create(review_objs, batch_size=batch_size)
+        result.reviews = len(review_objs)
+
+        rebuild_ratings(batch_size=batch_size, using=using)
+        rebuild_category_tree(using=using)
+        for model in (Category, Product, Review):
+            invalidate_model(model, using=using)
+    search.reset_search_engines()
+    return result
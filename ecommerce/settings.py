@@ -1,7 +1,11 @@
+from importlib.util import find_spec
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
+# Only reads the settings when a password is hashed, so safe to import here.
+from accounts.hashers import HASHERS
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -35,11 +39,15 @@ INSTALLED_APPS = [
     'corsheaders',
     "rest_framework_simplejwt.token_blacklist",
     'django_filters',
+    'ecommerce.apps.EcommerceConfig',
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole middleware chain.
+    'ecommerce.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'ecommerce.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,17 +79,98 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The defaults keep the local SQLite file. Point DB_ENGINE/DB_NAME/DB_HOST...
+# at a server database in production, and list read replicas in DB_REPLICAS
+# (file paths for SQLite, host names otherwise); they become the aliases
+# replica1, replica2, ...
+DB_ENGINE = config('DB_ENGINE', default='django.db.backends.sqlite3')
+DB_IS_SQLITE = DB_ENGINE == 'django.db.backends.sqlite3'
+
+# Applied to every new SQLite connection by ecommerce.db. WAL lets readers
+# run alongside the single writer, synchronous=NORMAL is durable in WAL mode
+# except across power loss, and busy_timeout makes writers queue instead of
+# failing immediately with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+    'busy_timeout': config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int),
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'cache_size': config('SQLITE_CACHE_SIZE', default=-20000, cast=int),
+}
+
+
+def database(name, host=''):
+    settings = {
+        'ENGINE': DB_ENGINE,
+        'NAME': name,
+        # Persistent connections, checked before reuse by each request.
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'OPTIONS': {},
     }
+    if DB_IS_SQLITE:
+        settings['PRAGMAS'] = SQLITE_PRAGMAS
+        # Take the write lock at BEGIN, so a transaction that reads before it
+        # writes waits its turn instead of failing on lock upgrade.
+        settings['OPTIONS']['transaction_mode'] = config('SQLITE_TRANSACTION_MODE', default='IMMEDIATE')
+    else:
+        settings.update({
+            'USER': config('DB_USER', default=''),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': host,
+            'PORT': config('DB_PORT', default=''),
+        })
+        if config('DB_POOL', default=False, cast=bool):
+            # psycopg 3 connection pool; Django requires CONN_MAX_AGE = 0 with it.
+            settings['OPTIONS']['pool'] = True
+            settings['CONN_MAX_AGE'] = 0
+    return settings
+
+
+DATABASES = {
+    'default': database(config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')), config('DB_HOST', default='')),
 }
+DATABASE_REPLICAS = []
+for index, replica in enumerate(config('DB_REPLICAS', default='', cast=lambda v: [r.strip() for r in v.split(',') if r.strip()]), start=1):
+    alias = f'replica{index}'
+    if DB_IS_SQLITE:
+        DATABASES[alias] = database(replica)
+    else:
+        DATABASES[alias] = database(config('DB_NAME'), replica)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# Safe-method requests read from DATABASE_REPLICAS; a client that wrote is
+# kept on the primary for DATABASE_REPLICA_STICKY_SECONDS to read its writes.
+DATABASE_ROUTERS = ['ecommerce.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=5, cast=int)
 
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Password hashing (see accounts.hashers). PASSWORD_HASHER picks the algorithm
+# for new hashes; the others stay listed so existing hashes still verify, and a
+# successful login re-hashes them with the current algorithm and costs.
+# Defaults: Argon2id at OWASP's minimum (19 MiB, t=2, p=1) with argon2-cffi
+# (in requirements.txt); if it is missing, scrypt N=2**14, r=8, p=1 (16 MiB).
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='argon2' if find_spec('argon2') else 'scrypt')
+PASSWORD_HASHING = {
+    'PBKDF2_ITERATIONS': config('PBKDF2_ITERATIONS', default=1_000_000, cast=int),
+    'SCRYPT_WORK_FACTOR': config('SCRYPT_WORK_FACTOR', default=2**14, cast=int),
+    'SCRYPT_BLOCK_SIZE': config('SCRYPT_BLOCK_SIZE', default=8, cast=int),
+    'SCRYPT_PARALLELISM': config('SCRYPT_PARALLELISM', default=1, cast=int),
+    'ARGON2_TIME_COST': config('ARGON2_TIME_COST', default=2, cast=int),
+    'ARGON2_MEMORY_COST': config('ARGON2_MEMORY_COST', default=19456, cast=int),
+    'ARGON2_PARALLELISM': config('ARGON2_PARALLELISM', default=1, cast=int),
+}
+PASSWORD_HASHERS = [
+    HASHERS[PASSWORD_HASHER],
+    *(path for name, path in HASHERS.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -125,8 +214,37 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Per-request timings (route histograms at /api/metrics/, and with
+# SERVER_TIMING a Server-Timing header on every response, which exposes query
+# counts and timings to clients: enable it for development only).
+# Disabled, the middleware removes itself from the chain.
+REQUEST_METRICS = {
+    'ENABLED': config('REQUEST_METRICS_ENABLED', default=True, cast=bool),
+    'SERVER_TIMING': config('REQUEST_METRICS_SERVER_TIMING', default=False, cast=bool),
+}
+
+# Uploads are checked as they stream in and spooled to disk (see ecommerce.uploadhandlers).
+FILE_UPLOAD_HANDLERS = [
+    'ecommerce.uploadhandlers.LimitedUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+FILE_UPLOAD_LIMITS = {
+    'MAX_IMAGE_BYTES': config('UPLOAD_MAX_IMAGE_BYTES', default=10 * 1024 * 1024, cast=int),
+    'MAX_IMAGE_PIXELS': config('UPLOAD_MAX_IMAGE_PIXELS', default=40_000_000, cast=int),
+    'MAX_IMAGE_SIDE': config('UPLOAD_MAX_IMAGE_SIDE', default=10_000, cast=int),
+    'MAX_FILE_BYTES': config('UPLOAD_MAX_FILE_BYTES', default=200 * 1024 * 1024, cast=int),
+}
+
+# Resized WebP/JPEG copies of product and profile images (see ecommerce.images).
+IMAGE_RENDITIONS = {
+    'WIDTHS': tuple(config('IMAGE_RENDITION_WIDTHS', default='160,320,640,1280', cast=Csv(int))),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': config('IMAGE_RENDITION_QUALITY', default=80, cast=int),
+    'WORKERS': config('IMAGE_RENDITION_WORKERS', default=2, cast=int),
+}
+
 #the email settings
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -135,6 +253,16 @@ EMAIL_HOST_PASSWORD = config('EMAIL_PASSWORD')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
 SITE_NAME = config('SITE_NAME', default='My Site')
 
+# Outbound email is queued in the database and sent by
+# `python manage.py send_queued_mail` workers (accounts.mailer).
+EMAIL_QUEUE = {
+    'BATCH_SIZE': config('EMAIL_QUEUE_BATCH_SIZE', default=50, cast=int),
+    'MAX_ATTEMPTS': config('EMAIL_QUEUE_MAX_ATTEMPTS', default=5, cast=int),
+    'RETRY_BASE_SECONDS': config('EMAIL_QUEUE_RETRY_BASE_SECONDS', default=30, cast=int),
+    'RETRY_MAX_SECONDS': 3600,
+    'LEASE_SECONDS': 300,
+}
+
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:1573",
@@ -146,11 +274,122 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'accounts.authentication.CookieJWTAuthentication',
     ),
+    # Keyset pagination: every page is an index seek on (ordering field, id)
+    'DEFAULT_PAGINATION_CLASS': 'products.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+    # FAST_JSON_RENDERER renders JSON with orjson (when installed); the output is unchanged.
+    'DEFAULT_RENDERER_CLASSES': (
+        'ecommerce.renderers.FastJSONRenderer' if config('FAST_JSON_RENDERER', default=False, cast=bool)
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Sliding-window limits, see ecommerce.throttling. A view's scope is its
+    # throttle_scope, else read/write by method; scopes without a rate are not
+    # limited. <scope>.<role> replaces the rate for authenticated users of that
+    # role (None: unlimited), <scope>.email counts per email in the body.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'ecommerce.throttling.ClientRateThrottle',
+        'ecommerce.throttling.EmailRateThrottle',
+    ),
+    # Reverse proxies in front of the app. Clients are identified by the
+    # address this many hops from the end of X-Forwarded-For; 0 uses
+    # REMOTE_ADDR and ignores the header, which clients can set to anything.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
+    'DEFAULT_THROTTLE_RATES': {
+        'login': config('THROTTLE_LOGIN', default='20/m'),
+        'login.email': config('THROTTLE_LOGIN_EMAIL', default='10/15m'),
+        'register': config('THROTTLE_REGISTER', default='20/h'),
+        'refresh': config('THROTTLE_REFRESH', default='60/m'),
+        'password_reset': config('THROTTLE_PASSWORD_RESET', default='10/h'),
+        'password_reset.email': config('THROTTLE_PASSWORD_RESET_EMAIL', default='3/h'),
+        'write': config('THROTTLE_WRITE', default='60/m'),
+        'write.admin': config('THROTTLE_WRITE_ADMIN', default='600/m'),
+        'write.superadmin': None,
+    },
+}
+
+# Where the throttle counters live: 'local' (per process) or 'cache' (the
+# CACHES alias below, e.g. Redis, shared by all workers).
+THROTTLING = {
+    'ENABLED': config('THROTTLING_ENABLED', default=True, cast=bool),
+    'STORE': config('THROTTLE_STORE', default='local'),
+    'CACHE_ALIAS': config('THROTTLE_CACHE_ALIAS', default='default'),
+}
+
+# Caching. The shared backend is pluggable through the environment, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ecommerce'),
+    }
+}
+
+# Backends that keep their data inside one process. Other workers never see
+# what is written to them.
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Catalog response cache (products.cache): a bounded in-process LRU in front
+# of the CACHES alias below, invalidated through per-model generations. The
+# generations must be shared by every worker, so it is off by default with a
+# per-process backend; enable it there only when running a single process.
+CATALOG_CACHE = {
+    'ENABLED': config(
+        'CATALOG_CACHE_ENABLED', default=CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS, cast=bool,
+    ),
+    'ALIAS': 'default',
+    'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=300, cast=int),
+    'LOCAL_MAX_ENTRIES': config('CATALOG_CACHE_LOCAL_MAX_ENTRIES', default=1024, cast=int),
 }
 
+# Product search: 'auto' uses SQLite FTS5 when available, 'memory' forces the
+# pure-Python inverted index. That index lives in each process and only sees
+# that process's writes, so use it for tests or a single process only.
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='auto')
+
+# Review ids embedded in the product detail view, newest first. After a
+# change, run `rebuild_product_ratings` to resize the stored lists.
+PRODUCT_LATEST_REVIEWS = config('PRODUCT_LATEST_REVIEWS', default=10, cast=int)
+
+# Seconds a stock reservation is held before `expire_reservations` returns it.
+STOCK_RESERVATION_TTL = config('STOCK_RESERVATION_TTL', default=900, cast=int)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=15),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
-    "ROTATE_REFRESH_TOKENS": False,
+    # Every refresh replaces the refresh token. accounts.tokens does the
+    # rotation with one TokenSession row per login, not the blacklist.
+    "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": False,
 }
+
+# A refresh token that was already rotated revokes its session, except the
+# previous one within this many seconds (concurrent refreshes from two tabs).
+TOKEN_SESSIONS = {
+    'REUSE_GRACE_SECONDS': config('TOKEN_REUSE_GRACE_SECONDS', default=10, cast=int),
+}
+
+# Authorize requests from the role/status claims in the access token instead of
+# loading the user on every request. A deactivated user or a role change takes
+# effect at the next token refresh (ACCESS_TOKEN_LIFETIME at the latest).
+JWT_STATELESS_AUTH = config('JWT_STATELESS_AUTH', default=False, cast=bool)
+
+# Refresh token blacklist checks are answered from a bloom filter rebuilt
+# every REBUILD_SECONDS plus an LRU of recent revocations (accounts.blacklist).
+# Revocations reach other workers through a version counter in this cache.
+TOKEN_BLACKLIST = {
+    'REBUILD_SECONDS': config('TOKEN_BLACKLIST_REBUILD_SECONDS', default=300, cast=int),
+    'FALSE_POSITIVE_RATE': config('TOKEN_BLACKLIST_FALSE_POSITIVE_RATE', default=0.001, cast=float),
+    'RECENT_MAX_ENTRIES': config('TOKEN_BLACKLIST_RECENT_MAX_ENTRIES', default=10_000, cast=int),
+    'CACHE_ALIAS': config('TOKEN_BLACKLIST_CACHE_ALIAS', default='default'),
+    # Confirm filter misses with a query: required unless the cache alias is
+    # shared by every worker, or other workers accept revoked tokens until
+    # their next rebuild.
+    'CONFIRM_MISSES': config(
+        'TOKEN_BLACKLIST_CONFIRM_MISSES', default=CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS, cast=bool,
+    ),
+}
@@ -0,0 +1,32 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountAssertionsMixin:
+    """Test case helpers for catching N+1 queries on API endpoints."""
+
+    def count_queries(self, url, client=None, using=DEFAULT_DB_ALIAS):
+        client = client or self.client
+        with CaptureQueriesContext(connections[using]) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, f'GET {url} returned {response.status_code}')
+        return context.captured_queries
+
+    def assertQueriesDoNotScale(self, url, add_rows, extra_rows=5, client=None, using=DEFAULT_DB_ALIAS):
+        """
+        Fail if ``url`` runs more queries once ``add_rows(extra_rows)`` has
+        added rows that the endpoint returns.
+
+        The endpoint is requested once beforehand so one-off work such as
+        backend detection doesn't count against the baseline.
+        """
+        self.count_queries(url, client, using)
+        before = self.count_queries(url, client, using)
+        add_rows(extra_rows)
+        after = self.count_queries(url, client, using)
+        if len(after) != len(before):
+            queries = '\n'.join(f'  {query["sql"]}' for query in after)
+            self.fail(
+                f'GET {url} ran {len(before)} queries, then {len(after)} after adding '
+                f'{extra_rows} rows; the query count grows with the result size:\n{queries}'
+            )
@@ -0,0 +1,451 @@
+from django.db import connections, router, transaction
+from django.http import HttpResponse
+import datetime
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import CustomUser
+from products.models import Product
+from . import images, metrics, seeding, throttling
+from . import settings as project_settings
+from .renderers import FastJSONRenderer, orjson
+from .routers import PIN_COOKIE, ReplicaRoutingMiddleware, use_replica
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], DATABASE_REPLICA_STICKY_SECONDS=7)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Safe requests read from one replica; writers stick to the primary."""
+    databases = {'default'}
+
+    def dispatch(self, request):
+        seen = []
+
+        def view(request):
+            seen.append({router.db_for_read(Product) for _ in range(20)})
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen[0], response
+
+    def test_safe_request_reads_from_a_single_replica(self):
+        aliases, response = self.dispatch(RequestFactory().get('/'))
+        self.assertEqual(len(aliases), 1)
+        self.assertIn(aliases.pop(), ['replica1', 'replica2'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_pins_client_to_primary(self):
+        aliases, response = self.dispatch(RequestFactory().post('/'))
+        self.assertEqual(aliases, {'default'})
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 7)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.dispatch(request)[0], {'default'})
+
+    def test_writes_and_unrouted_reads_use_primary(self):
+        self.assertEqual(router.db_for_read(Product), 'default')
+        with use_replica():
+            self.assertEqual(router.db_for_write(Product), 'default')
+            replica = router.db_for_read(Product)
+            self.assertNotEqual(replica, 'default')
+            # Reads inside a transaction must see its uncommitted writes.
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Product), 'default')
+
+
+@skipIf(orjson is None, 'orjson is not installed')
+class SQLiteConnectionTests(SimpleTestCase):
+    """New SQLite connections get the configured pragmas; the env picks the connection profile."""
+
+    def test_new_connection_applies_pragmas(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_dict = {**connections['default'].settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+        connection = connections['default'].__class__(settings_dict, alias='pragma-test')
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('journal_mode', 'busy_timeout', 'synchronous')
+            }
+        self.assertEqual(pragmas, {
+            'journal_mode': 'wal',
+            'busy_timeout': project_settings.SQLITE_PRAGMAS['busy_timeout'],
+            # 0 OFF, 1 NORMAL, 2 FULL, 3 EXTRA
+            'synchronous': ['off', 'normal', 'full', 'extra'].index(project_settings.SQLITE_PRAGMAS['synchronous']),
+        })
+
+    def test_profile_from_environment(self):
+        names = ('DB_CONN_MAX_AGE', 'DB_CONN_HEALTH_CHECKS', 'SQLITE_TRANSACTION_MODE')
+        with mock.patch.dict(os.environ):
+            for name in names:
+                os.environ.pop(name, None)
+            database = project_settings.database('db.sqlite3')
+        self.assertEqual(
+            (database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS'], database['OPTIONS']['transaction_mode']),
+            (60, True, 'IMMEDIATE'),
+        )
+        with mock.patch.dict(os.environ, dict(zip(names, ('0', 'False', 'DEFERRED')))):
+            database = project_settings.database('db.sqlite3')
+        self.assertEqual(
+            (database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS'], database['OPTIONS']['transaction_mode']),
+            (0, False, 'DEFERRED'),
+        )
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """orjson output is byte-for-byte what JSONRenderer produces."""
+
+    def test_same_bytes(self):
+        data = {
+            'text': 'Caf\u00e9 \u2028 line \u2029 "quoted" \\ </script>',
+            'number': 3, 'float': 2.5, 'none': None, 'flag': True,
+            'decimal': Decimal('4.10'),
+            'when': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 5, 1),
+            'nested': [{'a': [1, 2]}, []],
+            'big': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indent_falls_back(self):
+        data = {'a': [1]}
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+class ImageRenditionTests(TestCase):
+    """Uploads get resized WebP/JPEG copies recorded in image_variants."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media, IMAGE_RENDITIONS={'WIDTHS': (100, 300, 1000), 'WORKERS': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name, size=(400, 200)):
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 10, 10, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def create_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(name='Boot', slug='boot', description='d', price='1.00', **kwargs)
+
+    def test_renditions_are_generated_on_upload(self):
+        product = self.create_product(image=self.upload('boot.png'))
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        # Never wider than the 400px original.
+        self.assertEqual(sorted(variants['webp'], key=int), ['100', '300'])
+        with default_storage.open(variants['jpeg']['300']) as rendition, Image.open(rendition) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (300, 150)))
+        with default_storage.open(variants['webp']['100']) as rendition, Image.open(rendition) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (100, 50)))
+
+        urls = self.client.get('/api/products/products/').json()['results'][0]['image_variants']
+        self.assertEqual(urls['webp']['300'], f"http://testserver/media/{variants['webp']['300']}")
+        self.assertEqual(self.client.get('/api/products/products/boot/').json()['image_variants'], urls)
+
+    def test_identical_uploads_share_renditions(self):
+        first = self.create_product(image=self.upload('a.png'))
+        with self.captureOnCommitCallbacks(execute=True):
+            second = Product.objects.create(name='Shoe', slug='shoe', description='d', price='1.00', image=self.upload('b.png'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_variants['webp'], second.image_variants['webp'])
+
+    def test_results_for_replaced_images_are_discarded(self):
+        product = self.create_product(image=self.upload('boot.png'))
+        old_name = product.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = self.upload('new.png', size=(120, 60))
+            product.save()
+        self.assertFalse(images.store(Product, product.pk, old_name, {'source': old_name}))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        self.assertEqual(list(product.image_variants['jpeg']), ['100'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = None
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+
+    def test_default_avatar_is_not_rendered_per_profile(self):
+        with self.assertNoLogs('ecommerce.images'), self.captureOnCommitCallbacks(execute=True):
+            user = CustomUser.objects.create_user(email='new@example.com', password='pass')
+        profile = user.profile
+        self.assertEqual(profile.profile_image.name, 'profile_images/default_avatar.png')
+        self.assertFalse(images.needs_renditions(profile))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_image = self.upload('me.png')
+            profile.save()
+        profile.refresh_from_db()
+        self.assertIn('webp', profile.image_variants)
+
+        # Back to the default: the old renditions are dropped.
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.profile_image = 'profile_images/default_avatar.png'
+            profile.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.image_variants, {})
+
+
+def png_header(width, height):
+    """The start of a PNG claiming ``width`` x ``height`` pixels, up to its first IDAT chunk."""
+    def chunk(data):
+        return struct.pack('>I', len(data) - 4) + data + struct.pack('>I', zlib.crc32(data))
+    ihdr = b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(ihdr) + chunk(b'IDAT' + zlib.compress(b''))
+
+
+@override_settings(FILE_UPLOAD_LIMITS={'MAX_IMAGE_BYTES': 64 * 1024, 'MAX_IMAGE_PIXELS': 1_000_000, 'MAX_IMAGE_SIDE': 2000})
+class UploadHandlerTests(TestCase):
+    """Image uploads are checked while they stream, before Pillow decodes them."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media, IMAGE_RENDITIONS={'WORKERS': 0})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def register(self, content, name='me.png'):
+        return self.client.post('/api/auth/register/', {
+            'email': 'new@example.com', 'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!',
+            'profile_image': SimpleUploadedFile(name, content, content_type='image/png'),
+        })
+
+    def assertRejected(self, response, reason):
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'profile_image: {reason}', response.json()['detail'])
+        self.assertFalse(CustomUser.objects.exists())
+
+    def test_valid_image_is_stored(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), (10, 120, 200)).save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.register(buffer.getvalue())
+        self.assertEqual(response.status_code, 201)
+        profile = CustomUser.objects.get().profile
+        with profile.profile_image.open() as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (300, 200))
+
+    def test_oversized_file_is_rejected(self):
+        self.assertRejected(self.register(png_header(100, 100) + bytes(128 * 1024)), 'File is larger than 65536 bytes.')
+
+    def test_non_image_is_rejected(self):
+        self.assertRejected(self.register(b'<?php echo 1; ?>' * 10), 'Upload a valid image')
+
+    def test_decompression_bomb_is_rejected_from_its_header(self):
+        self.assertRejected(self.register(png_header(1500, 1500)), 'Image is 1500x1500 pixels')
+        # Far beyond Pillow's own limit, which raises instead of warning.
+        self.assertRejected(self.register(png_header(60000, 60000)), 'Image dimensions exceed the limits.')
+
+    def test_other_files_get_the_general_limit(self):
+        with override_settings(FILE_UPLOAD_LIMITS={'MAX_FILE_BYTES': 100}):
+            response = self.client.post('/api/auth/register/', {'email': 'x@example.com', 'attachment': SimpleUploadedFile('a.csv', b'x' * 200)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('attachment: File is larger than 100 bytes.', response.json()['detail'])
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False}, DATABASE_REPLICAS=[])
+class RequestMetricsTests(TestCase):
+    """Requests report their timings and feed the per-route histograms."""
+
+    def setUp(self):
+        metrics.registry.reset()
+        Product.objects.create(name='Boot', slug='boot', description='d', price='1.00')
+
+    def server_timing(self, response):
+        return dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+
+    @override_settings(REQUEST_METRICS={'SERVER_TIMING': True})
+    def test_request_is_measured(self):
+        response = self.client.get('/api/products/products/')
+        timing = self.server_timing(response)
+        self.assertEqual(list(timing), ['db', 'serialize', 'render', 'total'])
+        self.assertRegex(timing['db'], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+
+        self.client.get('/api/async/products/')
+        self.client.get('/api/products/products/boot/')
+        routes = metrics.registry.snapshot()['routes']
+        self.assertEqual(set(routes), {'ProductViewSet.list', 'ProductViewSet.retrieve', 'ProductListView.get'})
+        listed = routes['ProductViewSet.list']
+        self.assertEqual(listed['count'], 1)
+        self.assertEqual(listed['bytes_avg'], len(response.content))
+        self.assertGreater(listed['queries_avg'], 0)
+        self.assertGreater(listed['serialize_ms_avg'], 0)
+        self.assertGreater(listed['render_ms_avg'], 0)
+        self.assertEqual(sum(listed['histogram'].values()), 1)
+        self.assertGreater(routes['ProductListView.get']['render_ms_avg'], 0)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        CustomUser.objects.create_user(email='admin@example.com', password='pass', is_active=True, role='admin')
+        self.client.post('/api/auth/login/', {'email': 'admin@example.com', 'password': 'pass'}, content_type='application/json')
+        self.client.get('/api/products/products/')
+        data = self.client.get('/api/metrics/').json()
+        self.assertEqual(data['routes']['ProductViewSet.list']['count'], 1)
+        self.assertIn('hit_ratio', data['catalog_cache'])
+
+        self.assertEqual(self.client.delete('/api/metrics/').status_code, 204)
+        # Only the resetting request itself is left.
+        self.assertEqual(list(metrics.registry.snapshot()['routes']), ['MetricsView.delete'])
+
+    def test_server_timing_is_off_by_default(self):
+        response = self.client.get('/api/products/products/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.snapshot()['routes']['ProductViewSet.list']['count'], 1)
+
+    @override_settings(REQUEST_METRICS={'ENABLED': False})
+    def test_disabled_middleware_leaves_the_chain(self):
+        response = self.client.get('/api/products/products/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.snapshot()['routes'], {})
+
+
+class SeedAndBenchTests(TestCase):
+    """Seeded data is complete and bench_api fails on regressions against a baseline."""
+
+    def setUp(self):
+        self.result = seeding.seed_catalog(categories=3, products=30, users=5, reviews=40, seed=7)
+
+    def test_seed_creates_consistent_rows(self):
+        self.assertEqual((self.result.categories, self.result.products, self.result.users, self.result.reviews), (3, 30, 5, 40))
+        users = seeding.seeded_users()
+        self.assertEqual(users.filter(profile__isnull=False).count(), 5)
+        self.assertTrue(users.first().check_password(seeding.PASSWORD))
+        product = Product.objects.filter(rating_count__gt=0).first()
+        self.assertEqual(product.rating_count, product.reviews.count())
+
+        seeding.clear_seed()
+        self.assertFalse(Product.objects.exists() or seeding.seeded_users().exists())
+
+    def test_bench_compares_against_baseline(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        path = f'{workdir}/baseline.json'
+        options = {'endpoints': 'products-list,reviews,refresh', 'requests': 3, 'warmup': 1, 'stdout': io.StringIO()}
+        with override_settings(DATABASE_REPLICAS=[]):
+            call_command('bench_api', save_baseline=path, **options)
+            with open(path) as f:
+                report = json.load(f)
+            self.assertEqual([r['endpoint'] for r in report['endpoints']], ['products-list', 'reviews', 'refresh'])
+            self.assertEqual([r['errors'] for r in report['endpoints']], [0, 0, 0])
+
+            call_command('bench_api', baseline=path, latency_tolerance=1000, **options)
+            report['endpoints'][0]['queries'] -= 1
+            with open(path, 'w') as f:
+                json.dump(report, f)
+            with self.assertRaisesMessage(CommandError, '1 regression(s)'):
+                call_command('bench_api', baseline=path, latency_tolerance=1000, stderr=io.StringIO(), **options)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        name.replace('__', '.'): rate for name, rate in rates.items()
+    }})
+
+
+class ThrottlingTests(TestCase):
+    """Auth and write endpoints are rate limited per client, email and role."""
+
+    def setUp(self):
+        for email, role in (('shopper@example.com', 'customer'), ('admin@example.com', 'admin')):
+            CustomUser.objects.create_user(email=email, password='pass', is_active=True, role=role)
+        Product.objects.create(name='Boot', slug='boot', description='d', price='1.00')
+
+    def login(self, email='shopper@example.com', ip='10.0.0.1', password='pass'):
+        # Anonymous, so the request is counted per IP rather than per user.
+        self.client.cookies.clear()
+        return self.client.post('/api/auth/login/', {'email': email, 'password': password},
+                                content_type='application/json', REMOTE_ADDR=ip)
+
+    def test_sliding_window(self):
+        self.assertEqual(throttling.parse_rate('5/15m'), (5, 900))
+        # Half of a full previous window still counts.
+        self.assertEqual(throttling.sliding_window(10, 4, 30, 10, 60), 0)
+        self.assertEqual(throttling.sliding_window(10, 5, 30, 10, 60), 6)
+        # Over the limit within this window: wait for the next one to discount it enough.
+        self.assertEqual(throttling.sliding_window(0, 10, 50, 10, 60), 10 + 6)
+
+    @throttle_rates(login='2/m')
+    def test_login_is_limited_per_ip_with_retry_after(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login(password='wrong').status_code, 400)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        # Until half of the next window has passed, the two counted logins still weigh more than one.
+        self.assertTrue(30 <= int(response['Retry-After']) <= 90)
+        self.assertEqual(self.login(ip='10.0.0.2').status_code, 200)
+
+    @throttle_rates(register='2/m')
+    def test_forwarded_for_does_not_change_the_client(self):
+        statuses = [
+            self.client.post('/api/auth/register/', {}, content_type='application/json',
+                             HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses[2], 429, statuses)
+
+    @throttle_rates(login='100/m', login__email='2/m', password_reset__email='1/h')
+    def test_email_is_limited_across_ips(self):
+        self.assertEqual(self.login(ip='10.0.0.1').status_code, 200)
+        self.assertEqual(self.login(ip='10.0.0.2').status_code, 200)
+        self.assertEqual(self.login(ip='10.0.0.3').status_code, 429)
+        self.assertEqual(self.login(email='admin@example.com', ip='10.0.0.3').status_code, 200)
+
+        reset = {'email': 'shopper@example.com'}
+        self.assertEqual(self.client.post('/api/auth/password_reset/', reset).status_code, 200)
+        self.assertEqual(self.client.post('/api/auth/password_reset/', reset).status_code, 429)
+
+    @throttle_rates(write='1/m', write__admin='3/m')
+    def test_admins_get_the_role_rate(self):
+        self.login()
+        review = {'rating': 5, 'comment': 'Great'}
+        self.assertEqual(self.client.post('/api/products/products/boot/reviews/', review).status_code, 201)
+        self.assertEqual(self.client.post('/api/products/products/boot/reviews/', review).status_code, 429)
+        # Reads have no rate.
+        self.assertEqual(self.client.get('/api/products/products/boot/reviews/').status_code, 200)
+
+        self.login(email='admin@example.com')
+        for i in range(3):
+            self.assertEqual(self.client.post('/api/products/categories/', {'name': f'C{i}', 'slug': f'c{i}'}).status_code, 201)
+        self.assertEqual(self.client.post('/api/products/categories/', {'name': 'C9', 'slug': 'c9'}).status_code, 429)
+
+    @throttle_rates(login='1/m')
+    @override_settings(THROTTLING={'STORE': 'cache'})
+    def test_shared_cache_store(self):
+        self.assertIsInstance(throttling.get_store(), throttling.CacheStore)
+        self.assertEqual(self.login(ip='10.9.9.9').status_code, 200)
+        self.assertEqual(self.login(ip='10.9.9.9').status_code, 429)
+
+    @throttle_rates(login='1/m')
+    @override_settings(THROTTLING={'ENABLED': False})
+    def test_disabled(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login().status_code, 200)
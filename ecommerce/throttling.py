@@ -0,0 +1,229 @@
+"""
+Sliding-window rate limits for the API.
+
+Each limit is a rate in ``REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']``, looked
+up by the view's scope. The scope is the view's ``throttle_scope``, or
+``read``/``write`` by request method, and a scope without a rate is not
+limited. Rates are ``<requests>/<period>``, where the period is ``s``, ``m``,
+``h`` or ``d`` with an optional multiplier, e.g. ``5/15m``.
+
+* ``ClientRateThrottle`` limits each client, by user for authenticated
+  requests and by IP address otherwise. An authenticated user's rate is
+  ``<scope>.<role>`` when that is configured, e.g. ``write.admin``. ``None``
+  there means no limit.
+* ``EmailRateThrottle`` limits requests naming the same ``email`` in the
+  body under ``<scope>.email``, however many addresses they come from.
+
+Counts use the sliding window counter: the current fixed window plus the
+previous one weighted by how much of it still overlaps the sliding window.
+That is O(1) in time and memory per key. A rejected request gets a 429 with
+``Retry-After`` set to the exact wait until the next request fits.
+
+The counters live in this process by default (``THROTTLING['STORE'] =
+'local'``), in a bounded LRU. With several workers, ``'cache'`` keeps them
+in the ``THROTTLING['CACHE_ALIAS']`` cache instead, e.g. Redis, so the
+limits are global.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    'ENABLED': True,
+    'STORE': 'local',
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'throttle',
+    # Keys the local store keeps before dropping the least recently used.
+    'MAX_ENTRIES': 100_000,
+}
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])[a-z]*\s*$')
+
+
+def get_options():
+    return {**DEFAULTS, **getattr(settings, 'THROTTLING', {})}
+
+
+def parse_rate(rate):
+    """``'5/15m'`` -> ``(5, 900)``."""
+    match = RATE.match(rate)
+    if match is None:
+        raise ImproperlyConfigured(f'Invalid throttle rate {rate!r}; expected e.g. "10/m" or "5/15m".')
+    count, multiplier, period = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[period]
+
+
+def sliding_window(previous, current, elapsed, limit, window):
+    """
+    Decide one request from the counts of the previous and current windows.
+
+    ``elapsed`` is the time since the current window started. Returns 0 if
+    the request fits, else the seconds until it would.
+    """
+    if limit <= 0:
+        return window
+    weight = (window - elapsed) / window
+    if previous * weight + current + 1 <= limit:
+        return 0
+    free = limit - 1 - current
+    if free >= 0 and previous:
+        # Enough of the previous window slides out before this one ends.
+        return max(window - elapsed - free * window / previous, 0)
+    # Wait for the next window, in which the current count is the previous one.
+    return (window - elapsed) + max(window - (limit - 1) * window / current, 0)
+
+
+class LocalStore:
+    """Per-process counters in a bounded LRU: key -> [window index, previous, current]."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        index, elapsed = divmod(now, window)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = self._data[key] = [index, 0, 0]
+            else:
+                self._data.move_to_end(key)
+                if entry[0] != index:
+                    entry[1] = entry[2] if entry[0] == index - 1 else 0
+                    entry[0], entry[2] = index, 0
+            wait = sliding_window(entry[1], entry[2], elapsed, limit, window)
+            if not wait:
+                entry[2] += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return wait
+
+
+class CacheStore:
+    """Counters shared between processes through a Django cache, one key per window."""
+
+    def __init__(self, alias, prefix):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def hit(self, key, limit, window, now):
+        index, elapsed = divmod(now, window)
+        current_key, previous_key = f'{self.prefix}:{key}:{index:.0f}', f'{self.prefix}:{key}:{index - 1:.0f}'
+        counts = self.cache.get_many([previous_key, current_key])
+        wait = sliding_window(counts.get(previous_key, 0), counts.get(current_key, 0), elapsed, limit, window)
+        if not wait:
+            # The key must outlive the next window, which still reads it.
+            self.cache.add(current_key, 0, timeout=math.ceil(2 * window))
+            try:
+                self.cache.incr(current_key)
+            except ValueError:
+                # Expired in between.
+                self.cache.set(current_key, 1, timeout=math.ceil(2 * window))
+        return wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = get_options()
+                if options['STORE'] == 'cache':
+                    _store = CacheStore(options['CACHE_ALIAS'], options['KEY_PREFIX'])
+                else:
+                    _store = LocalStore(options['MAX_ENTRIES'])
+    return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting in ('THROTTLING', 'REST_FRAMEWORK', 'CACHES'):
+        _store = None
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Base class: subclasses pick the rate name and the identity to count."""
+    timer = time.time
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def get_rate_and_ident(self, request, view, scope):
+        """``(rate name, identity)`` to count the request under, or ``None`` to let it through."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        if not get_options()['ENABLED']:
+            return True
+        scope = self.get_scope(request, view)
+        found = self.get_rate_and_ident(request, view, scope)
+        if found is None:
+            return True
+        name, ident = found
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(name)
+        if rate is None:
+            return True
+        limit, window = parse_rate(rate)
+        wait = get_store().hit(f'{name}:{ident}', limit, window, self.timer())
+        if wait:
+            self.retry_after = wait
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class ClientRateThrottle(SlidingWindowThrottle):
+    """``<scope>`` per IP address or user; ``<scope>.<role>`` for authenticated users when set."""
+
+    def get_rate_and_ident(self, request, view, scope):
+        user = request.user
+        if user and user.is_authenticated:
+            role_rate = f"{scope}.{getattr(user, 'role', None)}"
+            if role_rate in api_settings.DEFAULT_THROTTLE_RATES:
+                return role_rate, f'user:{user.pk}'
+            return scope, f'user:{user.pk}'
+        return scope, f'ip:{self.get_ident(request)}'
+
+
+class EmailRateThrottle(SlidingWindowThrottle):
+    """``<scope>.email`` per email address in the request body."""
+
+    def get_rate_and_ident(self, request, view, scope):
+        name = f'{scope}.email'
+        if name not in api_settings.DEFAULT_THROTTLE_RATES:
+            return None
+        try:
+            email = request.data.get('email')
+        except AttributeError:
+            # A body that is not a mapping, e.g. a JSON list.
+            return None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        digest = hashlib.sha256(email.strip().lower().encode()).hexdigest()[:32]
+        return name, f'email:{digest}'
@@ -0,0 +1,121 @@
+"""
+Upload validation while the request body streams in.
+
+``LimitedUploadHandler`` sits first in ``FILE_UPLOAD_HANDLERS`` and passes
+every chunk on to ``TemporaryFileUploadHandler``, which spools accepted
+files to disk. Along the way it counts bytes and, for image fields, sniffs
+the first chunks of the file for the format and pixel dimensions. Pillow
+only has to parse the header for that, so no bitmap is allocated. A file
+over its byte limit, in a format that is not allowed, or whose dimensions
+exceed the limits (a decompression bomb declares huge dimensions in a tiny
+file) is rejected on the chunk that gives it away. The rest of the body is
+never stored, and the partial temporary file is removed.
+
+Rejections raise ``UploadRejected``. DRF turns it into a 400 response with
+the reason; plain Django views answer 400 as for any suspicious request.
+"""
+import io
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousOperation
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from PIL import Image, UnidentifiedImageError
+
+DEFAULTS = {
+    # Multipart field names that must carry an image.
+    'IMAGE_FIELDS': ('image', 'profile_image'),
+    'IMAGE_FORMATS': ('JPEG', 'PNG', 'WEBP', 'GIF'),
+    'MAX_IMAGE_BYTES': 10 * 1024 * 1024,
+    'MAX_IMAGE_PIXELS': 40_000_000,
+    'MAX_IMAGE_SIDE': 10_000,
+    # Any other file, e.g. a product import.
+    'MAX_FILE_BYTES': 200 * 1024 * 1024,
+    # How much of an image is read looking for its header before giving up.
+    'SNIFF_BYTES': 256 * 1024,
+}
+
+
+class UploadRejected(MultiPartParserError, SuspiciousOperation):
+    pass
+
+
+def get_upload_limits():
+    return {**DEFAULTS, **getattr(settings, 'FILE_UPLOAD_LIMITS', {})}
+
+
+def sniff_image(head, formats):
+    """
+    Return ``(format, width, height)`` read from the start of an image file.
+
+    Returns ``None`` while ``head`` does not (yet) hold a header Pillow can
+    parse in one of ``formats``. Pillow raises ``DecompressionBombError`` for
+    dimensions far beyond its own limit.
+    """
+    with warnings.catch_warnings():
+        # The pixel limits are checked by the caller.
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        try:
+            with Image.open(io.BytesIO(head), formats=formats) as image:
+                return image.format, image.width, image.height
+        except (UnidentifiedImageError, OSError, SyntaxError, ValueError, EOFError):
+            return None
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Enforce byte limits and image header checks chunk by chunk."""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.limits = get_upload_limits()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.is_image = field_name in self.limits['IMAGE_FIELDS']
+        self.max_bytes = self.limits['MAX_IMAGE_BYTES'] if self.is_image else self.limits['MAX_FILE_BYTES']
+        self.head = b''
+        self.sniffed = not self.is_image
+        # Nothing has been stored for this file yet.
+        self.in_progress = False
+        if content_length and content_length > self.max_bytes:
+            self.reject(f'File is larger than {self.max_bytes} bytes.')
+        self.in_progress = True
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            self.reject(f'File is larger than {self.max_bytes} bytes.')
+        if not self.sniffed:
+            self.head += raw_data[:self.limits['SNIFF_BYTES'] - len(self.head)]
+            self.check_image(final=len(self.head) >= self.limits['SNIFF_BYTES'])
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.sniffed:
+            self.check_image(final=True)
+        self.in_progress = False
+        # The next handler builds the uploaded file.
+        return None
+
+    def check_image(self, final):
+        try:
+            found = sniff_image(self.head, self.limits['IMAGE_FORMATS'])
+        except Image.DecompressionBombError:
+            self.reject('Image dimensions exceed the limits.')
+        if found is None:
+            if final:
+                self.reject(f"Upload a valid image ({', '.join(self.limits['IMAGE_FORMATS'])}).")
+            return
+        format, width, height = found
+        if width * height > self.limits['MAX_IMAGE_PIXELS'] or max(width, height) > self.limits['MAX_IMAGE_SIDE']:
+            self.reject(f'Image is {width}x{height} pixels, which exceeds the limits.')
+        self.sniffed = True
+        self.head = b''
+
+    def reject(self, message):
+        if self.in_progress:
+            # Drop what the storing handlers have written for this file so far.
+            for handler in self.request.upload_handlers:
+                if handler is not self:
+                    handler.upload_interrupted()
+        raise UploadRejected(f'{self.field_name}: {message}')
@@ -3,8 +3,13 @@ from django.urls import path,include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from .metrics import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
     path('api/products/', include('products.urls')),
+    # Async (ASGI) versions of the catalog read endpoints.
+    path('api/async/', include('products.async_urls')),
+    path('api/metrics/', MetricsView.as_view(), name='request-metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
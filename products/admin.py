@@ -1,6 +1,19 @@
 from django.contrib import admin
-from .models import Category, Product, Review
+from .models import Category, Product, Reservation, ReservationItem, Review
 # Register your models here.
 admin.site.register(Category)
 admin.site.register(Product)
-admin.site.register(Review)
\ No newline at end of file
+admin.site.register(Review)
+
+
+class ReservationItemInline(admin.TabularInline):
+    model = ReservationItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'expires_at', 'created_at')
+    list_filter = ('status',)
+    inlines = [ReservationItemInline]
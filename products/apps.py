@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from ecommerce import images
+        from . import signals
+        post_migrate.connect(signals.restore_search_triggers, sender=self)
+        images.register(self.get_model('Product'), 'image')
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from .async_views import CategoryListView, ProductDetailView, ProductListView, ReviewListView
+
+urlpatterns = [
+    path('products/', ProductListView.as_view(), name='async-product-list'),
+    path('products/<slug:slug>/', ProductDetailView.as_view(), name='async-product-detail'),
+    path('products/<slug:product_slug>/reviews/', ReviewListView.as_view(), name='async-product-reviews-list'),
+    path('categories/', CategoryListView.as_view(), name='async-category-list'),
+]
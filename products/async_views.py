@@ -0,0 +1,130 @@
+"""
+Async versions of the catalog read endpoints.
+
+Under ASGI every sync DRF view runs in a worker thread through
+``sync_to_async``. These views run on the event loop instead, and only the
+queries go through the async ORM (``aiterator``, ``aget``). Each one returns
+the same JSON as its DRF counterpart. The filter backends and
+``KeysetPagination`` are reused as they are, because they only build
+querysets. Lists are encoded from ``values()`` rows (see ``rows.py``), and
+the detail queryset preloads everything its serializer reads, so
+serializing is plain CPU work. A lazy load that slipped through would raise
+``SynchronousOnlyOperation`` instead of blocking the loop.
+
+The response cache and conditional GET of the DRF viewsets are not applied
+here; these views serve the read path straight from the database.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import filters
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from ecommerce.metrics import timed
+
+from .filters import FullTextSearchFilter, ProductFilter
+from .models import Category, Product, Review
+from .pagination import KeysetPagination
+from .rows import CategoryRowSerializer, ProductRowSerializer, ReviewRowSerializer, row_columns
+from .serializers import ProductDetailSerializer
+from .views import PRODUCT_DETAIL_FIELDS, ProductViewSet
+
+
+class AsyncReadView(View):
+    """Base for async read-only JSON endpoints that mirror a DRF view."""
+    http_method_names = ['get', 'head', 'options']
+    serializer_class = None
+    row_serializer_class = None
+    filter_backends = ()
+    # Backends that may query the database while filtering; they run in a thread.
+    blocking_filter_backends = (FullTextSearchFilter,)
+    pagination_class = KeysetPagination
+
+    async def dispatch(self, request, *args, **kwargs):
+        # The DRF wrapper provides ``query_params`` for the backends and the
+        # paginator. Authentication is never triggered: these endpoints are public.
+        try:
+            return await super().dispatch(Request(request), *args, **kwargs)
+        except Http404 as exc:
+            return self.render({'detail': str(exc)}, status=404)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return self.render(detail, status=exc.status_code)
+
+    def get_serializer(self, *args, **kwargs):
+        return self.serializer_class(*args, context={'request': kwargs.pop('request')}, **kwargs)
+
+    async def filter_queryset(self, request, queryset):
+        for backend_class in self.filter_backends:
+            backend = backend_class()
+            if isinstance(backend, self.blocking_filter_backends):
+                queryset = await sync_to_async(backend.filter_queryset)(request, queryset, self)
+            else:
+                queryset = backend.filter_queryset(request, queryset, self)
+        return queryset
+
+    async def list_response(self, request, queryset):
+        row_serializer = self.row_serializer_class(context={'request': request})
+        paginator = self.pagination_class()
+        queryset = await self.filter_queryset(request, queryset)
+        queryset = queryset.values(*row_columns(self, row_serializer, paginator))
+
+        page = await paginator.apaginate_queryset(queryset, request, view=self)
+        if page is None:
+            rows = [row async for row in queryset.aiterator()]
+            with timed('serialize'):
+                return self.render(row_serializer.to_representation(rows))
+        with timed('serialize'):
+            data = paginator.get_paginated_response(row_serializer.to_representation(page)).data
+        return self.render(data)
+
+    def render(self, data, status=200):
+        # Same body and Content-Type as a DRF Response rendered with the
+        # default (JSON) renderer.
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+        with timed('render'):
+            content = renderer.render(data)
+        return HttpResponse(content, status=status, content_type=renderer.media_type)
+
+
+class ProductListView(AsyncReadView):
+    row_serializer_class = ProductRowSerializer
+    filter_backends = ProductViewSet.filter_backends
+    filterset_class = ProductFilter
+    search_fields = ProductViewSet.search_fields
+    ordering_fields = ProductViewSet.ordering_fields
+    ordering = ProductViewSet.ordering
+
+    async def get(self, request):
+        return await self.list_response(request, Product.objects.all())
+
+
+class ProductDetailView(AsyncReadView):
+    serializer_class = ProductDetailSerializer
+
+    async def get(self, request, slug):
+        queryset = Product.objects.select_related('category').only(*PRODUCT_DETAIL_FIELDS, 'category__slug')
+        try:
+            product = await queryset.aget(slug=slug)
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+        return self.render(self.get_serializer(product, request=request).data)
+
+
+class CategoryListView(AsyncReadView):
+    row_serializer_class = CategoryRowSerializer
+    filter_backends = (filters.SearchFilter,)
+    search_fields = ('name', 'description')
+    ordering = ('name',)
+
+    async def get(self, request):
+        return await self.list_response(request, Category.objects.all())
+
+
+class ReviewListView(AsyncReadView):
+    row_serializer_class = ReviewRowSerializer
+
+    async def get(self, request, product_slug):
+        return await self.list_response(request, Review.objects.filter(product__slug=product_slug))
@@ -0,0 +1,231 @@
+"""
+Streaming bulk import and export of products as CSV or NDJSON.
+
+Rows are read, validated and written one chunk at a time, so memory stays
+flat however large the file is. Validation uses the model fields directly
+rather than a serializer per row. Categories are resolved from a single
+preloaded ``slug -> id`` map. Each chunk is one upsert keyed on ``slug``:
+``bulk_create(update_conflicts=True)`` inserts new products and updates
+existing ones in a single statement.
+
+``bulk_create`` does not send ``post_save``, so ``ProductImporter`` applies
+each chunk's category count changes itself, and bumps the catalog cache and
+reloads the in-process search indexes once it has finished.
+The FTS5 index is kept up to date by its triggers.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import categories, search
+from .cache import invalidate_model
+from .models import Category, Product
+
+FIELDS = ('slug', 'name', 'description', 'price', 'category', 'stock', 'available')
+# Columns overwritten when an imported slug already exists.
+UPDATE_FIELDS = ('name', 'description', 'price', 'category', 'stock', 'available', 'updated_at')
+FORMATS = ('csv', 'ndjson')
+BOOLEAN_STRINGS = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False,
+}
+
+
+def guess_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_csv(stream):
+    """Yield ``(line number, row)`` pairs from a text stream with a header row."""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(stream):
+    """Yield ``(line number, row)`` pairs, one JSON object per line."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = ValidationError(f'Invalid JSON: {exc}')
+        else:
+            if not isinstance(row, dict):
+                row = ValidationError('Expected a JSON object.')
+        yield line_number, row
+
+
+def read_rows(stream, format):
+    if format == 'ndjson':
+        return read_ndjson(stream)
+    return read_csv(stream)
+
+
+def text_stream(binary):
+    """Wrap an uploaded or opened binary file for line-by-line decoding."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        # Only the first few are kept so a bad file cannot grow the report
+        # without bound.
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+class ProductImporter:
+    """Validate and upsert product rows in chunks of ``batch_size``."""
+
+    def __init__(self, batch_size=1000, using=DEFAULT_DB_ALIAS, max_errors=1000):
+        self.batch_size = batch_size
+        self.using = using
+        self.max_errors = max_errors
+        self.fields = {name: Product._meta.get_field(name) for name in FIELDS if name != 'category'}
+        self.category_ids = None
+
+    def clean_row(self, row):
+        """Return ``(product, errors)`` for one raw row."""
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            value = row.get(name)
+            if value in (None, '') and field.has_default():
+                values[name] = field.get_default()
+                continue
+            if name == 'available' and isinstance(value, str):
+                value = BOOLEAN_STRINGS.get(value.strip().lower(), value)
+            try:
+                values[name] = field.clean('' if value is None else value, None)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+
+        category_slug = row.get('category') or None
+        if category_slug is None:
+            values['category_id'] = None
+        elif category_slug in self.category_ids:
+            values['category_id'] = self.category_ids[category_slug]
+        else:
+            errors['category'] = [f'Unknown category "{category_slug}".']
+
+        if errors:
+            return None, errors
+        return Product(**values), None
+
+    def run(self, rows):
+        result = ImportResult(self.max_errors)
+        self.category_ids = dict(Category.objects.using(self.using).values_list('slug', 'id'))
+        rows = iter(rows)
+        try:
+            while True:
+                chunk = list(islice(rows, self.batch_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk, result)
+        finally:
+            if result.created or result.updated:
+                invalidate_model(Product, using=self.using)
+                search.reset_search_engines()
+        return result
+
+    def import_chunk(self, chunk, result):
+        # Later rows win when a slug repeats inside one chunk; a single
+        # upsert statement cannot touch the same row twice.
+        products = {}
+        for line, row in chunk:
+            if isinstance(row, ValidationError):
+                result.add_error(line, {'row': row.messages})
+                continue
+            product, errors = self.clean_row(row)
+            if errors:
+                result.add_error(line, errors)
+            else:
+                products[product.slug] = product
+        if not products:
+            return
+
+        with transaction.atomic(using=self.using):
+            existing = {
+                slug: (category_id, available)
+                for slug, category_id, available in Product.objects.using(self.using)
+                .filter(slug__in=list(products)).values_list('slug', 'category_id', 'available')
+            }
+            Product.objects.using(self.using).bulk_create(
+                products.values(),
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=UPDATE_FIELDS,
+            )
+            # bulk_create sends no signals; move the category counts here.
+            categories.shift_counts(categories.listing_deltas(
+                (existing.get(slug), (product.category_id, product.available)) for slug, product in products.items()
+            ), using=self.using)
+        result.updated += len(existing)
+        result.created += len(products) - len(existing)
+
+
+def import_products(stream, format='csv', batch_size=1000, using=DEFAULT_DB_ALIAS, max_errors=1000):
+    importer = ProductImporter(batch_size=batch_size, using=using, max_errors=max_errors)
+    return importer.run(read_rows(stream, format))
+
+
+def export_rows(queryset, chunk_size=2000):
+    """Yield one plain dict per product, reading ``chunk_size`` rows at a time."""
+    columns = [name if name != 'category' else 'category__slug' for name in FIELDS]
+    rows = queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield dict(zip(FIELDS, row))
+
+
+class _Echo:
+    """A file-like object whose ``write`` hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset, chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in export_rows(queryset, chunk_size):
+        yield writer.writerow([
+            '' if row[name] is None else row[name] for name in FIELDS
+        ])
+
+
+def iter_ndjson(queryset, chunk_size=2000):
+    for row in export_rows(queryset, chunk_size):
+        row['price'] = str(row['price'])
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_export(queryset, format='csv', chunk_size=2000):
+    if format == 'ndjson':
+        return iter_ndjson(queryset, chunk_size)
+    return iter_csv(queryset, chunk_size)
@@ -0,0 +1,274 @@
+"""
+Read-through response cache for the catalog endpoints.
+
+Entries are never invalidated by deleting keys. Each cached model has a
+generation counter in the shared cache, and every response key embeds the
+current generations of the models it depends on. A write bumps the model's
+generation (see ``products.signals``), so later reads compute a different key
+and older entries simply stop being addressed until they age out.
+
+Lookups go through a bounded in-process LRU first, then the shared cache
+alias named in ``CATALOG_CACHE['ALIAS']`` (Redis or Memcached in
+production). The generations are only shared between workers if that alias
+is, which is why the settings leave the cache off with a per-process backend.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.dispatch import receiver
+from rest_framework.response import Response
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from ecommerce.routers import current_read_alias, replicas
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'LOCAL_MAX_ENTRIES': 1024,
+    'KEY_PREFIX': 'catalog',
+}
+
+
+class LRUCache:
+    """A thread-safe, size-bounded mapping with per-entry expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CatalogCache:
+    def __init__(self, options):
+        self.options = {**DEFAULTS, **options}
+        self.local = LRUCache(self.options['LOCAL_MAX_ENTRIES'])
+        self._stats_lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'bumps': 0}
+
+    @property
+    def enabled(self):
+        return self.options['ENABLED']
+
+    @property
+    def shared(self):
+        return caches[self.options['ALIAS']]
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        stats['local_entries'] = len(self.local)
+        return stats
+
+    def _generation_key(self, label):
+        return f"{self.options['KEY_PREFIX']}:gen:{label}"
+
+    def generations(self, labels):
+        """Current generation of each model label, creating missing counters."""
+        keys = {label: self._generation_key(label) for label in labels}
+        found = self.shared.get_many(keys.values())
+        generations = []
+        for label in labels:
+            value = found.get(keys[label])
+            if value is None:
+                # Seed from the clock so a counter that was evicted can never
+                # come back with a value an older entry was stored under.
+                self.shared.add(keys[label], time.time_ns(), timeout=None)
+                value = self.shared.get(keys[label])
+            generations.append(str(value))
+        return generations
+
+    def _recent_key(self, label):
+        return f"{self.options['KEY_PREFIX']}:recent:{label}"
+
+    def bump(self, label):
+        key = self._generation_key(label)
+        try:
+            self.shared.incr(key)
+        except ValueError:
+            self.shared.set(key, time.time_ns(), timeout=None)
+        lag_window = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 0) if replicas() else 0
+        if lag_window:
+            self.shared.set(self._recent_key(label), True, timeout=lag_window)
+        self._count('bumps')
+
+    def recently_bumped(self, labels):
+        """Whether any label was written within the replica lag window."""
+        return bool(self.shared.get_many([self._recent_key(label) for label in labels]))
+
+    def response_key(self, request, labels):
+        user = getattr(request, 'user', None)
+        role = getattr(user, 'role', None) if user is not None and user.is_authenticated else 'anonymous'
+        query = sorted(request.query_params.lists()) if hasattr(request, 'query_params') else sorted(request.GET.lists())
+        parts = [
+            request.scheme, request.get_host(), request.path, repr(query), role or '',
+            *self.generations(labels),
+        ]
+        digest = hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+        return f"{self.options['KEY_PREFIX']}:resp:{digest}"
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        value = self.shared.get(key)
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value, self.options['TIMEOUT'])
+            return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value, self.options['TIMEOUT'])
+        self.shared.set(key, value, self.options['TIMEOUT'])
+
+
+_catalog_cache = None
+_catalog_cache_lock = threading.Lock()
+
+
+def get_catalog_cache():
+    global _catalog_cache
+    if _catalog_cache is None:
+        with _catalog_cache_lock:
+            if _catalog_cache is None:
+                _catalog_cache = CatalogCache(getattr(settings, 'CATALOG_CACHE', {}))
+    return _catalog_cache
+
+
+@receiver(setting_changed)
+def reset_catalog_cache(setting, **kwargs):
+    global _catalog_cache
+    if setting in ('CATALOG_CACHE', 'CACHES'):
+        _catalog_cache = None
+
+
+def detach(data):
+    """
+    Copy serializer output into plain containers.
+
+    ``serializer.data`` keeps a reference to its serializer (and so to every
+    model instance it rendered), which must not be pinned in the LRU.
+    """
+    if isinstance(data, ReturnList):
+        return list(data)
+    if isinstance(data, ReturnDict):
+        return dict(data)
+    if isinstance(data, dict):
+        return {key: detach(value) for key, value in data.items()}
+    return data
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def invalidate_model(model, using=DEFAULT_DB_ALIAS):
+    """
+    Move ``model`` to a new generation.
+
+    Inside a transaction the generation is bumped now and again on commit: a
+    concurrent reader that cached pre-commit data under the first bump is
+    orphaned by the second.
+    """
+    cache = get_catalog_cache()
+    label = model_label(model)
+    cache.bump(label)
+    if connections[using].in_atomic_block:
+        transaction.on_commit(lambda: cache.bump(label), using=using)
+
+
+class CachedResponseMixin:
+    """
+    Serve ``list``/``retrieve`` from the catalog cache.
+
+    ``cache_models`` lists every model whose rows appear in the response;
+    a write to any of them invalidates the cached pages.
+    """
+    cache_models = ()
+
+    def get_cache_labels(self):
+        return [label.lower() for label in self.cache_models]
+
+    def get_response_cache_key(self, request):
+        # Views are instantiated per request, so this is computed at most once.
+        if getattr(self, '_response_cache_key', None) is None:
+            self._response_cache_key = get_catalog_cache().response_key(request, self.get_cache_labels())
+        return self._response_cache_key
+
+    def response_cacheable(self):
+        # A replica may not have caught up with a write that just moved these
+        # models to a new generation; caching its answer would pin stale data
+        # under the new key until the entry expires.
+        if getattr(self, '_response_cacheable', None) is None:
+            self._response_cacheable = (
+                current_read_alias() is None or not get_catalog_cache().recently_bumped(self.get_cache_labels())
+            )
+        return self._response_cacheable
+
+    def cached(self, handler, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        if not cache.enabled or request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            status_code, data = entry
+            response = Response(data, status=status_code)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and self.response_cacheable():
+            cache.set(key, (response.status_code, detach(response.data)))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
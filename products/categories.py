@@ -0,0 +1,236 @@
+"""
+The category tree: materialized paths and subtree product counts.
+
+A category's ``path`` is the ids of its ancestors and its own, each
+zero-padded to ``SEGMENT`` digits, from the root down. A subtree is every
+row whose path starts with the root's path. Paths are all digits, and digits
+sort before letters under every common collation, so that is one range on
+the path index::
+
+    path >= '00000000040000000007' AND path < '00000000040000000007a'
+
+The ancestor ids can be read back from a path without a query.
+
+``product_count`` and ``available_count`` cover a category's whole subtree.
+A product write turns into an ``UPDATE ... SET product_count =
+product_count + d`` of the category and its ancestors, issued inside the
+product's transaction, the same way ``products.ratings`` maintains review
+totals. Moving a category rewrites the paths of its subtree with one UPDATE
+and moves its totals from the old ancestors to the new ones. Both touch
+``updated_at`` of the rows they change, which the category ETags are built
+from.
+
+``bulk_create``, ``QuerySet.update()`` and raw SQL bypass the signals;
+callers that use them either apply the difference themselves (the product
+importer) or finish with ``rebuild_category_tree``.
+"""
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Q, Subquery, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+
+from .cache import invalidate_model
+from .models import Category, Product
+
+SEGMENT = 10
+# Appended to a path to get the upper bound of its subtree: sorts after any
+# digit that can follow it.
+SUBTREE_END = 'a'
+COUNT_FIELDS = ('product_count', 'available_count')
+TREE_FIELDS = ('id', 'name', 'slug', 'parent_id', 'product_count', 'available_count')
+
+
+def segment(pk):
+    return str(pk).zfill(SEGMENT)
+
+
+def ancestor_ids(path):
+    """The ids in ``path``, root first; the last one is the category itself."""
+    return [int(path[i:i + SEGMENT]) for i in range(0, len(path), SEGMENT)]
+
+
+def subtree_q(path, prefix=''):
+    """
+    The subtree rooted at ``path``, a string or an expression such as a
+    ``Subquery`` (which keeps the lookup lazy: building the filter runs no
+    query).
+    """
+    upper = path + SUBTREE_END if isinstance(path, str) else Concat(path, Value(SUBTREE_END))
+    return Q(**{f'{prefix}path__gte': path, f'{prefix}path__lt': upper})
+
+
+def slug_subtree_q(slug, prefix='', using=None):
+    """``subtree_q`` for the category with ``slug``, resolved inside the query; no rows if there is none."""
+    path = Subquery(Category.objects.using(using).filter(slug=slug).values('path')[:1])
+    return subtree_q(path, prefix)
+
+
+def stored_state(category, using=None):
+    """The ``(path, product_count, available_count)`` currently in the database, or None; read locked."""
+    return (
+        Category.objects.using(using).select_for_update()
+        .filter(pk=category.pk).values_list('path', *COUNT_FIELDS).first()
+    )
+
+
+def shift_counts(deltas, using=None):
+    """
+    Apply ``{category_id: (products, available)}`` to each category and all
+    of its ancestors: one query for the paths, then one UPDATE per distinct
+    difference.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and any(delta)}
+    if not deltas:
+        return
+    totals = defaultdict(lambda: [0, 0])
+    for pk, path in Category.objects.using(using).filter(pk__in=list(deltas)).values_list('pk', 'path'):
+        for ancestor in ancestor_ids(path):
+            totals[ancestor][0] += deltas[pk][0]
+            totals[ancestor][1] += deltas[pk][1]
+    shift_ancestors(totals, using=using)
+
+
+def shift_ancestors(totals, using=None):
+    groups = defaultdict(list)
+    for pk, (products, available) in totals.items():
+        if products or available:
+            groups[products, available].append(pk)
+    for (products, available), pks in groups.items():
+        Category.objects.using(using).filter(pk__in=pks).update(
+            product_count=F('product_count') + products,
+            available_count=F('available_count') + available,
+            updated_at=timezone.now(),
+        )
+    if groups:
+        invalidate_model(Category, using=using or DEFAULT_DB_ALIAS)
+
+
+def listing_deltas(changes):
+    """``[(old, new), ...]`` ``(category_id, available)`` pairs, None for no row, to count deltas."""
+    deltas = defaultdict(lambda: [0, 0])
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is not None and state[0] is not None:
+                deltas[state[0]][0] += sign
+                deltas[state[0]][1] += sign if state[1] else 0
+    return deltas
+
+
+def listed_state(product, using=None):
+    """
+    The ``(category_id, available)`` a stored product is currently counted
+    under, or None once its row is gone. Read with the row locked inside the
+    write's transaction, like ``products.ratings.counted_state``.
+    """
+    return (
+        Product.objects.using(using).select_for_update()
+        .filter(pk=product.pk).values_list('category_id', 'available').first()
+    )
+
+
+def product_saved(product, created, previous, using=None):
+    current = (product.category_id, product.available)
+    if created or previous != current:
+        shift_counts(listing_deltas([(None if created else previous, current)]), using=using)
+
+
+def product_deleted(product, listed, using=None):
+    """``listed`` is ``listed_state`` from before the delete; None if the row was already gone."""
+    shift_counts(listing_deltas([(listed, None)]), using=using)
+
+
+def category_saved(category, created, stored, using=None):
+    """
+    Set the path of a new category, or carry a moved category's subtree and
+    totals over to its new parent. ``stored`` is ``stored_state`` from
+    before the write.
+    """
+    parent_path = ''
+    if category.parent_id is not None:
+        parent_path = Category.objects.using(using).filter(pk=category.parent_id).values_list('path', flat=True).get()
+    path = parent_path + segment(category.pk)
+    old_path, products, available = stored or ('', 0, 0)
+    if path == old_path:
+        category.path = path
+        return
+    if old_path and path.startswith(old_path):
+        raise ValueError(f'Category {category.pk} cannot be moved under its own subtree.')
+
+    if old_path:
+        Category.objects.using(using).filter(subtree_q(old_path)).update(
+            path=Concat(Value(parent_path), Substr('path', len(old_path) - SEGMENT + 1)),
+            updated_at=timezone.now(),
+        )
+    else:
+        Category.objects.using(using).filter(pk=category.pk).update(path=path)
+    totals = {pk: (-products, -available) for pk in ancestor_ids(old_path)[:-1]}
+    for pk in ancestor_ids(parent_path):
+        totals[pk] = (totals.get(pk, (0, 0))[0] + products, totals.get(pk, (0, 0))[1] + available)
+    shift_ancestors(totals, using=using)
+    category.path = path
+    category.product_count, category.available_count = products, available
+
+
+def category_deleted(category, stored, using=None):
+    """Take a deleted category's totals off the ancestors that remain."""
+    if stored is None:
+        return
+    path, products, available = stored
+    ancestors = ancestor_ids(path)[:-1]
+    # Descendants deleted by the cascade find their parent gone; only the
+    # topmost deleted category still has an ancestor to subtract from.
+    if not ancestors or not Category.objects.using(using).filter(pk=ancestors[-1]).exists():
+        return
+    shift_ancestors({pk: (-products, -available) for pk in ancestors}, using=using)
+
+
+def rebuild_category_tree(using=None):
+    """
+    Recompute every category's path from the parent links and its totals
+    from ``Product``, in one transaction. Returns the number of categories.
+    """
+    with transaction.atomic(using=using):
+        categories = list(Category.objects.using(using).only('id', 'parent_id', 'path', *COUNT_FIELDS))
+        children = defaultdict(list)
+        for category in categories:
+            children[category.parent_id].append(category)
+        # Roots first, then each level under its parent; a cycle (possible
+        # only through raw writes) is never reached and keeps an empty path.
+        paths, pending = {}, [(category, '') for category in children[None]]
+        while pending:
+            category, parent_path = pending.pop()
+            paths[category.pk] = parent_path + segment(category.pk)
+            pending.extend((child, paths[category.pk]) for child in children[category.pk])
+
+        totals = defaultdict(lambda: [0, 0])
+        rows = (
+            Product.objects.using(using).filter(category__isnull=False).order_by()
+            .values_list('category_id').annotate(products=Count('pk'), available=Count('pk', filter=Q(available=True)))
+        )
+        for category_id, products, available in rows:
+            for pk in ancestor_ids(paths.get(category_id, '')):
+                totals[pk][0] += products
+                totals[pk][1] += available
+        for category in categories:
+            category.path = paths.get(category.pk, '')
+            category.product_count, category.available_count = totals.get(category.pk, (0, 0))
+        Category.objects.using(using).bulk_update(categories, ('path', *COUNT_FIELDS), batch_size=1000)
+        invalidate_model(Category, using=using or DEFAULT_DB_ALIAS)
+    return len(categories)
+
+
+def category_tree(queryset):
+    """
+    Every category in ``queryset`` as nested dicts, children by name, from
+    one query ordered by path (parents before their children).
+    """
+    nodes, roots = {}, []
+    for row in queryset.order_by('path').values(*TREE_FIELDS):
+        parent = nodes.get(row.pop('parent_id'))
+        node = nodes[row['id']] = {**row, 'children': []}
+        (parent['children'] if parent is not None else roots).append(node)
+    for siblings in [roots, *(node['children'] for node in nodes.values())]:
+        siblings.sort(key=lambda node: node['name'])
+    return roots
@@ -0,0 +1,132 @@
+"""
+Conditional GET (ETag / Last-Modified) for catalog viewsets.
+
+Validators are computed from the database without serializing anything:
+``(pk, updated_at)`` of the object for ``retrieve`` and
+``(max(updated_at), count)`` of the filtered queryset for ``list``, plus
+``(max(updated_at), count)`` of each model in ``validator_models`` whose rows
+are embedded in the payload (a renamed category changes every product that
+shows its slug). They are combined with the view's response cache key, which
+encodes the URL, query and role.
+
+The key also holds the model generations, but those only move for every
+worker when the catalog cache alias is shared; the database values keep the
+validators right when it is not.
+
+When the catalog cache is enabled the validators themselves are cached
+beside the response, so a matching revalidation costs no queries at all.
+"""
+import hashlib
+
+from django.apps import apps
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import get_catalog_cache
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+class ConditionalGetMixin:
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` with 304 before the
+    serializer runs. Expects ``CachedResponseMixin`` after it in the MRO.
+    """
+    last_modified_field = 'updated_at'
+    # Labels of the other models rendered into the response; changes to
+    # their rows must change the validators too.
+    validator_models = ()
+
+    def get_list_validator_source(self, request):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        aggregate = queryset.aggregate(last_modified=Max(self.last_modified_field), count=Count('pk'))
+        return aggregate['last_modified'], aggregate['count']
+
+    def get_detail_validator_source(self, request, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        row = (
+            queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+            .values_list(self.last_modified_field, 'pk')
+            .first()
+        )
+        return row if row is not None else (None, None)
+
+    def get_related_validator_sources(self):
+        """``(max(updated_at), count)`` of each of ``validator_models``, one query each."""
+        using = self.get_queryset().db
+        sources = []
+        for label in self.validator_models:
+            aggregate = apps.get_model(label)._default_manager.using(using).aggregate(
+                last_modified=Max(self.last_modified_field), count=Count('pk'),
+            )
+            sources.append((aggregate['last_modified'], aggregate['count']))
+        return sources
+
+    def get_validators(self, request, source):
+        """Return ``(etag, last_modified_timestamp)`` for this request, or None."""
+        cache = get_catalog_cache()
+        key = self.get_response_cache_key(request)
+        validators_key = f'{key}:validators'
+        if cache.enabled:
+            validators = cache.get(validators_key)
+            if validators is not None:
+                return validators
+
+        last_modified, identity = source()
+        if identity is None:
+            return None
+        parts = [key]
+        for modified, count in [(last_modified, identity), *self.get_related_validator_sources()]:
+            parts.append(f'{modified.isoformat() if modified else ""}|{count}')
+            if modified and (last_modified is None or modified > last_modified):
+                last_modified = modified
+        last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+        fingerprint = '|'.join(parts)
+        validators = ('"%s"' % hashlib.sha1(fingerprint.encode('utf-8')).hexdigest(), last_modified_ts)
+        if cache.enabled and self.response_cacheable():
+            cache.set(validators_key, validators)
+        return validators
+
+    def not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            # Weak comparison (RFC 9110 13.1.2): a proxy that compressed the
+            # response sends back the ETag as W/"...".
+            etags = {strip_weak(tag) for tag in parse_etags(if_none_match)}
+            return '*' in etags or strip_weak(etag) in etags
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return bool(last_modified and if_modified_since and last_modified <= if_modified_since)
+
+    def conditional(self, handler, source, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+
+        validators = self.get_validators(request, source)
+        if validators is None:
+            # Unknown object: let the handler produce its 404.
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        if self.not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        source = lambda: self.get_list_validator_source(request)
+        return self.conditional(super().list, source, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        source = lambda: self.get_detail_validator_source(request, **kwargs)
+        return self.conditional(super().retrieve, source, request, *args, **kwargs)
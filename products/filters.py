@@ -0,0 +1,47 @@
+import django_filters
+from rest_framework import filters
+
+from .categories import slug_subtree_q
+from .models import Category, Product
+from .search import get_search_engine
+
+
+class ProductFilter(django_filters.FilterSet):
+    category__slug = django_filters.CharFilter(method='filter_category')
+    available = django_filters.BooleanFilter(method='filter_available')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    min_stock = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+
+    class Meta:
+        model = Product
+        fields = ['category__slug', 'available']
+
+    def filter_available(self, queryset, name, value):
+        # `available=True` compiles to a bare `WHERE available`, which SQLite
+        # cannot match against an index column; `IN (1)` is an equality term
+        # and lets the (category, available, <sort>, id) indexes do the work.
+        return queryset.filter(available__in=[value])
+
+    def filter_category(self, queryset, name, value):
+        # The category and everything below it: one range on the path index,
+        # with the path looked up inside the same statement. Running no query
+        # here also keeps the filter usable from the async views.
+        subtree = Category.objects.using(queryset.db).filter(slug_subtree_q(value, using=queryset.db))
+        return queryset.filter(category__in=subtree.values('pk'))
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(stock__gt=0)
+        return queryset.filter(stock__lte=0)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """``?search=`` backed by the product search index instead of ``icontains`` scans."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return get_search_engine(queryset.db).filter_queryset(queryset, query)
@@ -0,0 +1,182 @@
+"""
+Stock reservations.
+
+``reserve`` takes stock for a whole basket in one conditional statement::
+
+    UPDATE product SET stock = stock - CASE slug WHEN ... END
+    WHERE slug IN (...) AND stock >= CASE slug WHEN ... END
+
+If fewer rows match than were requested, some product was short and the
+transaction rolls back, so a basket is reserved entirely or not at all. The
+check and the decrement happen in the same statement, so concurrent
+checkouts can never oversell or lose each other's updates. Products are
+always addressed in slug order, which gives databases with row locks a
+consistent lock order.
+
+A reservation is ``committed`` when the order is placed, or ``released``
+to hand the stock back. Reservations still held after ``expires_at`` are
+returned in bulk by ``sweep_expired``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_model
+from .models import Product, Reservation, ReservationItem
+
+DEFAULT_TTL = 15 * 60
+
+
+class ReservationError(Exception):
+    pass
+
+
+class InsufficientStock(ReservationError):
+    def __init__(self, shortages):
+        # slug -> units currently available (None for unknown products)
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for {', '.join(sorted(shortages))}")
+
+
+class ReservationNotHeld(ReservationError):
+    pass
+
+
+def get_ttl():
+    return getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL)
+
+
+def merge_items(items):
+    """Combine ``(slug, quantity)`` pairs into a slug-ordered ``{slug: quantity}``."""
+    quantities = {}
+    for slug, quantity in items:
+        if quantity < 1:
+            raise ValueError(f'Quantity for {slug} must be at least 1.')
+        quantities[slug] = quantities.get(slug, 0) + quantity
+    return dict(sorted(quantities.items()))
+
+
+def _per_row(key, values):
+    return Case(
+        *[When(**{key: k}, then=Value(v)) for k, v in values.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _restore_stock(quantities, using):
+    """Give ``{product id: quantity}`` back to stock in one UPDATE."""
+    if not quantities:
+        return
+    quantities = dict(sorted(quantities.items()))
+    Product.objects.using(using).filter(pk__in=list(quantities)).update(
+        stock=F('stock') + _per_row('pk', quantities),
+        updated_at=timezone.now(),
+    )
+    invalidate_model(Product, using=using)
+
+
+def reserve(items, user=None, ttl=None, using=DEFAULT_DB_ALIAS):
+    """
+    Reserve every ``(slug, quantity)`` in ``items`` or none of them.
+
+    Raises ``InsufficientStock`` listing what is currently available for each
+    product that could not be covered.
+    """
+    quantities = merge_items(items)
+    if not quantities:
+        raise ValueError('Nothing to reserve.')
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=get_ttl() if ttl is None else ttl)
+
+    try:
+        with transaction.atomic(using=using):
+            # The write comes first so the transaction never has to upgrade
+            # from a read snapshot (which SQLite refuses under contention).
+            per_slug = _per_row('slug', quantities)
+            updated = Product.objects.using(using).filter(
+                slug__in=list(quantities), stock__gte=per_slug,
+            ).update(stock=F('stock') - per_slug, updated_at=now)
+            if updated != len(quantities):
+                raise InsufficientStock({})
+
+            product_ids = dict(
+                Product.objects.using(using).filter(slug__in=list(quantities)).values_list('slug', 'id')
+            )
+            reservation = Reservation.objects.using(using).create(
+                user=user, expires_at=expires_at,
+            )
+            ReservationItem.objects.using(using).bulk_create([
+                ReservationItem(reservation=reservation, product_id=product_ids[slug], quantity=quantity)
+                for slug, quantity in quantities.items()
+            ])
+            invalidate_model(Product, using=using)
+    except InsufficientStock:
+        available = dict(
+            Product.objects.using(using).filter(slug__in=list(quantities)).values_list('slug', 'stock')
+        )
+        raise InsufficientStock({
+            slug: available.get(slug)
+            for slug, quantity in quantities.items()
+            if available.get(slug) is None or available[slug] < quantity
+        })
+    return reservation
+
+
+def commit(reservation_id, using=DEFAULT_DB_ALIAS):
+    """Turn a held, unexpired reservation into a permanent stock decrement."""
+    updated = Reservation.objects.using(using).filter(
+        pk=reservation_id, status=Reservation.STATUS_HELD, expires_at__gt=timezone.now(),
+    ).update(status=Reservation.STATUS_COMMITTED, updated_at=timezone.now())
+    if not updated:
+        raise ReservationNotHeld('Reservation is not held or has expired.')
+
+
+def release(reservation_id, using=DEFAULT_DB_ALIAS):
+    """Cancel a held reservation and return its stock."""
+    with transaction.atomic(using=using):
+        updated = Reservation.objects.using(using).filter(
+            pk=reservation_id, status=Reservation.STATUS_HELD,
+        ).update(status=Reservation.STATUS_RELEASED, updated_at=timezone.now())
+        if not updated:
+            raise ReservationNotHeld('Reservation is not held.')
+        _restore_stock(
+            dict(ReservationItem.objects.using(using).filter(reservation_id=reservation_id)
+                 .values_list('product_id', 'quantity')),
+            using,
+        )
+
+
+def sweep_expired(batch_size=500, using=DEFAULT_DB_ALIAS, now=None):
+    """
+    Expire held reservations past their deadline and return their stock.
+
+    Each batch is one transaction: the reservations are claimed with
+    ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it
+    (SQLite serializes writers anyway), then a single UPDATE gives back the
+    summed quantities per product. Returns the number of reservations expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic(using=using):
+            ids = list(
+                Reservation.objects.using(using)
+                .select_for_update(skip_locked=True)
+                .filter(status=Reservation.STATUS_HELD, expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return expired
+            Reservation.objects.using(using).filter(pk__in=ids, status=Reservation.STATUS_HELD).update(
+                status=Reservation.STATUS_EXPIRED, updated_at=now,
+            )
+            _restore_stock(
+                dict(ReservationItem.objects.using(using).filter(reservation_id__in=ids)
+                     .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')),
+                using,
+            )
+        expired += len(ids)
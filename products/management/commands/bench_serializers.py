@@ -0,0 +1,104 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ecommerce.renderers import FastJSONRenderer, orjson
+from products.models import Category, Product, Review
+from products.rows import CategoryRowSerializer, ProductRowSerializer, ReviewRowSerializer
+from products.views import PRODUCT_FIELDS, REVIEW_FIELDS
+
+# (model serializer queryset, row serializer) per list endpoint, loading what
+# the list views load.
+TARGETS = {
+    'products': (
+        lambda: Product.objects.select_related('category').only(*PRODUCT_FIELDS, 'category__slug'),
+        ProductRowSerializer,
+    ),
+    'categories': (lambda: Category.objects.all(), CategoryRowSerializer),
+    'reviews': (
+        lambda: Review.objects.select_related('user', 'product').only(*REVIEW_FIELDS, 'user__email', 'product__name'),
+        ReviewRowSerializer,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure rows/sec of list serialization: ModelSerializer over model instances '
+        'against the values()-based row serializers, with and without the orjson renderer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', default=','.join(TARGETS), help='Comma-separated lists to measure.')
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per list.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed repetitions per variant.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        targets = [name.strip() for name in options['targets'].split(',')]
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+        # Image fields are rendered as absolute URLs, as in the API.
+        context = {'request': Request(APIRequestFactory().get('/'))}
+
+        results = []
+        for name in targets:
+            make_queryset, row_serializer_class = TARGETS[name]
+            queryset = make_queryset().order_by('pk')[:options['rows']]
+            rows = row_serializer_class(context=context)
+            values = queryset.values(*rows.columns)
+            count = len(values)
+            if not count:
+                self.stderr.write(f'No {name} to serialize; skipped.')
+                continue
+
+            def model_serialize(instances):
+                return rows.serializer_class(instances, many=True, context=context).data
+
+            variants = [
+                ('model', lambda: list(queryset), model_serialize, JSONRenderer()),
+                ('rows', lambda: list(values), rows.to_representation, JSONRenderer()),
+            ]
+            if orjson is not None:
+                variants.append(('rows+orjson', lambda: list(values), rows.to_representation, FastJSONRenderer()))
+
+            outputs = set()
+            for variant, fetch, serialize, renderer in variants:
+                timings = self.measure(fetch, serialize, renderer, options['repeat'])
+                outputs.add(renderer.render(serialize(fetch())))
+                results.append({'target': name, 'variant': variant, 'rows': count, **{
+                    f'{stage}_rows_per_second': count / seconds for stage, seconds in timings.items()
+                }})
+            if len(outputs) != 1:
+                raise CommandError(f'The {name} variants rendered different JSON.')
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'target':<11} {'variant':<12} {'rows':>6} {'serialize/s':>12} {'render/s':>10} {'total/s':>10}")
+        for r in results:
+            self.stdout.write(
+                f"{r['target']:<11} {r['variant']:<12} {r['rows']:>6} {r['serialize_rows_per_second']:>12.0f} "
+                f"{r['render_rows_per_second']:>10.0f} {r['total_rows_per_second']:>10.0f}"
+            )
+
+    def measure(self, fetch, serialize, renderer, repeat):
+        """Best-of-``repeat`` seconds per stage; ``total`` includes the query."""
+        best = {'serialize': float('inf'), 'render': float('inf'), 'total': float('inf')}
+        for _ in range(repeat):
+            began = time.perf_counter()
+            fetched = fetch()
+            serialized = time.perf_counter()
+            data = serialize(fetched)
+            rendering = time.perf_counter()
+            renderer.render(data)
+            done = time.perf_counter()
+            best['serialize'] = min(best['serialize'], rendering - serialized)
+            best['render'] = min(best['render'], done - rendering)
+            best['total'] = min(best['total'], done - began)
+        return best
@@ -0,0 +1,142 @@
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import Sum
+
+from products.inventory import InsufficientStock, release, reserve
+from products.models import Product, Reservation, ReservationItem
+
+SLUG_PREFIX = 'bench-stock-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure reservation throughput with N concurrent writers against the configured database. '
+        'Creates throwaway bench-stock-* products and removes them afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', default='1,2,4,8', help='Comma-separated writer thread counts to run.')
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per run.')
+        parser.add_argument('--products', type=int, default=20, help='Number of products contended for.')
+        parser.add_argument('--basket', type=int, default=3, help='Products per reservation.')
+        parser.add_argument('--stock', type=int, default=10 ** 6, help='Initial stock per product.')
+        parser.add_argument('--release-ratio', type=float, default=0.5, help='Fraction of reservations released again.')
+        parser.add_argument('--journal-mode', default='wal', help="SQLite journal mode for the run ('wal', 'delete', ...).")
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        try:
+            writer_counts = [int(n) for n in options['writers'].split(',')]
+        except ValueError:
+            raise CommandError('--writers must be a comma-separated list of integers.')
+        if options['basket'] > options['products']:
+            raise CommandError('--basket cannot exceed --products.')
+
+        previous_mode = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                previous_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+                cursor.execute(f"PRAGMA journal_mode={options['journal_mode']}")
+
+        slugs = self.create_products(options['products'], options['stock'])
+        results = []
+        try:
+            for writers in writer_counts:
+                results.append(self.run(writers, slugs, options))
+                self.check_invariant(slugs, options['stock'])
+        finally:
+            Reservation.objects.filter(items__product__slug__startswith=SLUG_PREFIX).delete()
+            Product.objects.filter(slug__startswith=SLUG_PREFIX).delete()
+            if previous_mode is not None:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'PRAGMA journal_mode={previous_mode}')
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'writers':>7} {'ops/s':>9} {'ok':>7} {'short':>6} {'busy':>6} {'p50 ms':>8} {'p99 ms':>8}")
+        for r in results:
+            self.stdout.write(
+                f"{r['writers']:>7} {r['ops_per_second']:>9.1f} {r['reserved']:>7} {r['insufficient']:>6} "
+                f"{r['busy']:>6} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}"
+            )
+
+    def create_products(self, count, stock):
+        Product.objects.filter(slug__startswith=SLUG_PREFIX).delete()
+        products = [
+            Product(name=f'Bench stock {i}', slug=f'{SLUG_PREFIX}{i}', description='Benchmark product', price='1.00', stock=stock)
+            for i in range(count)
+        ]
+        Product.objects.bulk_create(products)
+        return [product.slug for product in products]
+
+    def run(self, writers, slugs, options):
+        deadline = time.perf_counter() + options['duration']
+        latencies, counters = [], {'reserved': 0, 'insufficient': 0, 'busy': 0, 'released': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(writers)
+
+        def work(seed):
+            rng = random.Random(seed)
+            local_latencies, local = [], dict.fromkeys(counters, 0)
+            start.wait()
+            try:
+                while time.perf_counter() < deadline:
+                    basket = [(slug, rng.randint(1, 3)) for slug in rng.sample(slugs, options['basket'])]
+                    began = time.perf_counter()
+                    try:
+                        reservation = reserve(basket, ttl=3600)
+                    except InsufficientStock:
+                        local['insufficient'] += 1
+                        continue
+                    except OperationalError:
+                        local['busy'] += 1
+                        continue
+                    local_latencies.append(time.perf_counter() - began)
+                    local['reserved'] += 1
+                    if rng.random() < options['release_ratio']:
+                        try:
+                            release(reservation.pk)
+                            local['released'] += 1
+                        except OperationalError:
+                            local['busy'] += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(local_latencies)
+                    for key, value in local.items():
+                        counters[key] += value
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(writers)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        latencies.sort()
+        return {
+            'writers': writers,
+            'seconds': round(elapsed, 3),
+            'ops_per_second': counters['reserved'] / elapsed,
+            **counters,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        }
+
+    def check_invariant(self, slugs, stock):
+        # Every unit is either still in stock or held by a live reservation.
+        in_stock = Product.objects.filter(slug__in=slugs).aggregate(total=Sum('stock'))['total']
+        held = ReservationItem.objects.filter(
+            product__slug__in=slugs, reservation__status=Reservation.STATUS_HELD,
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        if in_stock + held != stock * len(slugs):
+            raise CommandError(f'Stock invariant violated: {in_stock} in stock + {held} held != {stock * len(slugs)}')
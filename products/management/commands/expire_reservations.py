@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.inventory import sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of held reservations whose TTL has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations expired per transaction.')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping instead of exiting after one pass.')
+        parser.add_argument('--interval', type=float, default=30.0, help='Seconds between sweeps with --loop.')
+        parser.add_argument('--database', default='default', help='Database alias to sweep.')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = sweep_expired(batch_size=options['batch_size'], using=options['database'])
+            self.stdout.write(f'Expired {expired} reservations.')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products.bulk import FORMATS, guess_format, iter_export
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to a CSV or NDJSON file (or stdout) in import format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="Destination file, '-' for stdout.")
+        parser.add_argument('--format', choices=FORMATS, help='Output format; guessed from the file extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time.')
+        parser.add_argument('--database', default='default', help='Database alias to export from.')
+
+    def handle(self, *args, **options):
+        format = options['format'] or guess_format(options['output'])
+        queryset = Product.objects.using(options['database'])
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8', newline='')
+        try:
+            for chunk in iter_export(queryset, format=format, chunk_size=options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
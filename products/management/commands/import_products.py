@@ -0,0 +1,38 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.bulk import FORMATS, guess_format, import_products, text_stream
+
+
+class Command(BaseCommand):
+    help = 'Create or update products (matched on slug) from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument('--format', choices=FORMATS, help='Input format; guessed from the file extension by default.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows validated and written per statement.')
+        parser.add_argument('--max-errors', type=int, default=1000, help='Row errors to include in the report.')
+        parser.add_argument('--database', default='default', help='Database alias to import into.')
+
+    def handle(self, *args, **options):
+        format = options['format'] or guess_format(options['path'])
+        if options['path'] == '-':
+            stream = text_stream(sys.stdin.buffer)
+        else:
+            try:
+                stream = text_stream(open(options['path'], 'rb'))
+            except OSError as exc:
+                raise CommandError(exc)
+
+        with stream:
+            result = import_products(
+                stream, format=format, batch_size=options['batch_size'],
+                using=options['database'], max_errors=options['max_errors'],
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {json.dumps(error['errors'])}")
+        message = f'{result.created} created, {result.updated} updated, {result.error_count} rows rejected.'
+        self.stdout.write(self.style.WARNING(message) if result.error_count else self.style.SUCCESS(message))
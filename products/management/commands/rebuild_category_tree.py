@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.categories import rebuild_category_tree
+
+
+class Command(BaseCommand):
+    help = "Recompute every category's path from its parent links and its subtree product counts from the products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild.')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_category_tree(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt paths and product counts for {rebuilt} categories.'))
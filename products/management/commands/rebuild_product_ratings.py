@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute every product's review summary (rating totals, average, star histogram and newest review ids) from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products written per bulk update.')
+        parser.add_argument('--database', default='default', help='Database alias to rebuild.')
+
+    def handle(self, *args, **options):
+        updated = rebuild_ratings(batch_size=options['batch_size'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating counters for {updated} reviewed products.'))
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from products.search import install_fts5
+    install_fts5(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from products.search import uninstall_fts5
+    uninstall_fts5(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
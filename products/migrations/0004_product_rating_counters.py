@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:09
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_counters(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    db = schema_editor.connection.alias
+    rows = (
+        Review.objects.using(db)
+        .order_by('product_id')
+        .values('product_id')
+        .annotate(total=Sum('rating'), count=Count('id'))
+        .values_list('product_id', 'total', 'count')
+    )
+    batch = []
+    for product_id, total, count in rows.iterator(chunk_size=1000):
+        average = (Decimal(total) / count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        batch.append(Product(pk=product_id, rating_sum=total, rating_count=count, average_rating=average))
+        if len(batch) >= 1000:
+            Product.objects.using(db).bulk_update(batch, ['rating_sum', 'rating_count', 'average_rating'])
+            batch = []
+    if batch:
+        Product.objects.using(db).bulk_update(batch, ['rating_sum', 'rating_count', 'average_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_counters, migrations.RunPython.noop),
+    ]
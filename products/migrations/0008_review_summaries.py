@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+LATEST_REVIEWS = 10
+
+
+def backfill_review_summaries(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    db = schema_editor.connection.alias
+    fields = [f'rating_{rating}_count' for rating in range(1, 6)] + ['latest_review_ids']
+    rows = (
+        Review.objects.using(db)
+        .order_by('-product_id', '-created_at', '-id')
+        .values_list('product_id', 'id', 'rating')
+    )
+    batch, product = [], None
+    for product_id, review_id, rating in rows.iterator(chunk_size=1000):
+        if product is None or product.pk != product_id:
+            if len(batch) >= 1000:
+                Product.objects.using(db).bulk_update(batch, fields)
+                batch = []
+            product = Product(pk=product_id, latest_review_ids=[], **{field: 0 for field in fields[:5]})
+            batch.append(product)
+        setattr(product, f'rating_{rating}_count', getattr(product, f'rating_{rating}_count') + 1)
+        if len(product.latest_review_ids) < LATEST_REVIEWS:
+            product.latest_review_ids.append(review_id)
+    if batch:
+        Product.objects.using(db).bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='latest_review_ids',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ),
+        migrations.RunPython(backfill_review_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+SEGMENT = 10
+
+
+def backfill_category_tree(apps, schema_editor):
+    # Every existing category is a root, so its subtree is itself.
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    db = schema_editor.connection.alias
+    counts = {
+        category_id: (products, available)
+        for category_id, products, available in (
+            Product.objects.using(db).filter(category__isnull=False).order_by()
+            .values_list('category_id').annotate(products=Count('pk'), available=Count('pk', filter=Q(available=True)))
+        )
+    }
+    categories = list(Category.objects.using(db).only('id'))
+    for category in categories:
+        category.path = str(category.pk).zfill(SEGMENT)
+        category.product_count, category.available_count = counts.get(category.pk, (0, 0))
+    Category.objects.using(db).bulk_update(categories, ['path', 'product_count', 'available_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_review_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='available_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='products.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_category_tree, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,42 @@
-from django.db import models
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
 from django.conf import settings
 
 class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
     slug = models.SlugField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
+    # Ancestor ids and its own, zero-padded, and the products in the whole
+    # subtree; maintained by products.categories.
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    available_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Categories"
 
+    def check_parent(self, parent):
+        """Raise ValidationError if ``parent`` is this category or one of its subcategories."""
+        if parent is not None and self.pk is not None and self.path and parent.path.startswith(self.path):
+            raise ValidationError('A category cannot be moved under itself or one of its subcategories.')
+
+    def clean(self):
+        super().clean()
+        try:
+            self.check_parent(self.parent)
+        except ValidationError as exc:
+            raise ValidationError({'parent': exc.messages})
+
+    def save(self, *args, **kwargs):
+        # Keep the write and the path and count updates in one transaction.
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -17,16 +45,50 @@ class Product(models.Model):
     slug = models.SlugField(max_length=255, unique=True)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
+    # Covered by the composite indexes below, which all lead with category.
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products', db_index=False)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of image, maintained by ecommerce.images.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     stock = models.IntegerField(default=0)
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    # Running totals behind average_rating, maintained per review write.
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Reviews per star and the newest review ids, maintained with the totals
+    # for the detail view's review summary.
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    latest_review_ids = models.JSONField(default=list, blank=True, editable=False)
 
     class Meta:
         ordering = ('-created_at',)
+        # One index per supported filter + sort combination. The trailing id
+        # is the keyset tie-breaker; each index is scanned forwards or
+        # backwards depending on the requested direction.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['average_rating', 'id'], name='product_rating_idx'),
+            models.Index(fields=['available', 'created_at', 'id'], name='product_avail_created_idx'),
+            models.Index(fields=['available', 'price', 'id'], name='product_avail_price_idx'),
+            models.Index(fields=['available', 'average_rating', 'id'], name='product_avail_rating_idx'),
+            models.Index(fields=['category', 'available', 'created_at', 'id'], name='product_cat_created_idx'),
+            models.Index(fields=['category', 'available', 'price', 'id'], name='product_cat_price_idx'),
+            models.Index(fields=['category', 'available', 'average_rating', 'id'], name='product_cat_rating_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the product write and the category counter update in one transaction.
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -41,6 +103,56 @@ class Review(models.Model):
     class Meta:
         unique_together = ('product', 'user')
         ordering = ('-created_at',)
+        indexes = [
+            # A product's reviews newest first, scanned backwards.
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the review write and the product counter update in one transaction.
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'Review by {self.user.email} for {self.product.name}'
+
+class Reservation(models.Model):
+    """Stock held for a checkout until it is committed, released or expires."""
+    STATUS_HELD = 'held'
+    STATUS_COMMITTED = 'committed'
+    STATUS_RELEASED = 'released'
+    STATUS_EXPIRED = 'expired'
+    STATUS_CHOICES = (
+        (STATUS_HELD, 'Held'),
+        (STATUS_COMMITTED, 'Committed'),
+        (STATUS_RELEASED, 'Released'),
+        (STATUS_EXPIRED, 'Expired'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='reservations')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'Reservation {self.pk} ({self.status})'
+
+class ReservationItem(models.Model):
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservation_items')
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('reservation', 'product')
 
     def __str__(self):
-        return f'Review by {self.user.username} for {self.product.name}'
+        return f'{self.quantity} x {self.product_id}'
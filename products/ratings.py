@@ -0,0 +1,210 @@
+"""
+Incremental maintenance of a product's review summary: ``rating_sum``,
+``rating_count``, ``average_rating``, the per-star ``rating_<n>_count``
+histogram and ``latest_review_ids``.
+
+Every review write turns into a single ``UPDATE products_product SET
+rating_sum = rating_sum + d, ...`` issued inside the review's own
+transaction. The arithmetic happens in the database against the row it is
+updating, so concurrent reviews never overwrite each other's totals and no
+review ever has to be re-aggregated. An edit or delete takes off what the
+review's row holds when it is read, locked, in that same transaction, not
+what the instance was loaded with.
+
+The newest review ids are a list, so a write that changes them reads the
+list first with the product row locked. A new review is prepended. Only
+deleting (or moving) one of the listed reviews reloads the list, through
+the ``(product, created_at)`` index.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, DecimalField, F, FloatField, QuerySet, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .cache import invalidate_model
+from .models import Product, Review
+
+AVERAGE_PLACES = Decimal('0.01')
+STAR_FIELDS = {rating: f'rating_{rating}_count' for rating in range(1, 6)}
+SUMMARY_FIELDS = ('rating_sum', 'rating_count', 'average_rating', *STAR_FIELDS.values(), 'latest_review_ids')
+
+
+def latest_review_count():
+    return getattr(settings, 'PRODUCT_LATEST_REVIEWS', 10)
+
+
+def average(rating_sum, rating_count):
+    if not rating_count:
+        return Decimal('0.00')
+    return (Decimal(rating_sum) / rating_count).quantize(AVERAGE_PLACES, rounding=ROUND_HALF_UP)
+
+
+def apply_rating_delta(product_id, sum_delta, count_delta, using=None, stars=None, latest=None):
+    """
+    Shift a product's rating totals and star counts (``stars``: rating ->
+    delta), recompute its average and, unless ``latest`` is None, replace its
+    newest review ids, all in one statement.
+    """
+    changes = {
+        STAR_FIELDS[rating]: F(STAR_FIELDS[rating]) + delta
+        for rating, delta in (stars or {}).items() if delta and rating in STAR_FIELDS
+    }
+    if latest is not None:
+        changes['latest_review_ids'] = latest
+    if product_id is None or (not sum_delta and not count_delta and not changes):
+        return
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    (
+        Product.objects.using(using)
+        .filter(pk=product_id)
+        .update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            average_rating=Case(
+                When(rating_count__gt=-count_delta, then=Round(Cast(new_sum, FloatField()) / new_count, precision=2)),
+                default=Value(0),
+                output_field=DecimalField(max_digits=3, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
+            **changes,
+        )
+    )
+
+
+def locked_latest(product_id, using=None):
+    """A product's ``latest_review_ids``, read with its row locked until the transaction ends."""
+    return (
+        Product.objects.using(using).select_for_update()
+        .filter(pk=product_id).values_list('latest_review_ids', flat=True).first()
+    )
+
+
+def newest_review_ids(product_id, using=None):
+    return list(
+        Review.objects.using(using).filter(product_id=product_id)
+        .order_by('-created_at', '-id').values_list('id', flat=True)[:latest_review_count()]
+    )
+
+
+def reloaded_latest(product_id, using=None):
+    if product_id is None or locked_latest(product_id, using=using) is None:
+        return None
+    return newest_review_ids(product_id, using=using)
+
+
+def counted_state(review, using=None):
+    """
+    The ``(product_id, rating)`` a stored review currently contributes, or
+    ``(None, None)`` once its row is gone.
+
+    Read with the row locked inside the write's transaction, never from the
+    state the instance was loaded with: two requests editing the same review
+    then each apply their difference to what the other committed.
+    """
+    row = (
+        Review.objects.using(using).select_for_update()
+        .filter(pk=review.pk).values_list('product_id', 'rating').first()
+    )
+    return row or (None, None)
+
+
+def deleted_with_product(origin):
+    """Whether a delete cascaded from deleting the product itself."""
+    return isinstance(origin, Product) or (isinstance(origin, QuerySet) and origin.model is Product)
+
+
+def review_saved(review, created, previous, using=None):
+    if created:
+        latest = locked_latest(review.product_id, using=using)
+        if latest is not None:
+            latest = [review.pk, *latest][:latest_review_count()]
+        apply_rating_delta(review.product_id, review.rating, 1, using=using, stars={review.rating: 1}, latest=latest)
+    else:
+        old_product_id, old_rating = previous
+        if old_product_id == review.product_id:
+            stars = {old_rating: -1} if old_rating else {}
+            stars[review.rating] = stars.get(review.rating, 0) + 1
+            apply_rating_delta(review.product_id, review.rating - (old_rating or 0), 0, using=using, stars=stars)
+        else:
+            if old_product_id is not None:
+                apply_rating_delta(
+                    old_product_id, -old_rating, -1, using=using,
+                    stars={old_rating: -1}, latest=reloaded_latest(old_product_id, using=using),
+                )
+            apply_rating_delta(
+                review.product_id, review.rating, 1, using=using,
+                stars={review.rating: 1}, latest=reloaded_latest(review.product_id, using=using),
+            )
+
+
+def review_deleted(review, counted, using=None, origin=None):
+    """Take a deleted review off its product; ``counted`` is ``counted_state`` from before the delete."""
+    if deleted_with_product(origin):
+        # Cascaded from deleting the product itself; its summary goes with it.
+        return
+    product_id, rating = counted
+    if rating is None:
+        # Already deleted by a concurrent request, which took it off.
+        return
+    latest = locked_latest(product_id, using=using)
+    if latest is not None and review.pk in latest:
+        latest = newest_review_ids(product_id, using=using)
+    else:
+        latest = None
+    apply_rating_delta(product_id, -rating, -1, using=using, stars={rating: -1}, latest=latest)
+
+
+def rebuild_ratings(batch_size=1000, using=None):
+    """
+    Recompute every product's review summary from ``Review``.
+
+    Products are first reset, then the reviews are streamed newest first per
+    product (the ``(product, created_at)`` index, backwards) and the summaries
+    written back with ``bulk_update`` in batches, all inside one transaction.
+    Returns the number of products with reviews.
+    """
+    updated = 0
+    limit = latest_review_count()
+    with transaction.atomic(using=using):
+        Product.objects.using(using).filter(rating_count__gt=0).update(
+            rating_sum=0, rating_count=0, average_rating=0, latest_review_ids=[],
+            **{field: 0 for field in STAR_FIELDS.values()},
+        )
+        rows = (
+            Review.objects.using(using)
+            .order_by('-product_id', '-created_at', '-id')
+            .values_list('product_id', 'id', 'rating')
+            .iterator(chunk_size=batch_size)
+        )
+        batch, product = [], None
+        for product_id, review_id, rating in rows:
+            if product is None or product.pk != product_id:
+                if len(batch) >= batch_size:
+                    updated += write_summaries(batch, using)
+                    batch = []
+                product = Product(
+                    pk=product_id, rating_sum=0, rating_count=0, latest_review_ids=[],
+                    **{field: 0 for field in STAR_FIELDS.values()},
+                )
+                batch.append(product)
+            product.rating_sum += rating
+            product.rating_count += 1
+            if rating in STAR_FIELDS:
+                setattr(product, STAR_FIELDS[rating], getattr(product, STAR_FIELDS[rating]) + 1)
+            if len(product.latest_review_ids) < limit:
+                product.latest_review_ids.append(review_id)
+        if batch:
+            updated += write_summaries(batch, using)
+        invalidate_model(Product, using=using or DEFAULT_DB_ALIAS)
+    return updated
+
+
+def write_summaries(products, using=None):
+    for product in products:
+        product.average_rating = average(product.rating_sum, product.rating_count)
+    Product.objects.using(using).bulk_update(products, SUMMARY_FIELDS)
+    return len(products)
@@ -0,0 +1,166 @@
+"""
+Read-only list serialization from ``values()`` rows.
+
+A ``RowSerializer`` is compiled once per request from an existing DRF
+serializer. Each output field gets the ``values()`` column it reads and a
+plain encoder function. Encoding a row is then one dict lookup and at most
+one call per field, with no model instances and no
+``get_attribute``/``to_representation`` dispatch.
+
+Text, integer, boolean and related-key fields already hold their JSON value
+in the row, so they are passed through. Decimals and file URLs have
+dedicated encoders. Any other field falls back to its DRF field's
+``to_representation``, so the output always matches the serializer's.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import relations, serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from ecommerce.metrics import timed
+
+from .serializers import CategorySerializer, ProductSerializer, ReviewSerializer
+
+# Fields whose representation of a non-null database value is the value itself.
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+    relations.SlugRelatedField, relations.PrimaryKeyRelatedField,
+)
+
+
+def decimal_encoder(field):
+    if (
+        not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        or field.localize or field.decimal_places is None or getattr(field, 'normalize_output', False)
+    ):
+        return field.to_representation
+    exponent = -field.decimal_places
+
+    def encode(value):
+        # Database decimals already carry the column's scale; anything else
+        # goes through DRF's quantization.
+        if value.as_tuple().exponent == exponent:
+            return format(value, 'f')
+        return field.to_representation(value)
+    return encode
+
+
+def file_encoder(field, model_field):
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda name: name or None
+    storage = model_field.storage
+    request = field.context.get('request')
+
+    def encode(name):
+        if not name:
+            return None
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return encode
+
+
+class RowSerializer:
+    """
+    Render ``values()`` rows exactly as ``serializer_class`` renders instances.
+
+    ``columns`` lists what to pass to ``values()``.
+    """
+    serializer_class = None
+
+    def __init__(self, context=None):
+        serializer = self.serializer_class(context=context or {})
+        model = serializer.Meta.model
+        self.fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, relations.ManyRelatedField):
+                raise ImproperlyConfigured(f'{type(self).__name__} cannot read field "{name}" from a values() row.')
+            column = field.source.replace('.', '__')
+            if isinstance(field, relations.SlugRelatedField):
+                column = f'{column}__{field.slug_field}'
+            self.fields.append((name, column, self.encoder_for(field, model)))
+        self.columns = [column for _, column, _ in self.fields]
+
+    def encoder_for(self, field, model):
+        """Return a function encoding a non-null value, or ``None`` to pass it through."""
+        if isinstance(field, serializers.DecimalField):
+            return decimal_encoder(field)
+        if isinstance(field, serializers.FileField):
+            return file_encoder(field, model._meta.get_field(field.source))
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return None
+        return field.to_representation
+
+    def to_representation(self, rows):
+        fields = self.fields
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, encode in fields:
+                value = row[column]
+                item[name] = value if encode is None or value is None else encode(value)
+            data.append(item)
+        return data
+
+
+class ProductRowSerializer(RowSerializer):
+    serializer_class = ProductSerializer
+
+
+class CategoryRowSerializer(RowSerializer):
+    serializer_class = CategorySerializer
+
+
+class ReviewRowSerializer(RowSerializer):
+    serializer_class = ReviewSerializer
+
+
+def ordering_names(value):
+    if not value or value == '__all__':
+        return ()
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+def row_columns(view, row_serializer, paginator=None):
+    """
+    ``values()`` columns for a list: the serializer's plus the sort keys.
+
+    The keyset paginator reads the position of the first and last row of a
+    page from the rows themselves, so every field the list can be ordered by
+    and the primary key must be fetched too.
+    """
+    columns = list(row_serializer.columns)
+    keys = [
+        *ordering_names(getattr(view, 'ordering_fields', None)),
+        *(ordering_names(getattr(view, 'ordering', None)) or ordering_names(getattr(paginator, 'ordering', None))),
+    ]
+    for name in keys:
+        name = name.lstrip('-')
+        if name not in columns:
+            columns.append(name)
+    if 'id' not in columns:
+        columns.append('pk')
+    return columns
+
+
+class RowListMixin:
+    """Serve ``list`` from ``values()`` rows through ``row_serializer_class``."""
+    row_serializer_class = None
+
+    def get_row_serializer(self):
+        return self.row_serializer_class(context=self.get_serializer_context())
+
+    def list(self, request, *args, **kwargs):
+        row_serializer = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*row_columns(self, row_serializer, self.paginator))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            with timed('serialize'):
+                data = row_serializer.to_representation(page)
+            return self.get_paginated_response(data)
+        rows = list(queryset)
+        with timed('serialize'):
+            return Response(row_serializer.to_representation(rows))
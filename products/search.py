@@ -0,0 +1,510 @@
+"""
+Full-text product search.
+
+Two interchangeable backends sit behind ``get_search_engine()``:
+
+* ``FTS5SearchEngine`` keeps an external-content FTS5 table in step with
+  ``products_product`` through SQL triggers, so saves, deletes and bulk
+  writes are all indexed by SQLite itself.
+* ``InMemorySearchEngine`` is a pure-Python inverted index used when FTS5 is
+  not available (other databases, SQLite builds without the extension). It
+  is loaded lazily from the database and kept current from ``Product``
+  signals in ``products.signals``, so it only sees writes made by its own
+  process: it is meant for tests and single-process deployments, and
+  ``get_search_engine`` logs a warning when it falls back to it.
+
+Both tokenize the same way (unicode61 with diacritics removed), match every
+query term as a prefix, correct terms that match nothing against the index
+vocabulary, rank by BM25 with the name weighted above the description, and
+return per-category facet counts for the whole match set.
+"""
+import logging
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+
+from .models import Category, Product
+
+FTS_TABLE = 'products_product_fts'
+FTS_VOCAB_TABLE = 'products_product_fts_vocab'
+logger = logging.getLogger(__name__)
+
+NAME_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+SearchResult = namedtuple('SearchResult', ['ids', 'total', 'facets', 'corrections'])
+
+_word_re = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    """Lowercase, strip diacritics and split on anything that isn't a letter or digit."""
+    if not text:
+        return []
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _word_re.findall(stripped.lower())
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, giving up once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def typo_budget(token):
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def correction_prefixes(token):
+    """
+    Vocabulary slices to look for corrections in, narrowest first.
+
+    Typos rarely hit the first letters, so the two-letter slice usually
+    settles it and keeps the candidate scan small; the one-letter slice only
+    runs when that finds nothing.
+    """
+    return (token[:2], token[:1])
+
+
+def best_correction(token, candidates):
+    """Pick the closest ``(term, doc_count)`` candidate, preferring common terms."""
+    budget = typo_budget(token)
+    best = None
+    for term, doc_count in candidates:
+        distance = edit_distance(token, term, budget)
+        if distance > budget:
+            continue
+        key = (distance, -doc_count, term)
+        if best is None or key < best[0]:
+            best = (key, term)
+    return best[1] if best else None
+
+
+def _prefix_upper_bound(prefix):
+    return prefix + '\U0010ffff'
+
+
+def _facets_from_counts(counts):
+    """Turn ``{category_id: count}`` into a list of facet dicts, largest first."""
+    categories = Category.objects.in_bulk([pk for pk in counts if pk is not None])
+    facets = []
+    for category_id, count in counts.items():
+        category = categories.get(category_id)
+        facets.append({
+            'slug': category.slug if category else None,
+            'name': category.name if category else None,
+            'count': count,
+        })
+    facets.sort(key=lambda facet: (-facet['count'], facet['slug'] or ''))
+    return facets
+
+
+class FTS5SearchEngine:
+    """Search backed by SQLite's FTS5 extension."""
+
+    def __init__(self, using):
+        self.using = using
+
+    def index_product(self, product):
+        # Maintained by the triggers created in install_fts5().
+        pass
+
+    def remove_product(self, pk):
+        pass
+
+    def rebuild(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    def build_match(self, query):
+        """Return the FTS5 MATCH expression for ``query`` and any spelling corrections."""
+        tokens = tokenize(query)
+        corrections = {}
+        terms = []
+        with connections[self.using].cursor() as cursor:
+            for token in tokens:
+                term = token
+                if not self._has_prefix(cursor, token):
+                    corrected = self._correct(cursor, token)
+                    if corrected:
+                        corrections[token] = corrected
+                        term = corrected
+                terms.append(f'"{term}"*')
+        return ' '.join(terms), corrections
+
+    def _has_prefix(self, cursor, token):
+        cursor.execute(
+            f'SELECT 1 FROM {FTS_VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT 1',
+            [token, _prefix_upper_bound(token)],
+        )
+        return cursor.fetchone() is not None
+
+    def _correct(self, cursor, token):
+        if not typo_budget(token):
+            return None
+        for prefix in correction_prefixes(token):
+            cursor.execute(
+                f'SELECT term, doc FROM {FTS_VOCAB_TABLE} WHERE term >= %s AND term < %s',
+                [prefix, _prefix_upper_bound(prefix)],
+            )
+            corrected = best_correction(token, cursor.fetchall())
+            if corrected:
+                return corrected
+        return None
+
+    def filter_queryset(self, queryset, query):
+        match, _ = self.build_match(query)
+        if not match:
+            return queryset
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match],
+        ))
+
+    def search(self, query, category_ids=None, available=None, limit=20, offset=0):
+        match, corrections = self.build_match(query)
+        if not match:
+            return SearchResult([], 0, [], corrections)
+
+        where = [f'{FTS_TABLE} MATCH %s']
+        params = [match]
+        if available is not None:
+            where.append('p.available = %s')
+            params.append(available)
+        join = f'FROM {FTS_TABLE} f JOIN products_product p ON p.id = f.rowid WHERE '
+        clause = ' AND '.join(where)
+
+        with connections[self.using].cursor() as cursor:
+            # Facets describe the whole match set, before the category filter.
+            cursor.execute(f'SELECT p.category_id, COUNT(*) {join}{clause} GROUP BY p.category_id', params)
+            counts = dict(cursor.fetchall())
+
+            if category_ids is not None:
+                # Integer literals, for the same variable limit as filter_queryset.
+                clause += ' AND p.category_id IN (%s)' % ','.join(str(int(pk)) for pk in category_ids)
+            cursor.execute(
+                f'SELECT p.id {join}{clause} ORDER BY f.rank LIMIT %s OFFSET %s',
+                params + [limit, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+        if category_ids is not None:
+            total = sum(counts.get(pk, 0) for pk in set(category_ids))
+        else:
+            total = sum(counts.values())
+        return SearchResult(ids, total, _facets_from_counts(counts), corrections)
+
+
+class InMemorySearchEngine:
+    """A process-local inverted index over product names and descriptions."""
+
+    def __init__(self, using):
+        self.using = using
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        # term -> {product id: weighted term frequency}
+        self._postings = {}
+        # product id -> (terms, weighted length, category id, available)
+        self._documents = {}
+        self._total_length = 0.0
+        self._sorted_terms = None
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            rows = (
+                Product.objects.using(self.using)
+                .values_list('id', 'name', 'description', 'category_id', 'available')
+                .iterator(chunk_size=2000)
+            )
+            for row in rows:
+                self._add(*row)
+            self._loaded = True
+
+    def _add(self, pk, name, description, category_id, available):
+        frequencies = {}
+        for term in tokenize(name):
+            frequencies[term] = frequencies.get(term, 0.0) + NAME_WEIGHT
+        for term in tokenize(description):
+            frequencies[term] = frequencies.get(term, 0.0) + DESCRIPTION_WEIGHT
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._sorted_terms = None
+            postings[pk] = frequency
+        length = sum(frequencies.values())
+        self._documents[pk] = (tuple(frequencies), length, category_id, available)
+        self._total_length += length
+
+    def _discard(self, pk):
+        document = self._documents.pop(pk, None)
+        if document is None:
+            return
+        terms, length, _, _ = document
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(pk, None)
+            if not postings:
+                del self._postings[term]
+                self._sorted_terms = None
+
+    def index_product(self, product):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._discard(product.pk)
+            self._add(product.pk, product.name, product.description, product.category_id, product.available)
+
+    def remove_product(self, pk):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._discard(pk)
+
+    def rebuild(self):
+        with self._lock:
+            self._reset()
+            self._loaded = False
+        self._ensure_loaded()
+
+    def _terms(self):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        return self._sorted_terms
+
+    def _expand(self, token):
+        """All indexed terms starting with ``token``."""
+        terms = self._terms()
+        start = bisect_left(terms, token)
+        end = bisect_left(terms, _prefix_upper_bound(token), start)
+        return terms[start:end]
+
+    def _correct(self, token):
+        if not typo_budget(token):
+            return None
+        for prefix in correction_prefixes(token):
+            candidates = ((term, len(self._postings[term])) for term in self._expand(prefix))
+            corrected = best_correction(token, candidates)
+            if corrected:
+                return corrected
+        return None
+
+    def _match(self, query):
+        """Return ``{product id: score}`` for documents matching every term."""
+        corrections = {}
+        scores = None
+        count = len(self._documents) or 1
+        average_length = (self._total_length / count) or 1.0
+        for token in tokenize(query):
+            expansions = self._expand(token)
+            if not expansions:
+                corrected = self._correct(token)
+                if corrected:
+                    corrections[token] = corrected
+                    expansions = self._expand(corrected)
+            token_scores = {}
+            for term in expansions:
+                postings = self._postings[term]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for pk, frequency in postings.items():
+                    length = self._documents[pk][1]
+                    score = idf * frequency * 2.2 / (frequency + 1.2 * (0.25 + 0.75 * length / average_length))
+                    token_scores[pk] = token_scores.get(pk, 0.0) + score
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {pk: score + token_scores[pk] for pk, score in scores.items() if pk in token_scores}
+            if not scores:
+                break
+        return scores or {}, corrections
+
+    def filter_queryset(self, queryset, query):
+        if not tokenize(query):
+            return queryset
+        self._ensure_loaded()
+        with self._lock:
+            scores, _ = self._match(query)
+        if not scores:
+            return queryset.none()
+        # The ids are written into the statement as integer literals rather
+        # than bound one parameter each: SQLite builds without FTS5 are old
+        # enough to allow only 999 variables, and a broad term matches more.
+        pk = queryset.model._meta.pk.column
+        ids = ','.join(str(int(pk_value)) for pk_value in scores)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT {pk} FROM {queryset.model._meta.db_table} WHERE {pk} IN ({ids})', [],
+        ))
+
+    def search(self, query, category_ids=None, available=None, limit=20, offset=0):
+        if not tokenize(query):
+            return SearchResult([], 0, [], {})
+        if category_ids is not None:
+            category_ids = set(category_ids)
+        self._ensure_loaded()
+        with self._lock:
+            scores, corrections = self._match(query)
+            counts = {}
+            ranked = []
+            for pk, score in scores.items():
+                _, _, doc_category, doc_available = self._documents[pk]
+                if available is not None and doc_available != available:
+                    continue
+                counts[doc_category] = counts.get(doc_category, 0) + 1
+                if category_ids is None or doc_category in category_ids:
+                    ranked.append((-score, pk))
+        ranked.sort()
+        ids = [pk for _, pk in ranked[offset:offset + limit]]
+        return SearchResult(ids, len(ranked), _facets_from_counts(counts), corrections)
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def install_fts5(connection, create_table=True):
+    """
+    Create the FTS5 table, its vocabulary view and sync triggers if missing.
+
+    With ``create_table=False`` only the triggers of an existing table are
+    restored, which is what runs after every ``migrate``.
+    """
+    if not fts5_supported(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        created = cursor.fetchone() is None
+        if created and not create_table:
+            return False
+        if created:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"name, description, content='products_product', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25({NAME_WEIGHT}, {DESCRIPTION_WEIGHT})')")
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, 'row')")
+
+        # Rebuilding products_product (SQLite's way of altering a table) drops
+        # its triggers, so they are re-created after every migrate as well.
+        triggers = [f'{FTS_TABLE}_{suffix}' for suffix in ('ai', 'ad', 'au')]
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)", triggers)
+        triggers_missing = cursor.fetchone()[0] < len(triggers)
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products_product BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products_product BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+            f"VALUES ('delete', old.id, old.name, old.description); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON products_product BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+            f"VALUES ('delete', old.id, old.name, old.description); "
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+        )
+        if created or triggers_missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def uninstall_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for suffix in ('ai', 'ad', 'au'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_VOCAB_TABLE}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def _fts5_installed(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    return FTS_TABLE in connection.introspection.table_names()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_search_engine(using=None):
+    """
+    Return the search engine for a database alias.
+
+    ``PRODUCT_SEARCH_BACKEND`` may force ``'fts5'`` or ``'memory'``; the
+    default ``'auto'`` uses FTS5 whenever the table is present, and warns
+    when it has to fall back to the per-process in-memory index.
+    """
+    using = using or router.db_for_read(Product)
+    engine = _engines.get(using)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(using)
+            if engine is None:
+                backend = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto')
+                if backend == 'fts5' or (backend == 'auto' and _fts5_installed(using)):
+                    engine = FTS5SearchEngine(using)
+                else:
+                    if backend == 'auto':
+                        logger.warning(
+                            'FTS5 is not installed on database %r; product search uses a per-process '
+                            'in-memory index that does not see writes from other processes.', using,
+                        )
+                    engine = InMemorySearchEngine(using)
+                _engines[using] = engine
+    return engine
+
+
+def index_product(product):
+    """Push a saved product into every engine that keeps its own index."""
+    for engine in list(_engines.values()):
+        engine.index_product(product)
+
+
+def remove_product(pk):
+    for engine in list(_engines.values()):
+        engine.remove_product(pk)
+
+
+def reset_search_engines():
+    with _engines_lock:
+        _engines.clear()
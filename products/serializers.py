@@ -1,23 +1,43 @@
 
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework import serializers
-from .models import Category, Product, Review
+
+from ecommerce.images import ImageVariantsField
+from .models import Category, Product, Reservation, ReservationItem, Review
+from .ratings import STAR_FIELDS
 
 class CategorySerializer(serializers.ModelSerializer):
+    parent = serializers.SlugRelatedField(
+        queryset=Category.objects.all(),
+        slug_field='slug',
+        allow_null=True,
+        required=False,
+    )
+
     class Meta:
         model = Category
         fields = '__all__'
         lookup_field = 'slug'
         extra_kwargs = {'url': {'lookup_field': 'slug'}}
 
+    def validate_parent(self, parent):
+        if self.instance is not None:
+            try:
+                self.instance.check_parent(parent)
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError(exc.messages)
+        return parent
+
 class ProductSerializer(serializers.ModelSerializer):
     category = serializers.SlugRelatedField(
         queryset=Category.objects.all(),
         slug_field='slug'
     )
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'slug', 'description', 'price', 'category', 'image', 'stock', 'available', 'average_rating')
+        fields = ('id', 'name', 'slug', 'description', 'price', 'category', 'image', 'image_variants', 'stock', 'available', 'average_rating')
         lookup_field = 'slug'
         extra_kwargs = {'url': {'lookup_field': 'slug'}}
 
@@ -26,19 +46,52 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         queryset=Category.objects.all(),
         slug_field='slug'
     )
-    reviews = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    image_variants = ImageVariantsField()
+    # The newest PRODUCT_LATEST_REVIEWS review ids; the full list is paginated
+    # under /products/<slug>/reviews/.
+    reviews = serializers.ListField(source='latest_review_ids', child=serializers.IntegerField(), read_only=True)
+    review_summary = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'slug', 'description', 'price', 'category', 'image', 'stock', 'available', 'average_rating', 'reviews')
+        fields = ('id', 'name', 'slug', 'description', 'price', 'category', 'image', 'image_variants', 'stock', 'available', 'average_rating', 'review_summary', 'reviews')
         lookup_field = 'slug'
         extra_kwargs = {'url': {'lookup_field': 'slug'}}
 
+    def get_review_summary(self, product):
+        return {
+            'count': product.rating_count,
+            'histogram': {str(rating): getattr(product, field) for rating, field in STAR_FIELDS.items()},
+        }
+
 class ReviewSerializer(serializers.ModelSerializer):
-    user = serializers.StringRelatedField(read_only=True)
-    product = serializers.StringRelatedField(read_only=True)
+    # Same output as the previous StringRelatedFields (CustomUser.__str__ is
+    # the email, Product.__str__ the name), read from the joined rows.
+    user = serializers.CharField(source='user.email', read_only=True)
+    product = serializers.CharField(source='product.name', read_only=True)
 
     class Meta:
         model = Review
         fields = ('id', 'product', 'user', 'rating', 'comment', 'created_at')
         read_only_fields = ('user', 'product', 'created_at')
+
+class ReservationLineSerializer(serializers.Serializer):
+    product = serializers.SlugField(max_length=255)
+    quantity = serializers.IntegerField(min_value=1, max_value=10000)
+
+class ReservationRequestSerializer(serializers.Serializer):
+    items = ReservationLineSerializer(many=True, allow_empty=False, max_length=100)
+
+class ReservationItemSerializer(serializers.ModelSerializer):
+    product = serializers.CharField(source='product.slug', read_only=True)
+
+    class Meta:
+        model = ReservationItem
+        fields = ('product', 'quantity')
+
+class ReservationSerializer(serializers.ModelSerializer):
+    items = ReservationItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Reservation
+        fields = ('id', 'status', 'expires_at', 'created_at', 'items')
@@ -0,0 +1,108 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import categories, ratings, search
+from .cache import invalidate_model
+from .models import Category, Product, Review
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver(pre_save, sender=Review)
+def remember_counted_rating(sender, instance, raw, using, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._counted = ratings.counted_state(instance, using=using)
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    previous = None if created else instance._counted
+    ratings.review_saved(instance, created, previous, using=using)
+
+
+@receiver(pre_delete, sender=Review)
+def remember_deleted_rating(sender, instance, using, origin=None, **kwargs):
+    if ratings.deleted_with_product(origin):
+        return
+    instance._counted = ratings.counted_state(instance, using=using)
+
+
+@receiver(post_delete, sender=Review)
+def remove_product_rating(sender, instance, using, origin=None, **kwargs):
+    ratings.review_deleted(instance, getattr(instance, '_counted', (None, None)), using=using, origin=origin)
+
+
+@receiver(pre_save, sender=Product)
+def remember_listing(sender, instance, raw, using, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._listed = categories.listed_state(instance, using=using)
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    previous = None if created else instance._listed
+    categories.product_saved(instance, created, previous, using=using)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_deleted_listing(sender, instance, using, **kwargs):
+    instance._listed = categories.listed_state(instance, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def remove_category_counts(sender, instance, using, **kwargs):
+    categories.product_deleted(instance, getattr(instance, '_listed', None), using=using)
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_path(sender, instance, raw, using, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._stored = categories.stored_state(instance, using=using)
+
+
+@receiver(post_save, sender=Category)
+def update_category_path(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    categories.category_saved(instance, created, None if created else instance._stored, using=using)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_deleted_category(sender, instance, using, **kwargs):
+    instance._stored = categories.stored_state(instance, using=using)
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_totals(sender, instance, using, **kwargs):
+    categories.category_deleted(instance, instance._stored, using=using)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_cache(sender, using, **kwargs):
+    invalidate_model(sender, using=using)
+
+
+def restore_search_triggers(sender, using, **kwargs):
+    # SQLite alters tables by rebuilding them, which drops their triggers.
+    search.install_fts5(connections[using], create_table=False)
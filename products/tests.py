@@ -1,3 +1,813 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from ecommerce.testing import QueryCountAssertionsMixin
+from .bulk import import_products, iter_export
+from . import search
+from .cache import get_catalog_cache
+from .categories import rebuild_category_tree
+from .inventory import InsufficientStock, ReservationNotHeld, commit, release, reserve, sweep_expired
+from .models import Category, Product, Reservation, Review
+from .pagination import KeysetCursor, encode_keyset_cursor
+from .ratings import SUMMARY_FIELDS, rebuild_ratings
+from .rows import CategoryRowSerializer, ProductRowSerializer, ReviewRowSerializer
+from .views import ProductViewSet
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class CatalogQueryCountTests(QueryCountAssertionsMixin, APITestCase):
+    """Every catalog read path runs a fixed number of queries."""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product = self.make_product('trail-shoe')
+        self.add_reviews(1)
+
+    def make_product(self, slug):
+        return Product.objects.create(
+            name=f'Trail {slug}', slug=slug, description='Running shoe', price='49.99', category=self.category,
+        )
+
+    def add_products(self, count):
+        for _ in range(count):
+            self.make_product(f'shoe-{Product.objects.count()}')
+
+    def add_categories(self, count):
+        for _ in range(count):
+            index = Category.objects.count()
+            Category.objects.create(name=f'Category {index}', slug=f'category-{index}')
+
+    def add_reviews(self, count):
+        for _ in range(count):
+            user = CustomUser.objects.create_user(email=f'user{CustomUser.objects.count()}@example.com', password='pass')
+            Review.objects.create(product=self.product, user=user, rating=4, comment='Good')
+
+    def test_product_list(self):
+        self.assertQueriesDoNotScale('/api/products/products/', self.add_products)
+
+    def test_product_list_filtered_and_sorted(self):
+        url = '/api/products/products/?category__slug=shoes&available=true&ordering=-price'
+        self.assertQueriesDoNotScale(url, self.add_products)
+
+    def test_product_search(self):
+        self.assertQueriesDoNotScale('/api/products/search/?q=trail', self.add_products)
+
+    def test_product_detail(self):
+        self.assertQueriesDoNotScale('/api/products/products/trail-shoe/', self.add_reviews)
+
+    def test_nested_review_list(self):
+        self.assertQueriesDoNotScale('/api/products/products/trail-shoe/reviews/', self.add_reviews)
+
+    def test_category_list(self):
+        self.assertQueriesDoNotScale('/api/products/categories/', self.add_categories)
+
+    def test_category_tree(self):
+        self.assertQueriesDoNotScale('/api/products/categories/tree/', self.add_categories)
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class ProductFilterTests(APITestCase):
+    """The price and stock range filters on the product list."""
+
+    def setUp(self):
+        for slug, price, stock in (('sock', '5.00', 0), ('cap', '10.00', 3), ('boot', '20.00', 10)):
+            Product.objects.create(name=slug, slug=slug, description=slug, price=price, stock=stock)
+
+    def slugs(self, **params):
+        response = self.client.get('/api/products/products/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row['slug'] for row in response.json()['results']}
+
+    def test_price_range(self):
+        self.assertEqual(self.slugs(min_price='10'), {'cap', 'boot'})
+        self.assertEqual(self.slugs(max_price='10.00'), {'sock', 'cap'})
+        self.assertEqual(self.slugs(min_price='6', max_price='19.99'), {'cap'})
+        self.assertEqual(self.slugs(min_price='21'), set())
+
+    def test_stock_filters(self):
+        self.assertEqual(self.slugs(min_stock='3'), {'cap', 'boot'})
+        self.assertEqual(self.slugs(in_stock='true'), {'cap', 'boot'})
+        self.assertEqual(self.slugs(in_stock='false'), {'sock'})
+        self.assertEqual(self.slugs(in_stock='true', max_price='10'), {'cap'})
+        # Like available, an unrecognised boolean leaves the list unfiltered.
+        self.assertEqual(self.slugs(in_stock='maybe'), {'sock', 'cap', 'boot'})
+
+    def test_invalid_values_are_rejected(self):
+        for params in ({'min_price': 'abc'}, {'max_price': '1e'}, {'min_stock': 'many'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/products/products/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json())
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class SearchTests(APITestCase):
+    """Both search engines rank, correct and facet the same way and follow product writes."""
+    backends = ('fts5', 'memory')
+    queries = ('leather', 'leat', 'leathr', 'boot leather', 'wallet', 'zzzz')
+
+    def setUp(self):
+        search.reset_search_engines()
+        self.addCleanup(search.reset_search_engines)
+        shoes = Category.objects.create(name='Shoes', slug='shoes')
+        accessories = Category.objects.create(name='Accessories', slug='accessories')
+        for slug, name, description, category, available in (
+            ('leather-boot', 'Leather boot', 'Brown hiking boot in leather', shoes, True),
+            ('leather-wallet', 'Leather wallet', 'Slim wallet', accessories, True),
+            ('canvas-sneaker', 'Canvas sneaker', 'Light sneaker with leather trim', shoes, True),
+            ('wool-scarf', 'Wool scarf', 'Warm scarf', accessories, False),
+        ):
+            Product.objects.create(
+                name=name, slug=slug, description=description, price='10.00', category=category, available=available,
+            )
+
+    def search(self, backend, query, **params):
+        with override_settings(PRODUCT_SEARCH_BACKEND=backend):
+            search.reset_search_engines()
+            return self.client.get('/api/products/search/', {'q': query, **params}).json()
+
+    def slugs(self, data):
+        return [item['slug'] for item in data['results']]
+
+    def test_ranking_prefixes_typos_and_facets(self):
+        for backend in self.backends:
+            with self.subTest(backend=backend):
+                data = self.search(backend, 'leather')
+                # Name matches rank above a description-only match.
+                self.assertEqual(set(self.slugs(data)[:2]), {'leather-boot', 'leather-wallet'})
+                self.assertEqual(self.slugs(data)[2], 'canvas-sneaker')
+                self.assertEqual(
+                    {facet['slug']: facet['count'] for facet in data['facets']['category']},
+                    {'shoes': 2, 'accessories': 1},
+                )
+                self.assertEqual(set(self.slugs(self.search(backend, 'leat'))), set(self.slugs(data)))
+
+                corrected = self.search(backend, 'leathr')
+                self.assertEqual(corrected['corrections'], {'leathr': 'leather'})
+                self.assertEqual(self.slugs(corrected), self.slugs(data))
+
+                self.assertEqual(self.slugs(self.search(backend, 'leather', category='shoes'))[0], 'leather-boot')
+                self.assertEqual(self.search(backend, 'leather', category='shoes')['count'], 2)
+                self.assertEqual(self.search(backend, 'scarf', available='true')['count'], 0)
+
+    def test_category_includes_subcategories(self):
+        boots = Category.objects.create(name='Boots', slug='boots', parent=Category.objects.get(slug='shoes'))
+        Product.objects.create(name='Leather chelsea', slug='leather-chelsea', description='Boot', price='10.00', category=boots)
+        for backend in self.backends:
+            with self.subTest(backend=backend):
+                data = self.search(backend, 'leather', category='shoes')
+                self.assertEqual(set(self.slugs(data)), {'leather-boot', 'canvas-sneaker', 'leather-chelsea'})
+                self.assertEqual(data['count'], 3)
+                self.assertEqual(self.slugs(self.search(backend, 'leather', category='boots')), ['leather-chelsea'])
+                self.assertEqual(self.search(backend, 'leather', category='missing')['count'], 0)
+
+    def test_engines_agree(self):
+        fts5, memory = search.FTS5SearchEngine('default'), search.InMemorySearchEngine('default')
+        for query in self.queries:
+            expected, actual = fts5.search(query), memory.search(query)
+            # Scores differ slightly between the BM25 implementations, so close matches may swap.
+            self.assertEqual(set(actual.ids), set(expected.ids), query)
+            self.assertEqual(actual._replace(ids=None), expected._replace(ids=None), query)
+            self.assertEqual(
+                set(fts5.filter_queryset(Product.objects.all(), query).values_list('pk', flat=True)),
+                set(memory.filter_queryset(Product.objects.all(), query).values_list('pk', flat=True)),
+                query,
+            )
+
+    def test_index_follows_product_writes(self):
+        for backend in self.backends:
+            with self.subTest(backend=backend):
+                self.search(backend, 'belt')
+                with override_settings(PRODUCT_SEARCH_BACKEND=backend):
+                    belt = Product.objects.create(name='Braided belt', slug=f'belt-{backend}', description='Belt', price='5.00')
+                    self.assertEqual(self.client.get('/api/products/search/?q=braided').json()['count'], 1)
+                    belt.name = 'Woven belt'
+                    belt.save()
+                    self.assertEqual(self.client.get('/api/products/search/?q=woven').json()['count'], 1)
+                    self.assertEqual(self.client.get('/api/products/search/?q=braided').json()['corrections'], {})
+                    belt.delete()
+                    self.assertEqual(self.client.get('/api/products/search/?q=woven').json()['count'], 0)
+
+    def test_fallback_to_memory_warns(self):
+        search.reset_search_engines()
+        with mock.patch.object(search, '_fts5_installed', return_value=False), self.assertLogs('products.search', 'WARNING'):
+            self.assertIsInstance(search.get_search_engine(), search.InMemorySearchEngine)
+        search.reset_search_engines()
+
+    def test_memory_filter_keeps_every_match(self):
+        Product.objects.bulk_create(
+            Product(name=f'Leather belt {i}', slug=f'leather-belt-{i}', description='Belt', price='10.00')
+            for i in range(1200)
+        )
+        engine = search.InMemorySearchEngine('default')
+        self.assertEqual(engine.filter_queryset(Product.objects.all(), 'leather').count(), 1203)
+        self.assertFalse(engine.filter_queryset(Product.objects.all(), 'velvet').exists())
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class ConditionalGetTests(APITestCase):
+    """Catalog reads carry validators and answer matching revalidations with 304."""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Boot', slug='boot', description='Boot', price='10.00')
+
+    def test_detail_and_list_validators(self):
+        for url in ('/api/products/products/boot/', '/api/products/products/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag, last_modified = response['ETag'], response['Last-Modified']
+
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+                self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+                not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual((not_modified['ETag'], not_modified.content), (etag, b''))
+
+    def test_write_changes_etag(self):
+        for url in ('/api/products/products/boot/', '/api/products/products/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.product.price = '12.00'
+                self.product.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_category_rename_changes_product_etags(self):
+        self.product.category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product.save()
+        for url in ('/api/products/products/boot/', '/api/products/products/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # Written by another worker: this one's cache generations do not move.
+                Category.objects.update(slug=f'shoes-{url.count("/")}', updated_at=timezone.now())
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_unknown_object_is_not_found(self):
+        self.assertEqual(self.client.get('/api/products/products/missing/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': True})
+class CatalogCacheTests(APITestCase):
+    """Writes to any model embedded in a cached response make it miss."""
+
+    def setUp(self):
+        caches['default'].clear()
+        get_catalog_cache().local.clear()
+        self.category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product = Product.objects.create(
+            name='Boot', slug='boot', description='Boot', price='10.00', category=self.category,
+        )
+
+    def get(self, url):
+        response = self.client.get(url)
+        return response['X-Cache'], response.json()
+
+    def assertWriteRefreshes(self, url, write, check):
+        self.get(url)
+        self.assertEqual(self.get(url)[0], 'HIT')
+        write()
+        state, data = self.get(url)
+        self.assertEqual(state, 'MISS')
+        check(data)
+
+    def test_product_write(self):
+        def write():
+            self.product.name = 'Suede boot'
+            self.product.save()
+        self.assertWriteRefreshes(
+            '/api/products/products/', write, lambda data: self.assertEqual(data['results'][0]['name'], 'Suede boot'),
+        )
+
+    def test_category_write(self):
+        def write():
+            self.category.slug = 'footwear'
+            self.category.save()
+        self.assertWriteRefreshes(
+            '/api/products/products/boot/', write, lambda data: self.assertEqual(data['category'], 'footwear'),
+        )
+
+    def test_review_write(self):
+        user = CustomUser.objects.create_user(email='reviewer@example.com', password='pass')
+        self.assertWriteRefreshes(
+            '/api/products/products/boot/',
+            lambda: Review.objects.create(product=self.product, user=user, rating=5),
+            lambda data: self.assertEqual(data['review_summary']['count'], 1),
+        )
+
+    def test_write_in_transaction_bumps_again_on_commit(self):
+        cache = get_catalog_cache()
+        self.get('/api/products/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.product.name = 'Suede boot'
+                self.product.save()
+                # What a concurrent reader could cache before the commit.
+                during = cache.generations(['products.product'])
+        self.assertNotEqual(cache.generations(['products.product']), during)
+        state, data = self.get('/api/products/products/')
+        self.assertEqual((state, data['results'][0]['name']), ('MISS', 'Suede boot'))
+
+
+class RowSerializerTests(APITestCase):
+    """values()-based list serializers render exactly like the model serializers."""
+
+    def setUp(self):
+        shoes = Category.objects.create(name='Shoes', slug='shoes', description='Line\u2028break')
+        Category.objects.create(name='Hats', slug='hats')
+        Product.objects.create(name='Boot', slug='boot', description='Caf\u00e9 "leather"', price='80.5', category=shoes,
+                               image='products/boot.jpg')
+        Product.objects.create(name='Loose', slug='loose', description='', price='0', category=None)
+        user = CustomUser.objects.create_user(email='reviewer@example.com', password='pass')
+        Review.objects.create(product=Product.objects.get(slug='boot'), user=user, rating=5, comment='Great')
+
+    def assertRendersLike(self, row_serializer_class, queryset):
+        context = {'request': Request(APIRequestFactory().get('/'))}
+        rows = row_serializer_class(context=context)
+        expected = rows.serializer_class(queryset, many=True, context=context).data
+        actual = rows.to_representation(queryset.values(*rows.columns))
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_products(self):
+        self.assertRendersLike(ProductRowSerializer, Product.objects.order_by('pk'))
+
+    def test_categories(self):
+        self.assertRendersLike(CategoryRowSerializer, Category.objects.order_by('pk'))
+
+    def test_reviews(self):
+        self.assertRendersLike(ReviewRowSerializer, Review.objects.order_by('pk'))
+
+    def test_list_pages_through_every_sort_key(self):
+        for ordering in ('price', '-average_rating', 'created_at'):
+            response = self.client.get(f'/api/products/products/?ordering={ordering}&page_size=1')
+            slugs = [response.data['results'][0]['slug']]
+            response = self.client.get(response.data['next'])
+            slugs.append(response.data['results'][0]['slug'])
+            self.assertEqual(sorted(slugs), ['boot', 'loose'], ordering)
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class KeysetPaginationTests(APITestCase):
+    """Cursor links walk every sort in both directions; bad cursors are a 404."""
+
+    def setUp(self):
+        # Repeated prices and ratings, so the pk has to break ties.
+        for i in range(7):
+            Product.objects.create(
+                name=f'Shoe {i}', slug=f'shoe-{i}', description='Shoe', price=f'{10 + i % 3}.00',
+                average_rating=f'{i % 2 + 3}.50',
+            )
+
+    def walk(self, url, link):
+        page = self.client.get(url).json()
+        pages = [[item['slug'] for item in page['results']]]
+        while page[link]:
+            page = self.client.get(page[link]).json()
+            pages.append([item['slug'] for item in page['results']])
+        return pages
+
+    def test_next_and_previous_round_trip(self):
+        for ordering in ProductViewSet.ordering_fields:
+            for direction in ('', '-'):
+                field = direction + ordering
+                expected = list(Product.objects.order_by(field, direction + 'pk').values_list('slug', flat=True))
+                forwards = self.walk(f'/api/products/products/?ordering={field}&page_size=3', 'next')
+                self.assertEqual([slug for page in forwards for slug in page], expected, field)
+
+                last = self.client.get(f'/api/products/products/?ordering={field}&page_size=3').json()
+                while last['next']:
+                    last = self.client.get(last['next']).json()
+                backwards = self.walk(last['previous'], 'previous')
+                self.assertEqual(backwards, forwards[-2::-1], field)
+
+    def test_malformed_cursors_are_not_found(self):
+        created_at = Product.objects.values_list('created_at', flat=True).first().isoformat()
+        cursors = [
+            'bogus',
+            encode_keyset_cursor(KeysetCursor(value='abc', pk=1, reverse=False)),
+            encode_keyset_cursor(KeysetCursor(value=[1], pk=1, reverse=False)),
+            encode_keyset_cursor(KeysetCursor(value={'a': 1}, pk=1, reverse=False)),
+            encode_keyset_cursor(KeysetCursor(value=None, pk=1, reverse=False)),
+            encode_keyset_cursor(KeysetCursor(value=created_at, pk='x', reverse=False)),
+        ]
+        for cursor in cursors:
+            for prefix in ('/api/products/', '/api/async/'):
+                url = f'{prefix}products/?cursor={cursor}'
+                get = self.client.get if prefix == '/api/products/' else async_to_sync(self.async_client.get)
+                self.assertEqual(get(url).status_code, 404, url)
+                self.assertEqual(get(f'{url}&ordering=price').status_code, 404, url)
+
+
+class AsyncCatalogViewTests(APITestCase):
+    """The async read endpoints return exactly what the DRF viewsets return."""
+
+    def setUp(self):
+        shoes = Category.objects.create(name='Shoes', slug='shoes', description='Footwear')
+        Category.objects.create(name='Hats', slug='hats')
+        for i in range(5):
+            Product.objects.create(
+                name=f'Trail {i}', slug=f'trail-{i}', description='Running shoe', price=f'{40 + i % 3}.00', category=shoes,
+            )
+        user = CustomUser.objects.create_user(email='reviewer@example.com', password='pass')
+        Review.objects.create(product=Product.objects.get(slug='trail-1'), user=user, rating=4, comment='Good')
+
+    def assertSameResponse(self, path):
+        expected = self.client.get(f'/api/products/{path}')
+        actual = async_to_sync(self.async_client.get)(f'/api/async/{path}')
+        self.assertEqual(actual.status_code, expected.status_code, path)
+        self.assertEqual(actual['Content-Type'], expected['Content-Type'], path)
+        self.assertEqual(actual.content, expected.content.replace(b'/api/products/', b'/api/async/'), path)
+
+    def test_matches_sync_endpoints(self):
+        for path in [
+            'products/', 'products/?ordering=price&page_size=2', 'products/?search=trail&min_price=41',
+            'products/?min_price=abc', 'products/?cursor=bogus', 'products/trail-1/', 'products/missing/',
+            'products/trail-1/reviews/', 'categories/', 'categories/?search=foot',
+            'products/?category__slug=shoes', 'products/?category__slug=hats', 'products/?category__slug=missing',
+        ]:
+            self.assertSameResponse(path)
+
+    def test_pages_follow_cursor_links(self):
+        page = async_to_sync(self.async_client.get)('/api/async/products/?page_size=2').json()
+        slugs = [item['slug'] for item in page['results']]
+        while page['next']:
+            page = async_to_sync(self.async_client.get)(page['next']).json()
+            slugs += [item['slug'] for item in page['results']]
+        self.assertEqual(slugs, [f'trail-{i}' for i in reversed(range(5))])
+
+    def test_read_only(self):
+        self.assertEqual(async_to_sync(self.async_client.post)('/api/async/products/').status_code, 405)
+
+
+class BulkImportExportTests(APITestCase):
+    """Imports upsert on slug, report bad rows and round-trip through export."""
+
+    csv = (
+        'slug,name,description,price,category,stock,available\n'
+        'boot,Boot,Leather boot,80.00,shoes,5,true\n'
+        'cap,,Wool cap,abc,hats,1,no\n'
+        'sandal,Sandal,Summer sandal,25.50,,0,false\n'
+    )
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Shoes', slug='shoes')
+
+    def test_import_upserts_and_reports_row_errors(self):
+        result = import_products(io.StringIO(self.csv), batch_size=2)
+        self.assertEqual((result.created, result.updated, result.error_count), (2, 0, 1))
+        self.assertEqual(result.errors[0]['line'], 3)
+        self.assertEqual(set(result.errors[0]['errors']), {'name', 'price', 'category'})
+
+        updated = '{"slug": "boot", "name": "Boot", "description": "Suede boot", "price": "90", "category": "shoes"}\n'
+        result = import_products(io.StringIO(updated), format='ndjson')
+        self.assertEqual((result.created, result.updated), (0, 1))
+        boot = Product.objects.get(slug='boot')
+        self.assertEqual((boot.description, str(boot.price), boot.category_id), ('Suede boot', '90.00', self.category.pk))
+
+    def test_export_round_trips(self):
+        import_products(io.StringIO(self.csv))
+        exported = ''.join(iter_export(Product.objects.all()))
+        Product.objects.all().delete()
+        result = import_products(io.StringIO(exported))
+        self.assertEqual((result.created, result.error_count), (2, 0))
+        self.assertEqual(''.join(iter_export(Product.objects.all())), exported)
+
+    def test_endpoints_are_admin_only(self):
+        upload = SimpleUploadedFile('products.csv', self.csv.encode())
+        self.assertEqual(self.client.post('/api/products/products/import/', {'file': upload}).status_code, 401)
+
+        CustomUser.objects.create_user(email='admin@example.com', password='pass', is_active=True, role='admin')
+        self.client.post('/api/auth/login/', {'email': 'admin@example.com', 'password': 'pass'}, format='json')
+        upload.seek(0)
+        response = self.client.post('/api/products/products/import/', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+
+        response = self.client.get('/api/products/products/export/?file_format=ndjson&available=true')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([line.split('"')[3] for line in lines], ['boot'])
+
+
+class StockReservationTests(APITestCase):
+    """Baskets are reserved all-or-nothing and expired holds give stock back."""
+
+    def setUp(self):
+        for slug, stock in (('boot', 5), ('cap', 1)):
+            Product.objects.create(name=slug, slug=slug, description='x', price='1.00', stock=stock)
+
+    def stock(self):
+        return dict(Product.objects.values_list('slug', 'stock'))
+
+    def test_reserve_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve([('boot', 2), ('cap', 2), ('missing', 1)])
+        self.assertEqual(raised.exception.shortages, {'cap': 1, 'missing': None})
+        self.assertEqual(self.stock(), {'boot': 5, 'cap': 1})
+
+        reservation = reserve([('boot', 2), ('cap', 1), ('boot', 1)])
+        self.assertEqual(self.stock(), {'boot': 2, 'cap': 0})
+        self.assertEqual(dict(reservation.items.values_list('product__slug', 'quantity')), {'boot': 3, 'cap': 1})
+
+    def test_release_commit_and_expiry(self):
+        released = reserve([('boot', 2)])
+        release(released.pk)
+        self.assertEqual(self.stock()['boot'], 5)
+        with self.assertRaises(ReservationNotHeld):
+            commit(released.pk)
+
+        committed = reserve([('boot', 1)])
+        commit(committed.pk)
+        expired = reserve([('boot', 3), ('cap', 1)], ttl=60)
+        self.assertEqual(sweep_expired(now=timezone.now() + timedelta(seconds=61)), 1)
+        self.assertEqual(self.stock(), {'boot': 4, 'cap': 1})
+        self.assertEqual(Reservation.objects.get(pk=expired.pk).status, Reservation.STATUS_EXPIRED)
+        self.assertEqual(Reservation.objects.get(pk=committed.pk).status, Reservation.STATUS_COMMITTED)
+
+    def test_reservation_endpoints(self):
+        CustomUser.objects.create_user(email='buyer@example.com', password='pass', is_active=True)
+        self.client.post('/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass'}, format='json')
+
+        response = self.client.post('/api/products/reservations/', {'items': [{'product': 'cap', 'quantity': 2}]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['shortages'], {'cap': 1})
+
+        response = self.client.post('/api/products/reservations/', {'items': [{'product': 'cap', 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['items'], [{'product': 'cap', 'quantity': 1}])
+        url = f"/api/products/reservations/{response.data['id']}/"
+        self.assertEqual(self.client.post(url + 'commit/').data['status'], 'committed')
+        self.assertEqual(self.client.post(url + 'release/').status_code, 409)
+        self.assertEqual(self.stock()['cap'], 0)
+
+
+class RatingCounterTests(APITestCase):
+    """Review writes keep rating_sum, rating_count and average_rating equal to an aggregate."""
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Boot', slug='boot', description='Boot', price='10.00')
+
+    def review(self, email, rating):
+        user = CustomUser.objects.create_user(email=email, password='pass')
+        return Review.objects.create(product=self.product, user=user, rating=rating)
+
+    def totals(self):
+        return Product.objects.values_list('rating_sum', 'rating_count', 'average_rating').get(pk=self.product.pk)
+
+    def test_create_change_and_delete(self):
+        five = self.review('a@example.com', 5)
+        self.assertEqual(self.totals(), (5, 1, Decimal('5.00')))
+        four = self.review('b@example.com', 4)
+        self.review('c@example.com', 4)
+        self.assertEqual(self.totals(), (13, 3, Decimal('4.33')))
+
+        four.rating = 1
+        four.save()
+        self.assertEqual(self.totals(), (10, 3, Decimal('3.33')))
+        four.save()
+        self.assertEqual(self.totals(), (10, 3, Decimal('3.33')))
+
+        five.delete()
+        self.assertEqual(self.totals(), (5, 2, Decimal('2.50')))
+        Review.objects.filter(product=self.product).delete()
+        self.assertEqual(self.totals(), (0, 0, Decimal('0.00')))
+
+    def test_rebuild_ratings_restores_drifted_totals(self):
+        self.review('a@example.com', 5)
+        self.review('b@example.com', 2)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=40, rating_count=9, average_rating=1)
+        self.assertEqual(rebuild_ratings(), 1)
+        self.assertEqual(self.totals(), (7, 2, Decimal('3.50')))
+
+        Review.objects.all().delete()
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=3, rating_count=1, average_rating=3)
+        self.assertEqual(rebuild_ratings(), 0)
+        self.assertEqual(self.totals(), (0, 0, Decimal('0.00')))
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False}, PRODUCT_LATEST_REVIEWS=2)
+class ReviewSummaryTests(QueryCountAssertionsMixin, APITestCase):
+    """Review writes keep each product's histogram and newest review ids current."""
+
+    def setUp(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.product, self.other = (
+            Product.objects.create(name=slug, slug=slug, description='Shoe', price='10.00', category=category)
+            for slug in ('trail-shoe', 'road-shoe')
+        )
+
+    def review(self, rating, product=None):
+        user = CustomUser.objects.create_user(email=f'user{CustomUser.objects.count()}@example.com', password='pass')
+        return Review.objects.create(product=product or self.product, user=user, rating=rating)
+
+    def summary(self, product=None):
+        return Product.objects.values(*SUMMARY_FIELDS).get(pk=(product or self.product).pk)
+
+    def test_summary_follows_review_writes(self):
+        first, second, third = self.review(5), self.review(4), self.review(5)
+        summary = self.summary()
+        self.assertEqual((summary['rating_count'], summary['rating_5_count'], summary['rating_4_count']), (3, 2, 1))
+        self.assertEqual(summary['latest_review_ids'], [third.pk, second.pk])
+
+        second.rating = 1
+        second.save()
+        third.delete()
+        summary = self.summary()
+        self.assertEqual((summary['rating_5_count'], summary['rating_4_count'], summary['rating_1_count']), (1, 0, 1))
+        self.assertEqual(summary['latest_review_ids'], [second.pk, first.pk])
+
+        second.product = self.other
+        second.save()
+        self.assertEqual(self.summary()['latest_review_ids'], [first.pk])
+        self.assertEqual(self.summary(self.other)['latest_review_ids'], [second.pk])
+        self.assertEqual(self.summary(self.other)['rating_1_count'], 1)
+
+        incremental = [self.summary(), self.summary(self.other)]
+        rebuild_ratings()
+        self.assertEqual([self.summary(), self.summary(self.other)], incremental)
+
+    def test_stale_instances_apply_the_committed_difference(self):
+        # Two requests that loaded the same review before either wrote it.
+        review = self.review(5)
+        first, second = Review.objects.get(pk=review.pk), Review.objects.get(pk=review.pk)
+        first.rating = 3
+        first.save()
+        second.rating = 1
+        second.save()
+        summary = self.summary()
+        self.assertEqual((summary['rating_sum'], summary['rating_count']), (1, 1))
+        self.assertEqual((summary['rating_5_count'], summary['rating_3_count'], summary['rating_1_count']), (0, 0, 1))
+
+        first.delete()
+        second.delete()
+        summary = self.summary()
+        self.assertEqual((summary['rating_sum'], summary['rating_count'], summary['rating_1_count']), (0, 0, 0))
+
+    def test_cascaded_deletes(self):
+        reviews = [self.review(rating) for rating in (3, 4, 5)]
+        reviews[0].user.delete()
+        self.assertEqual(self.summary()['latest_review_ids'], [reviews[2].pk, reviews[1].pk])
+        self.assertEqual(self.summary()['rating_count'], 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.product.delete()
+        # Only the product's own listing is read; its reviews leave the summary alone.
+        summary = [q['sql'] for q in queries if 'latest_review_ids' in q['sql'] or q['sql'].startswith('UPDATE "products_product"')]
+        self.assertFalse(summary)
+
+    def test_detail_embeds_summary_in_one_query(self):
+        reviews = [self.review(rating) for rating in (3, 4, 4)]
+        # The conditional GET validators (the product, then the categories),
+        # then the product row; reviews are not read.
+        queries = [q['sql'] for q in self.count_queries('/api/products/products/trail-shoe/')]
+        self.assertEqual(len(queries), 3, queries)
+        self.assertFalse([sql for sql in queries if 'products_review' in sql])
+        data = self.client.get('/api/products/products/trail-shoe/').json()
+        self.assertEqual(data['review_summary'], {'count': 3, 'histogram': {'1': 0, '2': 0, '3': 1, '4': 2, '5': 0}})
+        self.assertEqual(data['reviews'], [reviews[2].pk, reviews[1].pk])
+
+
+@override_settings(CATALOG_CACHE={'ENABLED': False})
+class CategoryTreeTests(QueryCountAssertionsMixin, APITestCase):
+    """Category paths and subtree counts follow category and product writes."""
+
+    def setUp(self):
+        self.clothing = Category.objects.create(name='Clothing', slug='clothing')
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes', parent=self.clothing)
+        self.boots = Category.objects.create(name='Boots', slug='boots', parent=self.shoes)
+        self.garden = Category.objects.create(name='Garden', slug='garden')
+
+    def product(self, slug, category, available=True):
+        return Product.objects.create(
+            name=slug, slug=slug, description='Product', price='10.00', category=category, available=available,
+        )
+
+    def counts(self):
+        return {slug: (p, a) for slug, p, a in Category.objects.values_list('slug', 'product_count', 'available_count')}
+
+    def test_counts_follow_product_writes(self):
+        boot = self.product('hiking-boot', self.boots)
+        self.product('sandal', self.shoes, available=False)
+        self.assertEqual(self.counts(), {
+            'clothing': (2, 1), 'shoes': (2, 1), 'boots': (1, 1), 'garden': (0, 0),
+        })
+
+        boot.available = False
+        boot.category = self.garden
+        boot.save()
+        self.assertEqual(self.counts(), {
+            'clothing': (1, 0), 'shoes': (1, 0), 'boots': (0, 0), 'garden': (1, 0),
+        })
+
+        Product.objects.get(slug='sandal').delete()
+        incremental = self.counts()
+        self.assertEqual(incremental['clothing'], (0, 0))
+        rebuild_category_tree()
+        self.assertEqual(self.counts(), incremental)
+
+    def test_stale_instances_apply_the_committed_difference(self):
+        # Two requests that loaded the same product before either wrote it.
+        boot = self.product('hiking-boot', self.boots)
+        first, second = Product.objects.get(pk=boot.pk), Product.objects.get(pk=boot.pk)
+        first.category = self.garden
+        first.save()
+        second.available = False
+        second.save()
+        self.assertEqual(self.counts(), {
+            'clothing': (1, 0), 'shoes': (1, 0), 'boots': (1, 0), 'garden': (0, 0),
+        })
+        first.delete()
+        second.delete()
+        self.assertEqual(set(self.counts().values()), {(0, 0)})
+
+    def test_import_moves_counts(self):
+        import_products(io.StringIO('slug,name,description,price,category,available\nboot,Boot,Boot,80,boots,true\n'))
+        import_products(io.StringIO('slug,name,description,price,category,available\nboot,Boot,Boot,80,garden,false\n'))
+        self.assertEqual(self.counts(), {
+            'clothing': (0, 0), 'shoes': (0, 0), 'boots': (0, 0), 'garden': (1, 0),
+        })
+
+    def test_moving_a_category_carries_its_subtree(self):
+        self.product('hiking-boot', self.boots)
+        self.shoes.parent = self.garden
+        self.shoes.save()
+        self.boots.refresh_from_db()
+        self.assertEqual(self.boots.path, self.garden.path + self.shoes.path[-10:] + self.boots.path[-10:])
+        self.assertEqual(self.counts()['clothing'], (0, 0))
+        self.assertEqual(self.counts()['garden'], (1, 1))
+
+        self.garden.parent = self.boots
+        with self.assertRaises(ValueError):
+            self.garden.save()
+
+    def test_deleting_a_category_updates_its_ancestors(self):
+        self.product('hiking-boot', self.boots)
+        self.shoes.delete()
+        self.assertEqual(self.counts(), {'clothing': (0, 0), 'garden': (0, 0)})
+
+    def test_category_filter_includes_subcategories(self):
+        self.product('hiking-boot', self.boots)
+        self.product('sandal', self.shoes)
+        self.product('rake', self.garden)
+        url = '/api/products/products/?category__slug=clothing'
+        slugs = {row['slug'] for row in self.client.get(url).json()['results']}
+        self.assertEqual(slugs, {'hiking-boot', 'sandal'})
+        self.assertEqual(self.client.get('/api/products/products/?category__slug=missing').json()['results'], [])
+        subtree = [q['sql'] for q in self.count_queries(url) if '"path" >=' in q['sql']]
+        self.assertTrue(subtree and all('"path" <' in sql for sql in subtree), subtree)
+
+    def test_tree_endpoint_nests_categories_with_counts(self):
+        self.product('hiking-boot', self.boots)
+        self.product('rake', self.garden, available=False)
+        response = self.client.get('/api/products/categories/tree/')
+        tree = response.json()
+        self.assertEqual([node['slug'] for node in tree], ['clothing', 'garden'])
+        self.assertEqual(tree[0]['children'][0]['slug'], 'shoes')
+        self.assertEqual(tree[0]['children'][0]['children'][0]['product_count'], 1)
+        self.assertEqual((tree[1]['product_count'], tree[1]['available_count']), (1, 0))
+        revalidated = self.client.get('/api/products/categories/tree/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_count_changes_change_category_etags(self):
+        for url in ('/api/products/categories/', '/api/products/categories/tree/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # Written by another worker: this one's cache generations do not move.
+                with mock.patch('products.categories.invalidate_model'), mock.patch('products.signals.invalidate_model'):
+                    self.product(f'boot-{len(url)}', self.boots)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_parent_cannot_be_a_descendant(self):
+        admin = CustomUser.objects.create_user(email='admin@example.com', password='pass', role='admin')
+        self.client.force_authenticate(admin)
+        response = self.client.patch('/api/products/categories/clothing/', {'parent': 'boots'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.json())
+
+        # The admin and other forms go through Category.clean, the same rule.
+        self.clothing.parent = self.boots
+        with self.assertRaises(ValidationError) as raised:
+            self.clothing.full_clean()
+        self.assertEqual(raised.exception.message_dict['parent'], response.json()['parent'])
@@ -1,20 +1,45 @@
 from django.shortcuts import render
 
 # Create your views here.
-from rest_framework import viewsets, filters, status, serializers
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from rest_framework import generics, mixins, permissions, viewsets, filters, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Product, Category, Review
-from .serializers import ProductSerializer, ProductDetailSerializer, CategorySerializer, ReviewSerializer
+from .bulk import FORMATS, guess_format, import_products, iter_export, text_stream
+from .cache import CachedResponseMixin
+from .categories import category_tree, slug_subtree_q
+from .conditional import ConditionalGetMixin
+from .filters import FullTextSearchFilter, ProductFilter
+from .inventory import InsufficientStock, ReservationNotHeld, commit, release, reserve
+from .models import Product, Category, Reservation, ReservationItem, Review
+from .ratings import STAR_FIELDS
+from .rows import CategoryRowSerializer, ProductRowSerializer, ReviewRowSerializer, RowListMixin
+from .search import get_search_engine
+from .serializers import (
+    ProductSerializer, ProductDetailSerializer, CategorySerializer, ReviewSerializer,
+    ReservationRequestSerializer, ReservationSerializer,
+)
 from accounts.permissions import GuestPermission, IsAdminOrSuperAdmin, IsCustomer, IsOwner
 
-class CategoryViewSet(viewsets.ModelViewSet):
+# Columns read by ProductSerializer (plus created_at for the default sort key)
+# and by ReviewSerializer; used with only() on the read paths.
+PRODUCT_FIELDS = ('id', 'name', 'slug', 'description', 'price', 'category', 'image', 'image_variants', 'stock', 'available', 'average_rating', 'created_at')
+REVIEW_FIELDS = ('id', 'product', 'user', 'rating', 'comment', 'created_at')
+# The review summary ProductDetailSerializer adds.
+PRODUCT_DETAIL_FIELDS = (*PRODUCT_FIELDS, 'rating_count', *STAR_FIELDS.values(), 'latest_review_ids')
+
+class CategoryViewSet(ConditionalGetMixin, CachedResponseMixin, RowListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    row_serializer_class = CategoryRowSerializer
     lookup_field = 'slug'
     filter_backends = [filters.SearchFilter]
     search_fields = ['name', 'description']
+    ordering = ('name',)
+    # Product writes move the counts, which bumps products.Category too.
+    cache_models = ('products.Category',)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -23,32 +48,85 @@ class CategoryViewSet(viewsets.ModelViewSet):
             self.permission_classes = [GuestPermission]
         return super().get_permissions()
 
-class ProductViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """The whole category tree with subtree product counts, for navigation menus."""
+        def build_tree(request):
+            return Response(category_tree(Category.objects.all()))
+
+        source = lambda: self.get_list_validator_source(request)
+        return self.conditional(lambda request: self.cached(build_tree, request), source, request)
+
+class ProductViewSet(ConditionalGetMixin, CachedResponseMixin, RowListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
+    row_serializer_class = ProductRowSerializer
     lookup_field = 'slug'
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category__slug', 'available']
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = ProductFilter
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'average_rating']
+    ordering = ('-created_at',)
+    # Reviews feed average_rating and the review summary on the detail view.
+    cache_models = ('products.Product', 'products.Category', 'products.Review')
+    # Reviews already touch the product's updated_at; the category slug does not.
+    validator_models = ('products.Category',)
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
+        if self.action == 'add_review':
+            return ReviewSerializer
         return ProductSerializer
 
+    def get_queryset(self):
+        # Load exactly what each action's serializer reads, in a fixed
+        # number of queries regardless of how many rows are returned.
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.select_related('category').only(*PRODUCT_FIELDS, 'category__slug')
+        elif self.action == 'retrieve':
+            queryset = queryset.select_related('category').only(*PRODUCT_DETAIL_FIELDS, 'category__slug')
+        elif self.action == 'add_review':
+            queryset = queryset.only('id', 'slug', 'name')
+        return queryset
+
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'bulk_import', 'bulk_export']:
             self.permission_classes = [IsAdminOrSuperAdmin]
         else:
             self.permission_classes = [GuestPermission]
         return super().get_permissions()
 
-    @action(detail=True, methods=['get'], serializer_class=ReviewSerializer, permission_classes=[GuestPermission])
-    def reviews(self, request, slug=None):
-        product = self.get_object()
-        reviews = product.reviews.all()
-        serializer = self.get_serializer(reviews, many=True)
-        return Response(serializer.data)
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        # `format` is taken by DRF's renderer negotiation, hence `file_format`.
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"file": "Upload a CSV or NDJSON file."}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.query_params.get('file_format') or guess_format(upload.name)
+        if file_format not in FORMATS:
+            return Response({"file_format": f"Must be one of {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            batch_size = min(max(int(request.query_params.get('batch_size', 1000)), 1), 5000)
+        except ValueError:
+            return Response({"batch_size": "Must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        with text_stream(upload.file) as stream:
+            result = import_products(stream, format=file_format, batch_size=batch_size)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def bulk_export(self, request):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in FORMATS:
+            return Response({"file_format": f"Must be one of {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        # The list filters apply, so a subset of the catalog can be exported.
+        queryset = self.filter_queryset(self.get_queryset())
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(iter_export(queryset, format=file_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
 
     @action(detail=True, methods=['post'], serializer_class=ReviewSerializer, permission_classes=[IsCustomer])
     def add_review(self, request, slug=None):
@@ -58,14 +136,51 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer.save(user=request.user, product=product)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductSearchView(generics.GenericAPIView):
+    """Ranked product search with prefix matching, typo correction and category facets."""
     serializer_class = ProductSerializer
-    lookup_field = "slug"   # tells router to use slug instead of pk
+    permission_classes = [GuestPermission]
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"q": "This query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-class ReviewViewSet(viewsets.ModelViewSet):
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response({"error": "limit and offset must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+
+        category_ids = None
+        category_slug = request.query_params.get('category')
+        if category_slug:
+            # The category and its subcategories, as for category__slug on the list.
+            category_ids = list(Category.objects.filter(slug_subtree_q(category_slug)).values_list('id', flat=True))
+            if not category_ids:
+                return Response({"count": 0, "results": [], "facets": {"category": []}, "corrections": {}})
+
+        available = request.query_params.get('available')
+        if available is not None:
+            available = available.lower() in ('1', 'true', 'yes')
+
+        result = get_search_engine().search(query, category_ids=category_ids, available=available, limit=max(limit, 1), offset=offset)
+        products = Product.objects.select_related('category').only(*PRODUCT_FIELDS, 'category__slug').in_bulk(result.ids)
+        ranked = [products[pk] for pk in result.ids if pk in products]
+        serializer = self.get_serializer(ranked, many=True)
+        return Response({
+            "count": result.total,
+            "results": serializer.data,
+            "facets": {"category": result.facets},
+            "corrections": result.corrections,
+        })
+
+class ReviewViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    row_serializer_class = ReviewRowSerializer
 
     def get_permissions(self):
         if self.action in ['create']:
@@ -92,9 +207,55 @@ class ReviewViewSet(viewsets.ModelViewSet):
             serializer.save(user=self.request.user)
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('user', 'product').only(
+            *REVIEW_FIELDS, 'user__email', 'product__name',
+        )
         # Filter by product if using nested routing
         product_slug = self.kwargs.get('product_slug')
         if product_slug:
             queryset = queryset.filter(product__slug=product_slug)
         return queryset
+
+class ReservationViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Hold stock for a basket, then commit it at checkout or release it."""
+    serializer_class = ReservationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    ordering = ('-created_at',)
+
+    def get_queryset(self):
+        queryset = Reservation.objects.prefetch_related(
+            Prefetch('items', queryset=ReservationItem.objects.select_related('product').only(
+                'id', 'reservation_id', 'quantity', 'product__slug',
+            ))
+        )
+        if self.request.user.role not in ('admin', 'superadmin'):
+            queryset = queryset.filter(user_id=self.request.user.pk)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        serializer = ReservationRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = [(line['product'], line['quantity']) for line in serializer.validated_data['items']]
+        try:
+            reservation = reserve(items, user=request.user)
+        except InsufficientStock as e:
+            return Response({"error": "Insufficient stock.", "shortages": e.shortages}, status=status.HTTP_409_CONFLICT)
+        reservation = self.get_queryset().get(pk=reservation.pk)
+        return Response(self.get_serializer(reservation).data, status=status.HTTP_201_CREATED)
+
+    def transition(self, change):
+        reservation = self.get_object()
+        try:
+            change(reservation.pk)
+        except ReservationNotHeld as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        reservation.refresh_from_db(fields=['status', 'updated_at'])
+        return Response(self.get_serializer(reservation).data)
+
+    @action(detail=True, methods=['post'], url_path='commit')
+    def commit_reservation(self, request, pk=None):
+        return self.transition(commit)
+
+    @action(detail=True, methods=['post'], url_path='release')
+    def release_reservation(self, request, pk=None):
+        return self.transition(release)